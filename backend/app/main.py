@@ -1,25 +1,83 @@
 """
 FastAPI backend para MultiPark Dashboard
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+import hashlib
+import io
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import urlencode
+
+from fastapi import (
+    Depends,
+    FastAPI,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from sqlmodel import Session, select
-import pandas as pd
-from datetime import datetime, timedelta
-import os
-from typing import List, Optional
 
-from .models import Booking, FinancialSplit, BookingCreate, BookingUpdate
-from .database import get_session, create_db_and_tables
+from .database import (
+    async_engine,
+    create_db_and_tables,
+    engine,
+    get_read_session,
+    get_session,
+    pool_status,
+    read_engine,
+    read_session_dependency,
+    read_target,
+    run_with_session,
+    stick_to_primary,
+)
+from .models import (
+    ApprovalRequest,
+    Booking,
+    BookingFilters,
+    BulkApprovalResponse,
+    DashboardStats,
+    ExcelUpload,
+    ExportFormat,
+    FilterApprovalRequest,
+    FinancialReport,
+    ListFormat,
+    ReportGroup,
+    SplitRule,
+    SplitRuleCreate,
+    UploadJobStatus,
+    UploadMode,
+)
+from .services import encoding
+from .services.analytics_service import booking_snapshot
+from .services.approval_service import ApprovalService
+from .services.booking_service import BookingQueryService
+from .services.cache_service import CACHED_PATHS, CachedResponse, response_cache
 from .services.excel_service import ExcelProcessor
-from .services.date_service import DateComparator
-from .services.financial_service import FinancialCalculator
+from .services.export_service import MEDIA_TYPES, BookingExportService
+from .services.ingestion_service import BulkIngestor, find_upload
+from .services.job_service import JobManager, run_upload_job
+from .services.log_service import setup_logging
+from .services.metrics_service import CONTENT_TYPE, RequestMetricsMiddleware, metrics
+from .services.reclassify_service import ReclassificationService, run_reclassify_job
+from .services.report_service import FinancialReportService
+from .services.rollup_service import RollupService
+from .services.split_service import check_split_write_mode
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="MultiPark Dashboard API",
     description="API para gestão de bookings e divisão financeira",
-    version="1.0.0"
+    version="1.0.0",
 )
 
 # CORS
@@ -29,141 +87,500 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Cache"],
 )
 
+
+@app.middleware("http")
+async def cache_read_responses(request: Request, call_next):
+    """Cache das leituras do dashboard (versão dos dados + query) com ETag / If-None-Match"""
+    if (
+        request.method != "GET"
+        or request.url.path not in CACHED_PATHS
+        or not response_cache.enabled
+    ):
+        return await call_next(request)
+
+    query = urlencode(sorted(request.query_params.multi_items()))
+    key = response_cache.key(request.url.path, query, read_target(request))
+    cached = response_cache.get(key)
+    state = "HIT"
+    if cached is None:
+        response = await call_next(request)
+        if not response_cache.cacheable(response.status_code, response.headers):
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name not in ("content-length", "set-cookie")
+        }
+        cached = CachedResponse(response.status_code, headers, body)
+        response_cache.set(key, cached)
+        state = "MISS"
+
+    if request.headers.get("if-none-match") == cached.etag:
+        response_cache.count_not_modified()
+        return Response(status_code=304, headers={"ETag": cached.etag})
+    return Response(
+        content=cached.body,
+        status_code=cached.status_code,
+        headers={**cached.headers, "ETag": cached.etag, "X-Cache": state},
+    )
+
+
+# Duração por rota (por fora da cache: os HITs também contam)
+app.add_middleware(RequestMetricsMiddleware, router=app.router)
+
 # Static files
 app.mount("/static", StaticFiles(directory="../frontend"), name="static")
 
+# Workers para uploads em background
+job_manager = JobManager()
+
+
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    check_split_write_mode(engine)
+    if booking_snapshot.enabled:
+        booking_snapshot.load()
+        snapshot = booking_snapshot.stats()
+        logger.info(
+            "Snapshot analítico: %d bookings, %d bytes",
+            snapshot["bookings"],
+            snapshot["bytes"],
+        )
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    job_manager.shutdown()
+
 
 @app.get("/")
 def read_root():
     return {"message": "MultiPark Dashboard API", "status": "online"}
 
-@app.post("/api/upload-excel")
-async def upload_excel(file: UploadFile = File(...), session: Session = Depends(get_session)):
+
+def _engines() -> dict:
+    engines = {"sync": engine, "replica": read_engine, "async": async_engine}
+    return {name: bind for name, bind in engines.items() if bind is not None}
+
+
+@app.get("/api/db/pool")
+def get_pool_status():
+    """Ligações em uso, overflow e esperas por ligação livre dos pools da BD"""
+    return {name: pool_status(bind) for name, bind in _engines().items()}
+
+
+def _pool_gauge(stat: str):
+    def collect():
+        values = {
+            (name,): pool_status(bind).get(stat) for name, bind in _engines().items()
+        }
+        return {labels: value for labels, value in values.items() if value is not None}
+
+    return collect
+
+
+for _stat in (
+    "size",
+    "checked_out",
+    "overflow",
+    "checkouts",
+    "waits",
+    "wait_seconds",
+    "timeouts",
+):
+    metrics.gauge_collector(
+        f"multipark_db_pool_{_stat}",
+        f"Pool da BD: {_stat}",
+        ["engine"],
+        _pool_gauge(_stat),
+    )
+metrics.gauge_collector(
+    "multipark_response_cache",
+    "Cache de respostas: versão, entradas, hits, misses, 304",
+    ["stat"],
+    lambda: {(stat,): value for stat, value in response_cache.stats().items()},
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Métricas em formato de texto Prometheus (etapas do upload, endpoints, queries, pools)"""
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Versão dos dados, entradas e hits/misses/304 da cache de respostas"""
+    return response_cache.stats()
+
+
+@app.get("/api/analytics/snapshot")
+def get_snapshot_stats():
+    """Bookings, pendentes e memória (bytes por booking) do snapshot analítico"""
+    return booking_snapshot.stats()
+
+
+@app.post("/api/upload-excel", dependencies=[Depends(stick_to_primary)])
+async def upload_excel(
+    file: UploadFile = File(...),
+    mode: UploadMode = UploadMode.MEMORY,
+    session: Session = Depends(get_session),
+):
     """Upload e processa ficheiro Excel"""
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="Apenas ficheiros Excel (.xlsx, .xls)")
-    
-    # Processar Excel
-    processor = ExcelProcessor()
-    bookings_data = await processor.process_file(file)
-    
-    # Guardar na BD
-    bookings_created = []
-    for booking_data in bookings_data:
-        # Comparar datas
-        comparator = DateComparator()
-        date_diff, needs_approval = comparator.compare_dates(
-            booking_data['checkout_timestamp'], 
-            booking_data['checkout_formatted']
+    if not file.filename.endswith((".xlsx", ".xls")):
+        raise HTTPException(
+            status_code=400, detail="Apenas ficheiros Excel (.xlsx, .xls)"
         )
-        
-        # Criar booking
-        booking = Booking(
-            license_plate=booking_data['license_plate'],
-            checkout_timestamp=booking_data['checkout_timestamp'],
-            checkout_formatted=booking_data['checkout_formatted'],
-            price_delivery=float(booking_data['price_delivery'] or 0),
-            park_brand=booking_data['park_brand'],
-            payment_method=booking_data['payment_method'],
-            name=booking_data['name'],
-            lastname=booking_data['lastname'],
-            date_difference_days=date_diff,
-            needs_approval=needs_approval,
-            status_approved=not needs_approval  # Auto-aprova se não precisar
+
+    processor = ExcelProcessor()
+
+    # Leitura do Excel e escrita na BD são bloqueantes: correm no threadpool
+    # para o event loop continuar a servir os outros pedidos
+    if mode == UploadMode.STREAM and file.filename.endswith(".xlsx"):
+        # Streaming: cada bloco lido vai directamente para a BD
+        path, content_hash = await processor.spool_upload(file)
+        try:
+            previous = await run_in_threadpool(find_upload, session, content_hash)
+            if previous:
+                return _duplicate_upload_response(previous)
+            ingestor = BulkIngestor(
+                session, content_hash=content_hash, filename=file.filename
+            )
+            result = await run_in_threadpool(
+                ingestor.ingest_batches, processor.iter_chunks(path)
+            )
+        finally:
+            os.unlink(path)
+    else:
+        # Processar Excel em memória (.xls não suporta read_only)
+        contents = await file.read()
+        content_hash = hashlib.sha256(contents).hexdigest()
+        previous = await run_in_threadpool(find_upload, session, content_hash)
+        if previous:
+            return _duplicate_upload_response(previous)
+        bookings_data = await run_in_threadpool(
+            processor.read_bookings, io.BytesIO(contents)
         )
-        
-        session.add(booking)
-        session.commit()
-        session.refresh(booking)
-        
-        # Calcular divisão financeira
-        calculator = FinancialCalculator()
-        partner_60, multipark_40 = calculator.calculate_split(booking.price_delivery)
-        
-        financial_split = FinancialSplit(
-            booking_id=booking.id,
-            partner_amount_60=partner_60,
-            multipark_amount_40=multipark_40,
-            total_amount=booking.price_delivery
+
+        # Guardar na BD (lotes multi-row numa única transacção)
+        ingestor = BulkIngestor(
+            session, content_hash=content_hash, filename=file.filename
         )
-        session.add(financial_split)
-        
-        bookings_created.append(booking)
-    
-    session.commit()
-    
+        result = await run_in_threadpool(ingestor.ingest, bookings_data)
+
+    return {
+        "message": f"Processados {result['bookings_count']} registos",
+        "bookings_count": result["bookings_count"],
+        "needs_approval": result["needs_approval"],
+        "inserted": result["inserted"],
+        "updated": result["updated"],
+        "skipped": result["skipped"],
+        "errors": processor.error_messages(),
+        "rows_per_second": result["rows_per_second"],
+    }
+
+
+def _duplicate_upload_response(previous: ExcelUpload) -> dict:
+    """Resposta para um ficheiro com conteúdo idêntico a um upload anterior"""
     return {
-        "message": f"Processados {len(bookings_created)} registos",
-        "bookings_count": len(bookings_created),
-        "needs_approval": len([b for b in bookings_created if b.needs_approval])
+        "message": f"Ficheiro já processado em {previous.created_at:%d/%m/%Y %H:%M}",
+        "bookings_count": 0,
+        "needs_approval": 0,
+        "inserted": 0,
+        "updated": 0,
+        "skipped": previous.bookings_count,
+        "errors": [],
+        "rows_per_second": 0.0,
     }
 
+
+@app.post(
+    "/api/upload-jobs",
+    status_code=202,
+    response_model=UploadJobStatus,
+    dependencies=[Depends(stick_to_primary)],
+)
+async def create_upload_job(file: UploadFile = File(...)):
+    """Guarda o ficheiro e agenda o processamento em background"""
+    if not file.filename.endswith((".xlsx", ".xls")):
+        raise HTTPException(
+            status_code=400, detail="Apenas ficheiros Excel (.xlsx, .xls)"
+        )
+
+    path, content_hash = await ExcelProcessor().spool_upload(file)
+    job = job_manager.submit(
+        "upload",
+        run_upload_job,
+        path,
+        content_hash,
+        job_manager.session_factory,
+        filename=file.filename,
+    )
+    return job.snapshot()
+
+
+@app.get("/api/upload-jobs", response_model=List[UploadJobStatus])
+def list_upload_jobs():
+    """Jobs recentes (mais recentes primeiro)"""
+    return [job.snapshot() for job in job_manager.list()]
+
+
+@app.get("/api/upload-jobs/{job_id}", response_model=UploadJobStatus)
+def get_upload_job(job_id: str):
+    """Progresso (linhas, erros, throughput) e resultado final do job"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.snapshot()
+
+
+@app.post(
+    "/api/reclassify-jobs",
+    status_code=202,
+    response_model=UploadJobStatus,
+    dependencies=[Depends(stick_to_primary)],
+)
+def create_reclassify_job(
+    threshold_hour: Optional[int] = Query(
+        None, ge=0, le=23, description="Por omissão APPROVAL_THRESHOLD_HOUR"
+    ),
+    run_key: Optional[str] = Query(
+        None, description="Retomar uma reclassificação interrompida"
+    ),
+):
+    """Reavalia date_difference_days/needs_approval dos bookings sem aprovação manual em background"""
+    if run_key is None:
+        run_key = ReclassificationService(job_manager.session_factory).start(
+            threshold_hour
+        )
+    job = job_manager.submit(
+        "reclassify",
+        run_reclassify_job,
+        run_key,
+        job_manager.session_factory,
+        reference=run_key,
+    )
+    return job.snapshot()
+
+
 @app.get("/api/bookings", response_model=List[Booking])
-def get_bookings(
-    skip: int = 0, 
-    limit: int = 100,
-    needs_approval: Optional[bool] = None,
-    session: Session = Depends(get_session)
+async def get_bookings(
+    response: Response,
+    filters: BookingFilters = Depends(),
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=BookingQueryService.MAX_LIMIT),
+    skip: int = Query(default=0, ge=0, deprecated=True),
+    fields: Optional[List[str]] = Query(
+        default=None, description="Colunas a devolver (ex.: id,license_plate)"
+    ),
+    format: ListFormat = ListFormat.JSON,
+    session=Depends(read_session_dependency),
+):
+    """
+    Lista bookings com filtros (mais recentes primeiro)
+
+    Paginação keyset: o cursor da página seguinte vem no header X-Next-Cursor.
+    Com fields= e/ou format=columnar|ndjson só as colunas pedidas são lidas
+    e a resposta é codificada sem validação Pydantic.
+    Com DB_ASYNC=true lê pelo engine assíncrono (as linhas já vêm materializadas).
+    """
+    service = BookingQueryService()
+    columns = service.parse_fields(fields)
+
+    if columns is None and format == ListFormat.JSON:
+        bookings, next_cursor = await run_with_session(
+            session, service.page, filters, cursor, limit, skip
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return bookings
+
+    columns = columns or list(Booking.__table__.c.keys())
+    rows, next_cursor = await run_with_session(
+        session, service.page_rows, columns, filters, cursor, limit, skip
+    )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    if format == ListFormat.NDJSON:
+        return StreamingResponse(
+            encoding.iter_ndjson(columns, rows),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+    if format == ListFormat.COLUMNAR:
+        payload = encoding.rows_to_columns(columns, rows)
+    else:
+        payload = encoding.rows_to_objects(columns, rows)
+    return Response(
+        content=encoding.dumps(payload), media_type="application/json", headers=headers
+    )
+
+
+@app.get("/api/export/bookings")
+def export_bookings(
+    filters: BookingFilters = Depends(),
+    format: ExportFormat = ExportFormat.CSV,
+    session: Session = Depends(get_read_session),
 ):
-    """Lista bookings com filtros"""
-    query = select(Booking)
-    
-    if needs_approval is not None:
-        query = query.where(Booking.needs_approval == needs_approval)
-    
-    bookings = session.exec(query.offset(skip).limit(limit)).all()
-    return bookings
-
-@app.patch("/api/bookings/{booking_id}/approve")
+    """
+    Bookings filtrados com os seus splits em CSV, Parquet ou Arrow IPC
+
+    Lido em blocos do cursor e enviado à medida: memória constante para
+    qualquer número de linhas.
+    """
+    service = BookingExportService()
+    if not service.available(format):
+        raise HTTPException(
+            status_code=501, detail=f"Exportação {format.value} requer pyarrow"
+        )
+
+    return StreamingResponse(
+        service.stream(session, filters, format),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{service.filename(format)}"'
+        },
+    )
+
+
+@app.patch(
+    "/api/bookings/{booking_id}/approve", dependencies=[Depends(stick_to_primary)]
+)
 def approve_booking(booking_id: int, session: Session = Depends(get_session)):
     """Aprovar booking manualmente"""
     booking = session.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking não encontrado")
-    
+
     booking.status_approved = True
     booking.approved_at = datetime.utcnow()
     session.add(booking)
     session.commit()
-    
+
     return {"message": "Booking aprovado", "booking_id": booking_id}
 
-@app.get("/api/dashboard/stats")
-def get_dashboard_stats(session: Session = Depends(get_session)):
-    """Estatísticas para dashboard"""
-    total_bookings = session.exec(select(Booking)).all()
-    pending_approval = session.exec(select(Booking).where(Booking.needs_approval == True, Booking.status_approved == False)).all()
-    
-    # Totais financeiros
-    financial_splits = session.exec(select(FinancialSplit)).all()
-    total_partner = sum(fs.partner_amount_60 for fs in financial_splits)
-    total_multipark = sum(fs.multipark_amount_40 for fs in financial_splits)
-    total_amount = sum(fs.total_amount for fs in financial_splits)
-    
-    return {
-        "total_bookings": len(total_bookings),
-        "pending_approval": len(pending_approval),
-        "total_amount": total_amount,
-        "partner_60_percent": total_partner,
-        "multipark_40_percent": total_multipark,
-        "approval_rate": round((len(total_bookings) - len(pending_approval)) / len(total_bookings) * 100, 2) if total_bookings else 0
-    }
 
-@app.get("/api/financial/partner")
-def get_partner_financials(session: Session = Depends(get_session)):
-    """Contas Parceiro (60%)"""
-    return {"message": "Implementar query financeira parceiro"}
+@app.post(
+    "/api/bookings/approve",
+    response_model=BulkApprovalResponse,
+    dependencies=[Depends(stick_to_primary)],
+)
+def approve_bookings(request: ApprovalRequest, session: Session = Depends(get_session)):
+    """Aprovar bookings em lote (um só UPDATE set-based)"""
+    if len(request.booking_ids) > ApprovalService.MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {ApprovalService.MAX_IDS} bookings por pedido",
+        )
+
+    return ApprovalService().approve_ids(
+        session, request.booking_ids, request.approved_by, request.notes
+    )
+
+
+@app.post(
+    "/api/bookings/approve-matching",
+    response_model=BulkApprovalResponse,
+    dependencies=[Depends(stick_to_primary)],
+)
+def approve_matching_bookings(
+    request: FilterApprovalRequest, session: Session = Depends(get_session)
+):
+    """Aprovar todos os bookings pendentes que passam nos filtros"""
+    return ApprovalService().approve_matching(
+        session, request.filters, request.approved_by, request.notes
+    )
+
+
+@app.get("/api/dashboard/stats", response_model=DashboardStats)
+async def get_dashboard_stats(session=Depends(read_session_dependency)):
+    """Estatísticas para dashboard (snapshot em memória, se activo, ou rollup stats_rollup)"""
+    if booking_snapshot.enabled:
+        snapshot = await run_in_threadpool(
+            booking_snapshot.current
+        )  # Pode (re)carregar da BD
+        return snapshot.dashboard_stats()
+    return await run_with_session(session, RollupService().dashboard_stats)
+
+
+@app.get("/api/financial/partner", response_model=FinancialReport)
+def get_partner_financials(
+    filters: BookingFilters = Depends(),
+    group_by: List[ReportGroup] = Query(
+        default=[ReportGroup.PARK_BRAND, ReportGroup.PAYMENT_METHOD]
+    ),
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=FinancialReportService.MAX_LIMIT),
+    session: Session = Depends(get_read_session),
+):
+    """Contas Parceiro (60%) por marca, método de pagamento e/ou dia"""
+    if booking_snapshot.enabled:
+        return booking_snapshot.current().breakdown(
+            "partner", filters, group_by, cursor, limit
+        )
+    return FinancialReportService().breakdown(
+        session, "partner", filters, group_by, cursor, limit
+    )
+
+
+@app.get("/api/financial/multipark", response_model=FinancialReport)
+def get_multipark_financials(
+    filters: BookingFilters = Depends(),
+    group_by: List[ReportGroup] = Query(
+        default=[ReportGroup.PARK_BRAND, ReportGroup.PAYMENT_METHOD]
+    ),
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=FinancialReportService.MAX_LIMIT),
+    session: Session = Depends(get_read_session),
+):
+    """Contas Multipark (40%) por marca, método de pagamento e/ou dia"""
+    if booking_snapshot.enabled:
+        return booking_snapshot.current().breakdown(
+            "multipark", filters, group_by, cursor, limit
+        )
+    return FinancialReportService().breakdown(
+        session, "multipark", filters, group_by, cursor, limit
+    )
+
+
+@app.get("/api/split-rules", response_model=List[SplitRule])
+def list_split_rules(session: Session = Depends(get_session)):
+    """Regras de divisão (sem regras: 60/40 para todas as marcas)"""
+    return session.exec(
+        select(SplitRule).order_by(
+            SplitRule.park_brand, SplitRule.effective_from, SplitRule.id
+        )
+    ).all()
+
+
+@app.post("/api/split-rules", status_code=201, response_model=SplitRule)
+def create_split_rule(rule: SplitRuleCreate, session: Session = Depends(get_session)):
+    """Nova regra; aplica-se às divisões calculadas a partir de agora"""
+    split_rule = SplitRule.model_validate(rule)
+    session.add(split_rule)
+    session.commit()
+    session.refresh(split_rule)
+    return split_rule
+
+
+@app.delete("/api/split-rules/{rule_id}")
+def delete_split_rule(rule_id: int, session: Session = Depends(get_session)):
+    """Remover regra"""
+    split_rule = session.get(SplitRule, rule_id)
+    if not split_rule:
+        raise HTTPException(status_code=404, detail="Regra não encontrada")
+
+    session.delete(split_rule)
+    session.commit()
+    return {"message": "Regra removida", "rule_id": rule_id}
 
-@app.get("/api/financial/multipark")
-def get_multipark_financials(session: Session = Depends(get_session)):
-    """Contas Multipark (40%)"""
-    return {"message": "Implementar query financeira multipark"}
 
 if __name__ == "__main__":
     import uvicorn
+
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
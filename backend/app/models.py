@@ -1,22 +1,63 @@
 """
 SQLModel schemas para MultiPark Dashboard
 """
-from sqlmodel import SQLModel, Field, Relationship
-from datetime import datetime
-from typing import Optional, List
+from datetime import date, datetime
 from enum import Enum
+from typing import List, Optional, Union
+
+from sqlalchemy import Index
+from sqlmodel import Field, Relationship, SQLModel
+
 
 class ParkBrand(str, Enum):
     SKYPARK = "skypark"
     AIRPARK = "airpark"
     MULTIPARK = "multipark"
 
+
 class PaymentMethod(str, Enum):
     MULTIBANCO = "Multibanco"
     CREDIT_CARD = "Credit Card"
     CASH = "Cash"
     OTHER = "Other"
 
+
+class UploadMode(str, Enum):
+    MEMORY = "memory"  # pd.read_excel + transformação vectorizada
+    STREAM = "stream"  # openpyxl read_only, blocos de tamanho fixo
+
+
+class ListFormat(str, Enum):
+    JSON = "json"  # Lista de objectos
+    COLUMNAR = "columnar"  # {campo: [valores]}
+    NDJSON = "ndjson"  # Um objecto por linha
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    PARQUET = "parquet"
+    ARROW = "arrow"  # Arrow IPC (stream)
+
+
+class ReportGroup(str, Enum):
+    PARK_BRAND = "park_brand"
+    PAYMENT_METHOD = "payment_method"
+    DAY = "day"
+
+
+class SplitWriteMode(str, Enum):
+    AUTO = "auto"  # Trigger se existir na BD, senão aplicação
+    TRIGGER = "trigger"  # create_financial_split() na BD
+    APP = "app"  # INSERT em lote pelo BulkIngestor
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 # Base model para Booking
 class BookingBase(SQLModel):
     license_plate: str = Field(index=True, max_length=20)
@@ -41,28 +82,58 @@ class BookingBase(SQLModel):
     delivery_price: Optional[float] = None
     payment_intent_id: Optional[str] = None
 
+
 # Campos calculados/administrativos
 class BookingAdmin(SQLModel):
     date_difference_days: Optional[int] = Field(default=0)
     needs_approval: bool = Field(default=False)
     status_approved: bool = Field(default=False)
     approved_at: Optional[datetime] = None
+    approved_by: Optional[str] = Field(default=None, max_length=100)
+    approval_notes: Optional[str] = None
+    natural_key: Optional[str] = Field(
+        default=None, unique=True, index=True, max_length=200
+    )
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
 
+
 # Tabela principal
 class Booking(BookingBase, BookingAdmin, table=True):
     __tablename__ = "bookings"
-    
+    __table_args__ = (
+        # Listagem keyset (created_at DESC, id DESC), com e sem filtros de igualdade
+        Index("ix_bookings_created_id", "created_at", "id"),
+        Index("ix_bookings_brand_created_id", "park_brand", "created_at", "id"),
+        Index("ix_bookings_method_created_id", "payment_method", "created_at", "id"),
+        Index(
+            "ix_bookings_approval_created_id",
+            "needs_approval",
+            "status_approved",
+            "created_at",
+            "id",
+        ),
+        # Relatórios por intervalo de datas (index-only scan em PostgreSQL)
+        Index(
+            "ix_bookings_checkout_brand_method",
+            "checkout_timestamp",
+            "park_brand",
+            "payment_method",
+            postgresql_include=["price_delivery", "needs_approval", "status_approved"],
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    
+
     # Relationships
     financial_split: Optional["FinancialSplit"] = Relationship(back_populates="booking")
 
+
 # Para criação via API
 class BookingCreate(BookingBase):
     pass
 
+
 # Para updates
 class BookingUpdate(SQLModel):
     license_plate: Optional[str] = None
@@ -73,30 +144,130 @@ class BookingUpdate(SQLModel):
     lastname: Optional[str] = None
     status_approved: Optional[bool] = None
 
+
 # Divisão financeira
 class FinancialSplitBase(SQLModel):
     booking_id: int = Field(foreign_key="bookings.id")
     partner_amount_60: float = Field(ge=0)
     multipark_amount_40: float = Field(ge=0)
     total_amount: float = Field(ge=0)
-    
+
+
 class FinancialSplit(FinancialSplitBase, table=True):
     __tablename__ = "financial_splits"
-    
+    __table_args__ = (
+        Index(
+            "ix_financial_splits_booking_amounts",
+            "booking_id",
+            postgresql_include=[
+                "total_amount",
+                "partner_amount_60",
+                "multipark_amount_40",
+            ],
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    partner_bps: Optional[
+        int
+    ] = None  # Regra aplicada (pontos base do parceiro: 6000 = 60%)
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    
+
     # Relationships
     booking: Optional[Booking] = Relationship(back_populates="financial_split")
 
+
 class FinancialSplitCreate(FinancialSplitBase):
     pass
 
+
+# Regras de divisão Parceiro/Multipark por marca e data de início
+class SplitRuleBase(SQLModel):
+    park_brand: Optional[str] = Field(
+        default=None, max_length=50
+    )  # None = todas as marcas
+    partner_bps: int = Field(
+        ge=0, le=10000
+    )  # Parte do parceiro em pontos base (6000 = 60%)
+    effective_from: Optional[
+        date
+    ] = None  # Dia (UTC) do checkout a partir do qual vale; None = sempre
+
+
+class SplitRule(SplitRuleBase, table=True):
+    __tablename__ = "split_rules"
+    __table_args__ = (
+        Index("ix_split_rules_brand_effective", "park_brand", "effective_from"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class SplitRuleCreate(SplitRuleBase):
+    pass
+
+
+# Ficheiros Excel já ingeridos (hash do conteúdo)
+class ExcelUpload(SQLModel, table=True):
+    __tablename__ = "excel_uploads"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    content_hash: str = Field(unique=True, index=True, max_length=64)
+    filename: Optional[str] = None
+    bookings_count: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Rollup das estatísticas por dia x park_brand x payment_method
+class StatsRollup(SQLModel, table=True):
+    __tablename__ = "stats_rollup"
+    __table_args__ = (
+        Index(
+            "ix_stats_rollup_brand_method_day", "park_brand", "payment_method", "day"
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    group_key: str = Field(
+        unique=True, index=True, max_length=255
+    )  # "<dia>|<marca>|<método>"
+    day: Optional[date] = Field(default=None, index=True)  # Dia (UTC) do checkout
+    park_brand: str = Field(default="", max_length=50)
+    payment_method: str = Field(default="", max_length=50)
+    booking_count: int = 0
+    pending_count: int = 0
+    total_cents: int = 0
+    partner_cents: int = 0
+    multipark_cents: int = 0
+
+
+# Reclassificação (date_difference_days / needs_approval) com checkpoint por fatia de ids
+class ReclassificationCheckpoint(SQLModel, table=True):
+    __tablename__ = "reclassification_checkpoints"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    run_key: str = Field(index=True, max_length=32)
+    threshold_hour: int
+    start_id: int  # Exclusivo
+    end_id: int  # Inclusivo
+    last_id: int  # Último id processado (retoma a partir daqui)
+    rows_scanned: int = 0
+    rows_changed: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 # Responses para API
 class BookingResponse(BookingBase, BookingAdmin):
     id: int
     financial_split: Optional[FinancialSplit] = None
 
+
 class DashboardStats(SQLModel):
     total_bookings: int
     pending_approval: int
@@ -105,6 +276,7 @@ class DashboardStats(SQLModel):
     multipark_40_percent: float
     approval_rate: float
 
+
 class FinancialSummary(SQLModel):
     park_brand: str
     payment_method: str
@@ -112,25 +284,95 @@ class FinancialSummary(SQLModel):
     count_bookings: int
     percentage_of_total: float
 
+
+class FinancialBreakdownRow(SQLModel):
+    park_brand: Optional[str] = None
+    payment_method: Optional[str] = None
+    day: Optional[date] = None
+    count_bookings: int
+    total_amount: float
+    share_amount: float  # Parte do parceiro ou da Multipark (regra de divisão de cada booking)
+    percentage_of_total: float
+
+
+class FinancialReport(SQLModel):
+    share: str
+    percentage: float  # Parte efectiva: share_amount / total_amount * 100
+    group_by: List[ReportGroup]
+    count_bookings: int
+    total_amount: float
+    share_amount: float
+    items: List[FinancialBreakdownRow] = []
+    next_cursor: Optional[str] = None  # Passar em ?cursor= para a página seguinte
+
+
+# Filtros para queries
+class BookingFilters(SQLModel):
+    park_brand: Optional[str] = None
+    payment_method: Optional[str] = None
+    needs_approval: Optional[bool] = None
+    status_approved: Optional[bool] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+
+
 class ApprovalRequest(SQLModel):
     booking_ids: List[int]
     approved_by: str
     notes: Optional[str] = None
 
+
+class FilterApprovalRequest(SQLModel):
+    filters: BookingFilters = BookingFilters()
+    approved_by: str
+    notes: Optional[str] = None
+
+
+class BulkApprovalResponse(SQLModel):
+    approved: int
+    approved_ids: List[int] = []
+    already_approved_ids: List[int] = []
+    not_found_ids: List[int] = []
+
+
 # Para upload Excel
 class ExcelUploadResponse(SQLModel):
     message: str
     bookings_count: int
     needs_approval: int
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
     errors: List[str] = []
     success: bool
 
-# Filtros para queries
-class BookingFilters(SQLModel):
-    park_brand: Optional[str] = None
-    payment_method: Optional[str] = None
-    needs_approval: Optional[bool] = None
-    date_from: Optional[datetime] = None
-    date_to: Optional[datetime] = None
-    min_amount: Optional[float] = None
-    max_amount: Optional[float] = None
+
+class ReclassificationResult(SQLModel):
+    run_key: str
+    threshold_hour: int
+    slices: int
+    rows_scanned: int
+    rows_changed: int
+    elapsed_seconds: float
+    rows_per_second: float
+    finished: bool
+
+
+# Jobs de upload em background
+class UploadJobStatus(SQLModel):
+    job_id: str
+    kind: str
+    filename: Optional[str] = None
+    reference: Optional[
+        str
+    ] = None  # Ex.: run_key de uma reclassificação (para retomar)
+    status: JobStatus
+    rows_done: int = 0
+    rows_per_second: float = 0.0
+    errors: List[str] = []
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Union[ExcelUploadResponse, ReclassificationResult]] = None
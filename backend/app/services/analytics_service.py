@@ -0,0 +1,580 @@
+"""
+Snapshot colunar de bookings + financial_splits para estatísticas e relatórios
+
+Com ANALYTICS_SNAPSHOT=true a API carrega no arranque uma coluna NumPy por
+campo (uma posição por booking, ordenada por id):
+
+    id (int64), checkout em µs UTC (int64), park_brand e payment_method
+    codificados em dicionário (int16), needs_approval/status_approved (bits
+    de um uint8), price_delivery e somas dos splits em cêntimos (int64)
+
+= 53 bytes por booking. Dashboard stats e breakdowns Parceiro/Multipark são
+calculados com máscaras e group-by vectorizados (np.unique + bincount), sem
+ir à BD.
+
+Escritas desta API marcam os bookings tocados (flush ORM, ingestão em lote,
+aprovações, reclassificação, reparação de splits); no commit esses ids
+ficam pendentes e são relidos da BD na leitura seguinte. Escritas feitas
+por outros processos aparecem na recarga completa, a cada
+ANALYTICS_SNAPSHOT_REFRESH segundos: as colunas novas são construídas numa
+thread em background, fora do lock, e trocadas de uma vez no fim; até lá as
+leituras usam o snapshot anterior (com os pendentes aplicados).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session as OrmSession
+
+from ..database import new_session
+from ..models import (
+    Booking,
+    BookingFilters,
+    DashboardStats,
+    FinancialReport,
+    FinancialSplit,
+    ReportGroup,
+)
+from .filters import utc_naive
+from .report_service import NO_DAY, _report_cursor, build_report
+from .rollup_service import touched_booking_ids
+from .stats_service import StatsService
+
+logger = logging.getLogger(__name__)
+
+NEEDS_APPROVAL = 1
+STATUS_APPROVED = 2
+
+# Sem checkout (NULL)
+NO_CHECKOUT = np.iinfo(np.int64).min
+
+MICROS_PER_DAY = 86_400 * 1_000_000
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+LOAD_CHUNK = 50_000
+
+# Até este nº de chaves possíveis o group-by usa bincount directo (senão np.unique)
+DENSE_GROUPS = 1 << 22
+REFRESH_CHUNK = 500
+
+# Colunas do snapshot (nome -> dtype)
+COLUMNS = {
+    "id": np.int64,
+    "checkout": np.int64,
+    "brand": np.int16,
+    "method": np.int16,
+    "flags": np.uint8,
+    "price": np.int64,
+    "total": np.int64,
+    "partner": np.int64,
+    "multipark": np.int64,
+}
+
+# Colunas com a parte de cada conta
+SHARE_COLUMNS = {"partner": "partner", "multipark": "multipark"}
+
+
+def _micros(value: datetime) -> int:
+    """Datas dos filtros -> µs UTC (como as colunas do snapshot)"""
+    return (utc_naive(value) - EPOCH) // timedelta(microseconds=1)
+
+
+class _Dictionary:
+    """Códigos int16 de marca/método: NULL e '' partilham o código 0 (como no rollup)"""
+
+    def __init__(self):
+        self.labels: List[str] = [""]
+        self.codes: Dict[str, int] = {"": 0}
+
+    def encode(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        local, uniques = pd.factorize(
+            np.array([value or "" for value in values], dtype=object)
+        )
+        mapping = np.array([self._code(value) for value in uniques], dtype=np.int16)
+        return mapping[local] if len(local) else np.zeros(0, dtype=np.int16)
+
+    def _code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.labels)
+            self.labels.append(value)
+        return code
+
+
+class BookingSnapshot:
+    """Colunas em memória com capacidade extra para acrescentar bookings novos"""
+
+    REFRESH_SECONDS = float(os.getenv("ANALYTICS_SNAPSHOT_REFRESH", "300"))
+
+    def __init__(
+        self, session_factory: Callable = new_session, enabled: Optional[bool] = None
+    ):
+        self.session_factory = session_factory
+        self.enabled = (
+            os.getenv("ANALYTICS_SNAPSHOT") == "true" if enabled is None else enabled
+        )
+        self._lock = threading.RLock()
+        self._loading = threading.Lock()  # Uma carga completa de cada vez
+        self._pending: set = set()
+        self._touched_during_load: Optional[set] = None
+        self._reloading = False
+        self._next_reload = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._columns = {
+            name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()
+        }
+        self._size = 0
+        self._brands = _Dictionary()
+        self._methods = _Dictionary()
+        self.loaded_at: Optional[float] = None
+
+    # Carga e actualização
+
+    def load(self) -> int:
+        """
+        Carga completa (arranque e recarga periódica); devolve o nº de bookings
+
+        As colunas são lidas sem o lock: as leituras continuam a usar o
+        snapshot actual. Os bookings tocados durante a carga (o commit pode
+        não ter sido visto pela query) ficam pendentes no snapshot novo.
+        """
+        with self._loading:
+            with self._lock:
+                self._next_reload = time.monotonic() + self.REFRESH_SECONDS
+                self._touched_during_load = set()
+            try:
+                columns, brands, methods = self._build()
+            except Exception:
+                with self._lock:
+                    self._touched_during_load = None
+                raise
+
+            with self._lock:
+                self._columns, self._brands, self._methods = columns, brands, methods
+                self._size = len(columns["id"])
+                self._pending = self._touched_during_load
+                self._touched_during_load = None
+                self.loaded_at = time.monotonic()
+                return self._size
+
+    def _build(self):
+        """Colunas e dicionários novos com todos os bookings da BD"""
+        brands, methods = _Dictionary(), _Dictionary()
+        with self.session_factory() as session:
+            result = session.execute(
+                self._query().execution_options(yield_per=LOAD_CHUNK)
+            )
+            chunks = [
+                self._encode(rows, brands, methods) for rows in result.partitions()
+            ]
+        if not chunks:
+            return (
+                {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()},
+                brands,
+                methods,
+            )
+        return (
+            {
+                name: np.concatenate([chunk[name] for chunk in chunks])
+                for name in COLUMNS
+            },
+            brands,
+            methods,
+        )
+
+    def mark_stale(self, booking_ids: Iterable[int]):
+        """Bookings alterados (já confirmados na BD): relidos na próxima leitura"""
+        with self._lock:
+            self._stale(booking_ids)
+
+    def mark_matching(self, filters: BookingFilters):
+        """Bookings por aprovar que passam nos filtros (aprovação por filtros, sem ids)"""
+        with self._lock:
+            if self.loaded_at is not None:
+                mask = self._mask(filters) & (self._col("flags") & STATUS_APPROVED == 0)
+                self._stale(self._col("id")[mask].tolist())
+
+    def _stale(self, booking_ids: Iterable[int]):
+        booking_ids = set(booking_ids)
+        self._pending.update(booking_ids)
+        if self._touched_during_load is not None:
+            self._touched_during_load.update(booking_ids)
+
+    def current(self) -> "BookingSnapshot":
+        """Snapshot carregado e com os pendentes aplicados (a recarga periódica corre em background)"""
+        if self.loaded_at is None:
+            self.load()  # Ainda não há nada para servir
+        with self._lock:
+            if time.monotonic() > self._next_reload and not self._reloading:
+                self._reloading = True
+                threading.Thread(
+                    target=self._reload, name="booking-snapshot-reload", daemon=True
+                ).start()
+            if self._pending:
+                self._refresh(sorted(self._pending))
+                self._pending.clear()
+        return self
+
+    def _reload(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception(
+                "Recarga do snapshot analítico falhou; mantém-se o anterior"
+            )
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def _refresh(self, booking_ids: List[int]):
+        with self.session_factory() as session:
+            for start in range(0, len(booking_ids), REFRESH_CHUNK):
+                chunk = booking_ids[start : start + REFRESH_CHUNK]
+                rows = session.execute(self._query(chunk)).all()
+                self._upsert(
+                    self._encode(rows, self._brands, self._methods),
+                    np.array(chunk, dtype=np.int64),
+                )
+
+    def _upsert(self, encoded: Dict[str, np.ndarray], requested: np.ndarray):
+        """Substitui os existentes, acrescenta os novos e remove os que já não existem na BD"""
+        ids = self._col("id")
+        positions = np.searchsorted(ids, encoded["id"])
+        found = np.zeros(len(positions), dtype=bool)
+        inside = positions < len(ids)
+        found[inside] = ids[positions[inside]] == encoded["id"][inside]
+        for name in COLUMNS:
+            self._columns[name][positions[found]] = encoded[name][found]
+
+        gone = np.setdiff1d(requested, encoded["id"])
+        if len(gone):
+            keep = ~np.isin(ids, gone)
+            self._columns = {name: self._col(name)[keep] for name in COLUMNS}
+            self._size = int(keep.sum())
+
+        if (~found).any():
+            self._append({name: values[~found] for name, values in encoded.items()})
+
+    def _append(self, encoded: Dict[str, np.ndarray]):
+        """Crescimento amortizado (capacidade a dobrar); ids fora de ordem reordenam tudo"""
+        count = len(encoded["id"])
+        needed = self._size + count
+        if needed > len(self._columns["id"]):
+            capacity = max(needed, 2 * len(self._columns["id"]), 1024)
+            for name, dtype in COLUMNS.items():
+                grown = np.zeros(capacity, dtype=dtype)
+                grown[: self._size] = self._col(name)
+                self._columns[name] = grown
+
+        in_order = (
+            self._size == 0 or encoded["id"][0] > self._columns["id"][self._size - 1]
+        )
+        for name in COLUMNS:
+            self._columns[name][self._size : needed] = encoded[name]
+        self._size = needed
+
+        if not in_order or (count > 1 and (np.diff(encoded["id"]) < 0).any()):
+            order = np.argsort(self._col("id"), kind="stable")
+            for name in COLUMNS:
+                self._columns[name][: self._size] = self._col(name)[order]
+
+    def _query(self, booking_ids: Optional[List[int]] = None):
+        """bookings LEFT JOIN somas dos splits por booking, por ordem de id (todos ou os ids dados)"""
+        bookings = Booking.__table__
+        splits = FinancialSplit.__table__
+        split_totals = select(
+            splits.c.booking_id,
+            func.sum(splits.c.total_amount).label("total_amount"),
+            func.sum(splits.c.partner_amount_60).label("partner_amount_60"),
+            func.sum(splits.c.multipark_amount_40).label("multipark_amount_40"),
+        ).group_by(splits.c.booking_id)
+        if booking_ids is not None:
+            split_totals = split_totals.where(splits.c.booking_id.in_(booking_ids))
+        split_totals = split_totals.subquery()
+        query = (
+            select(
+                bookings.c.id,
+                bookings.c.checkout_timestamp,
+                bookings.c.park_brand,
+                bookings.c.payment_method,
+                bookings.c.needs_approval,
+                bookings.c.status_approved,
+                bookings.c.price_delivery,
+                split_totals.c.total_amount,
+                split_totals.c.partner_amount_60,
+                split_totals.c.multipark_amount_40,
+            )
+            .select_from(
+                bookings.outerjoin(
+                    split_totals, split_totals.c.booking_id == bookings.c.id
+                )
+            )
+            .order_by(bookings.c.id)
+        )
+        if booking_ids is not None:
+            query = query.where(bookings.c.id.in_(booking_ids))
+        return query
+
+    def _encode(
+        self, rows, brands: _Dictionary, methods: _Dictionary
+    ) -> Dict[str, np.ndarray]:
+        """Linhas da query -> colunas tipadas (um bloco), com os dicionários dados"""
+        if not rows:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        (
+            ids,
+            checkouts,
+            brand_values,
+            method_values,
+            needs,
+            approved,
+            price,
+            total,
+            partner,
+            multipark,
+        ) = zip(*rows)
+
+        checkout = pd.to_datetime(pd.Series(checkouts, dtype=object), utc=True)
+        micros = np.where(
+            checkout.isna().to_numpy(),
+            NO_CHECKOUT,
+            checkout.dt.tz_localize(None)
+            .to_numpy(dtype="datetime64[us]")
+            .astype(np.int64),
+        )
+        return {
+            "id": np.array(ids, dtype=np.int64),
+            "checkout": micros.astype(np.int64),
+            "brand": brands.encode(brand_values),
+            "method": methods.encode(method_values),
+            "flags": (
+                np.array(needs, dtype=bool) * NEEDS_APPROVAL
+                + np.array(approved, dtype=bool) * STATUS_APPROVED
+            ).astype(np.uint8),
+            "price": _cents(price),
+            "total": _cents(total),
+            "partner": _cents(partner),
+            "multipark": _cents(multipark),
+        }
+
+    # Leitura
+
+    def _col(self, name: str) -> np.ndarray:
+        return self._columns[name][: self._size]
+
+    def _days(self) -> np.ndarray:
+        """Dia UTC do checkout (dias desde 1970; NO_CHECKOUT fica negativo e enorme)"""
+        return self._col("checkout") // MICROS_PER_DAY
+
+    def _mask(self, filters: BookingFilters) -> np.ndarray:
+        """Mesmas condições que booking_conditions"""
+        mask = np.ones(self._size, dtype=bool)
+        if filters.park_brand is not None:
+            mask &= self._col("brand") == self._brands.codes.get(filters.park_brand, -1)
+        if filters.payment_method is not None:
+            mask &= self._col("method") == self._methods.codes.get(
+                filters.payment_method, -1
+            )
+        if filters.needs_approval is not None:
+            mask &= (self._col("flags") & NEEDS_APPROVAL > 0) == filters.needs_approval
+        if filters.status_approved is not None:
+            mask &= (
+                self._col("flags") & STATUS_APPROVED > 0
+            ) == filters.status_approved
+        if filters.date_from is not None or filters.date_to is not None:
+            checkout = self._col("checkout")
+            mask &= checkout != NO_CHECKOUT
+            if filters.date_from is not None:
+                mask &= checkout >= _micros(filters.date_from)
+            if filters.date_to is not None:
+                mask &= checkout < _micros(filters.date_to)
+        # price_delivery com 2 casas decimais: price >= x <=> cêntimos >= ceil(x * 100)
+        if filters.min_amount is not None:
+            mask &= self._col("price") >= np.ceil(round(filters.min_amount * 100, 6))
+        if filters.max_amount is not None:
+            mask &= self._col("price") <= np.floor(round(filters.max_amount * 100, 6))
+        return mask
+
+    def dashboard_stats(self) -> DashboardStats:
+        with self._lock:
+            flags = self._col("flags")
+            pending = int(
+                np.count_nonzero(
+                    (flags & NEEDS_APPROVAL > 0) & (flags & STATUS_APPROVED == 0)
+                )
+            )
+            return StatsService()._to_stats(
+                self._size,
+                pending,
+                int(self._col("total").sum()) / 100,
+                int(self._col("partner").sum()) / 100,
+                int(self._col("multipark").sum()) / 100,
+            )
+
+    def breakdown(
+        self,
+        share: str,
+        filters: BookingFilters,
+        group_by: Optional[List[ReportGroup]] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> FinancialReport:
+        """Mesmo resultado que FinancialReportService.breakdown, calculado nas colunas"""
+        group_by = list(
+            dict.fromkeys(
+                group_by or [ReportGroup.PARK_BRAND, ReportGroup.PAYMENT_METHOD]
+            )
+        )
+        share_column = SHARE_COLUMNS[share]
+
+        with self._lock:
+            mask = self._mask(filters)
+            if mask.all():
+                mask = slice(None)  # Sem filtros: vistas das colunas, sem cópias
+            total = self._col("total")[mask]
+            share_values = self._col(share_column)[mask]
+            totals = (len(total), int(total.sum()), int(share_values.sum()))
+
+            # Chave combinada por booking: dígitos de base "cardinalidade" de cada dimensão
+            combined = np.zeros(len(total), dtype=np.int64)
+            dimensions = []
+            for group in group_by:
+                if group == ReportGroup.DAY:
+                    days = self._days()[mask]
+                    has_day = self._col("checkout")[mask] != NO_CHECKOUT
+                    low = int(days[has_day].min()) if has_day.any() else 0
+                    codes = np.where(has_day, days - low + 1, 0)
+                    cardinality = int(codes.max()) + 1 if len(codes) else 1
+                    dimensions.append((group, cardinality, low))
+                else:
+                    dictionary = (
+                        self._brands
+                        if group == ReportGroup.PARK_BRAND
+                        else self._methods
+                    )
+                    codes = self._col(
+                        "brand" if group == ReportGroup.PARK_BRAND else "method"
+                    )[mask].astype(np.int64)
+                    cardinality = len(dictionary.labels)
+                    dimensions.append((group, cardinality, dictionary))
+                combined = combined * cardinality + codes
+
+            space = int(
+                np.prod([dimension[1] for dimension in dimensions], dtype=np.float64)
+            )
+            if space <= DENSE_GROUPS:
+                # Espaço de chaves pequeno: contagem directa por chave, O(n) sem ordenar
+                counts = np.bincount(combined, minlength=space)
+                keys = np.flatnonzero(counts)
+                counts = counts[keys]
+                sums = np.bincount(combined, weights=total, minlength=space)[keys]
+                shares = np.bincount(combined, weights=share_values, minlength=space)[
+                    keys
+                ]
+            else:
+                keys, inverse = np.unique(combined, return_inverse=True)
+                counts = np.bincount(inverse, minlength=len(keys))
+                sums = np.bincount(inverse, weights=total, minlength=len(keys))
+                shares = np.bincount(inverse, weights=share_values, minlength=len(keys))
+
+            labels = []
+            for group, cardinality, decode in reversed(dimensions):
+                codes, keys = keys % cardinality, keys // cardinality
+                if group == ReportGroup.DAY:
+                    labels.append(
+                        [
+                            NO_DAY
+                            if code == 0
+                            else date.fromordinal(
+                                EPOCH_ORDINAL + decode + int(code) - 1
+                            )
+                            for code in codes
+                        ]
+                    )
+                else:
+                    labels.append([decode.labels[code] for code in codes])
+            labels.reverse()
+
+        # Grupos já agregados (poucos): ordenação e paginação como no SQL
+        rows = sorted(
+            (*key, int(count), int(row_total), int(row_share))
+            for *key, count, row_total, row_share in zip(*labels, counts, sums, shares)
+        )
+        if cursor:
+            after = tuple(_report_cursor(cursor, group_by))
+            rows = [row for row in rows if tuple(row[: len(group_by)]) > after]
+        return build_report(share, group_by, totals, rows[: limit + 1], limit, 100)
+
+    def stats(self) -> Dict[str, float]:
+        """Tamanho e memória do snapshot"""
+        with self._lock:
+            bytes_per_booking = sum(
+                np.dtype(dtype).itemsize for dtype in COLUMNS.values()
+            )
+            return {
+                "enabled": self.enabled,
+                "loaded": self.loaded_at is not None,
+                "bookings": self._size,
+                "pending": len(self._pending),
+                "brands": len(self._brands.labels),
+                "payment_methods": len(self._methods.labels),
+                "bytes_per_booking": bytes_per_booking,
+                "bytes": bytes_per_booking * self._size,
+                "allocated_bytes": sum(
+                    column.nbytes for column in self._columns.values()
+                ),
+            }
+
+
+def _cents(values) -> np.ndarray:
+    """Valores em euros (None = 0) -> cêntimos int64, arredondados como to_cents"""
+    amounts = np.array(
+        [0.0 if value is None else float(value) for value in values], dtype=np.float64
+    )
+    return np.rint(amounts * 100).astype(np.int64)
+
+
+booking_snapshot = BookingSnapshot()
+
+
+def touch_bookings(session, booking_ids: Iterable[int]):
+    """Escritas fora do ORM (ingestão em lote, UPDATE set-based): bookings a reler depois do commit"""
+    if booking_snapshot.enabled:
+        session.info.setdefault("snapshot_touched", set()).update(booking_ids)
+
+
+def touch_matching(session, filters: BookingFilters):
+    """Aprovação por filtros: os ids são resolvidos no snapshot depois do commit"""
+    if booking_snapshot.enabled:
+        session.info.setdefault("snapshot_filters", []).append(filters)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_flush(session, flush_context):
+    if booking_snapshot.enabled:
+        touch_bookings(session, touched_booking_ids(session, include_new=True))
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _apply_touched(session):
+    touched = session.info.pop("snapshot_touched", None)
+    filters = session.info.pop("snapshot_filters", None)
+    if touched:
+        booking_snapshot.mark_stale(touched)
+    for matching in filters or []:
+        booking_snapshot.mark_matching(matching)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_touched(session):
+    session.info.pop("snapshot_touched", None)
+    session.info.pop("snapshot_filters", None)
@@ -0,0 +1,184 @@
+"""
+Aprovação de bookings em lote com UPDATE set-based
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import Integer, and_, any_, bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import Session
+
+from ..models import Booking, BookingFilters, BulkApprovalResponse
+from .analytics_service import touch_bookings, touch_matching
+from .filters import booking_conditions
+from .rollup_service import RollupDelta, RollupService, as_date, group_expressions
+
+# Colunas devolvidas pelo UPDATE para actualizar o rollup
+ROLLUP_COLUMNS = [
+    "checkout_timestamp",
+    "park_brand",
+    "payment_method",
+    "needs_approval",
+]
+
+
+class ApprovalService:
+    """
+    Aprova bookings sem os carregar como objectos ORM
+
+    PostgreSQL: UPDATE ... WHERE id = ANY(:ids) RETURNING (um só statement);
+    outros dialectos: IN em blocos de IN_CHUNK ids.
+    """
+
+    MAX_IDS = 50000
+    IN_CHUNK = 500
+
+    def __init__(self):
+        self.rollup = RollupService()
+
+    def approve_ids(
+        self,
+        session: Session,
+        booking_ids: List[int],
+        approved_by: str,
+        notes: Optional[str] = None,
+    ) -> BulkApprovalResponse:
+        """Aprova os ids dados; reporta os já aprovados e os inexistentes"""
+        table = Booking.__table__
+        booking_ids = list(dict.fromkeys(booking_ids))
+        values = self._approval_values(approved_by, notes)
+        returning = [table.c.id] + [table.c[name] for name in ROLLUP_COLUMNS]
+
+        try:
+            approved_rows = []
+            for id_condition in self._id_conditions(session, booking_ids):
+                stmt = (
+                    update(table)
+                    .where(id_condition, table.c.status_approved.is_(False))
+                    .values(**values)
+                    .returning(*returning)
+                )
+                approved_rows += session.execute(stmt).mappings().all()
+
+            delta = RollupDelta()
+            for row in approved_rows:
+                delta.add_booking(dict(row, status_approved=False), -1)
+                delta.add_booking(dict(row, status_approved=True))
+            self.rollup.apply(session.connection(), delta)
+
+            approved_ids = {row["id"] for row in approved_rows}
+            touch_bookings(session, approved_ids)
+            remaining = [
+                booking_id
+                for booking_id in booking_ids
+                if booking_id not in approved_ids
+            ]
+            existing = set()
+            for id_condition in self._id_conditions(session, remaining):
+                existing.update(
+                    session.execute(select(table.c.id).where(id_condition)).scalars()
+                )
+
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        return BulkApprovalResponse(
+            approved=len(approved_ids),
+            approved_ids=[
+                booking_id for booking_id in booking_ids if booking_id in approved_ids
+            ],
+            already_approved_ids=[
+                booking_id for booking_id in remaining if booking_id in existing
+            ],
+            not_found_ids=[
+                booking_id for booking_id in remaining if booking_id not in existing
+            ],
+        )
+
+    def approve_matching(
+        self,
+        session: Session,
+        filters: BookingFilters,
+        approved_by: str,
+        notes: Optional[str] = None,
+    ) -> BulkApprovalResponse:
+        """
+        Aprova todos os bookings pendentes que passam nos filtros
+
+        Os deltas do rollup são agregados em SQL (GROUP BY dia x marca x
+        método); nenhuma linha vem para Python. Em PostgreSQL o GROUP BY é
+        feito sobre o próprio UPDATE ... RETURNING (CTE), num só statement.
+        """
+        table = Booking.__table__
+        conditions = booking_conditions(filters, table) + [
+            table.c.status_approved.is_(False)
+        ]
+        approve = (
+            update(table)
+            .where(and_(*conditions))
+            .values(**self._approval_values(approved_by, notes))
+        )
+
+        try:
+            if session.get_bind().dialect.name == "postgresql":
+                approved = approve.returning(
+                    *[table.c[name] for name in ROLLUP_COLUMNS]
+                ).cte("approved")
+                groups = session.execute(self._grouped(session, approved, [])).all()
+            else:
+                groups = session.execute(
+                    self._grouped(session, table, conditions)
+                ).all()
+                session.execute(approve)
+
+            delta = RollupDelta()
+            for day_value, brand_value, method_value, count, pending in groups:
+                delta.add((as_date(day_value), brand_value, method_value), 0, -pending)
+            self.rollup.apply(session.connection(), delta)
+            touch_matching(session, filters)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        return BulkApprovalResponse(approved=sum(group[3] for group in groups))
+
+    def _grouped(self, session: Session, source, conditions: list):
+        """Aprovados e pendentes (needs_approval) por grupo do rollup"""
+        day, brand, method = group_expressions(session, source)
+        return (
+            select(
+                day,
+                brand,
+                method,
+                func.count(),
+                func.count().filter(source.c.needs_approval),
+            )
+            .select_from(source)
+            .where(*conditions)
+            .group_by(day, brand, method)
+        )
+
+    def _approval_values(self, approved_by: str, notes: Optional[str]) -> dict:
+        return {
+            "status_approved": True,
+            "approved_at": datetime.utcnow(),
+            "approved_by": approved_by,
+            "approval_notes": notes,
+            "updated_at": datetime.utcnow(),
+        }
+
+    def _id_conditions(self, session: Session, booking_ids: List[int]) -> Iterable:
+        """id = ANY(array) em PostgreSQL; blocos de IN (...) nos outros dialectos"""
+        if not booking_ids:
+            return
+        table = Booking.__table__
+        if session.get_bind().dialect.name == "postgresql":
+            yield table.c.id == any_(
+                bindparam("booking_ids", booking_ids, type_=ARRAY(Integer))
+            )
+            return
+        for start in range(0, len(booking_ids), self.IN_CHUNK):
+            yield table.c.id.in_(booking_ids[start : start + self.IN_CHUNK])
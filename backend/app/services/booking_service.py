@@ -0,0 +1,118 @@
+"""
+Listagem de bookings com filtros em SQL e paginação keyset
+"""
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select as core_select
+from sqlalchemy import tuple_
+from sqlmodel import Session, select
+
+from ..models import Booking, BookingFilters
+from .filters import booking_conditions, decode_cursor, encode_cursor
+
+
+class BookingQueryService:
+    """
+    Páginas ordenadas por (created_at DESC, id DESC)
+
+    A página seguinte começa depois da chave do último booking devolvido,
+    por isso a página N custa o mesmo que a primeira (sem OFFSET).
+    """
+
+    MAX_LIMIT = 10000
+
+    def page(
+        self,
+        session: Session,
+        filters: BookingFilters,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        skip: int = 0,
+    ) -> Tuple[List[Booking], Optional[str]]:
+        """Bookings da página e cursor da seguinte (None na última)"""
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        query = self._paginate(select(Booking), filters, cursor, limit, skip)
+        bookings = session.exec(query).all()
+
+        next_cursor = None
+        if len(bookings) > limit:
+            bookings = bookings[:limit]
+            last = bookings[-1]
+            next_cursor = encode_cursor([last.created_at, last.id])
+        return bookings, next_cursor
+
+    def page_rows(
+        self,
+        session: Session,
+        fields: Sequence[str],
+        filters: BookingFilters,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        skip: int = 0,
+    ) -> Tuple[List[Tuple[Any, ...]], Optional[str]]:
+        """
+        Só as colunas pedidas (tuplos, sem objectos ORM nem validação)
+
+        created_at e id são sempre lidos no fim de cada linha para o cursor;
+        quem chama usa apenas os primeiros len(fields) valores.
+        """
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        table = Booking.__table__
+        columns = [table.c[name] for name in fields] + [table.c.created_at, table.c.id]
+
+        query = self._paginate(core_select(*columns), filters, cursor, limit, skip)
+        rows = session.execute(query).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(list(rows[-1][-2:]))
+        return rows, next_cursor
+
+    def _paginate(
+        self,
+        query,
+        filters: BookingFilters,
+        cursor: Optional[str],
+        limit: int,
+        skip: int,
+    ):
+        table = Booking.__table__
+        query = query.where(*booking_conditions(filters, table))
+        if cursor:
+            query = query.where(
+                tuple_(table.c.created_at, table.c.id)
+                < tuple_(*self._cursor_key(cursor))
+            )
+        elif skip:
+            query = query.offset(skip)  # Compatibilidade: ?skip= sem cursor
+
+        return query.order_by(table.c.created_at.desc(), table.c.id.desc()).limit(
+            limit + 1
+        )
+
+    def parse_fields(self, fields: Optional[List[str]]) -> Optional[List[str]]:
+        """?fields=a,b&fields=c -> colunas válidas (id sempre incluído)"""
+        if not fields:
+            return None
+        names = [
+            name.strip()
+            for value in fields
+            for name in value.split(",")
+            if name.strip()
+        ]
+        unknown = [name for name in names if name not in Booking.__table__.c]
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Campos desconhecidos: {', '.join(unknown)}"
+            )
+        return list(dict.fromkeys(["id"] + names))
+
+    def _cursor_key(self, cursor: str) -> Tuple[datetime, int]:
+        created_at, booking_id = decode_cursor(cursor, 2)
+        try:
+            return datetime.fromisoformat(created_at), int(booking_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
@@ -0,0 +1,175 @@
+"""
+Cache de respostas dos endpoints de leitura do dashboard
+
+As respostas GET de CACHED_PATHS ficam em memória (TTL + LRU) com a chave
+endpoint + query string + versão dos dados. A versão é incrementada em
+cada commit que escreve na BD através do ORM desta aplicação (uploads,
+aprovações, jobs); as entradas de versões antigas deixam de ser lidas e
+saem pelo LRU. Escritas feitas por outros processos só são vistas quando
+a entrada expira (RESPONSE_CACHE_TTL).
+
+Cada resposta leva um ETag (hash do corpo): If-None-Match igual a uma
+entrada em cache devolve 304 sem ir à BD.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+CACHED_PATHS = {
+    "/api/bookings",
+    "/api/dashboard/stats",
+    "/api/financial/partner",
+    "/api/financial/multipark",
+}
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    etag: str = field(init=False)
+
+    def __post_init__(self):
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=16).hexdigest() + '"'
+
+
+class MemoryCacheBackend:
+    """Dicionário LRU com expiração por entrada; pode ser trocado por outro backend com get/set/clear"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedResponse, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResponseCache:
+    """Versão dos dados, chaves e contadores de hits/misses/304"""
+
+    TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+    MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+    MAX_BODY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BODY_BYTES", str(1024 * 1024)))
+
+    def __init__(self, backend=None, ttl: Optional[float] = None):
+        self.backend = backend or MemoryCacheBackend(self.MAX_ENTRIES)
+        self.ttl = self.TTL_SECONDS if ttl is None else ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def bump(self):
+        """Dados alterados: as entradas existentes deixam de ser servidas"""
+        with self._lock:
+            self.version += 1
+
+    def key(self, path: str, query: str, variant: str = "") -> str:
+        """Chave com a versão actual (lida antes de calcular a resposta)"""
+        return f"{self.version}:{variant}:{path}?{query}"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        cached = self.backend.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def set(self, key: str, cached: CachedResponse):
+        self.backend.set(key, cached, self.ttl)
+
+    def cacheable(self, status_code: int, headers) -> bool:
+        """Só respostas 200 com corpo de tamanho conhecido (não streaming) e limitado"""
+        length = headers.get("content-length")
+        return (
+            status_code == 200
+            and length is not None
+            and int(length) <= self.MAX_BODY_BYTES
+        )
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "version": self.version,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = self.not_modified = 0
+
+
+response_cache = ResponseCache()
+
+
+def mark_changed(session):
+    """Escritas feitas fora do ORM (COPY, ligação directa) também contam no commit"""
+    session.info["data_changed"] = True
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_flush(session, flush_context):
+    mark_changed(session)
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _track_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        mark_changed(orm_execute_state.session)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _bump_version(session):
+    if session.info.pop("data_changed", False):
+        response_cache.bump()
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("data_changed", None)
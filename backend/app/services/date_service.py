@@ -1,109 +1,426 @@
 """
 Serviço para comparação de datas e timestamps
 """
-from datetime import datetime, time, timedelta
-from typing import Tuple, Optional
+import logging
+import os
 import re
+from collections import Counter
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Formatos possíveis de checkOut, na ordem original de tentativa.
+# São mutuamente exclusivos (separadores/campos diferentes), por isso a
+# ordem não muda o resultado de um parse com sucesso.
+DATE_FORMATS = [
+    "%d/%m/%Y, %H:%M",  # 22/06/2025, 21:56
+    "%d/%m/%Y %H:%M",  # 22/06/2025 21:56
+    "%d-%m-%Y, %H:%M",  # 22-06-2025, 21:56
+    "%d-%m-%Y %H:%M",  # 22-06-2025 21:56
+    "%Y-%m-%d %H:%M:%S",  # 2025-06-22 21:56:00
+    "%Y-%m-%d %H:%M",  # 2025-06-22 21:56
+    "%d/%m/%Y",  # 22/06/2025
+    "%d-%m-%Y",  # 22-06-2025
+    "%Y-%m-%d",  # 2025-06-22
+]
+
+# Regex pré-compilada por formato -> campos (ano, mês, dia, hora, minuto, segundo)
+_FIELD_PATTERNS = {
+    "%d": r"(?P<day>\d{1,2})",
+    "%m": r"(?P<month>\d{1,2})",
+    "%Y": r"(?P<year>\d{4})",
+    "%H": r"(?P<hour>\d{1,2})",
+    "%M": r"(?P<minute>\d{1,2})",
+    "%S": r"(?P<second>\d{1,2})",
+}
+
+
+# Largura dos campos nos valores com zeros à esquerda (ex.: 02/06/2025, 09:05)
+_FIELD_WIDTHS = {
+    "%d": ("day", 2),
+    "%m": ("month", 2),
+    "%Y": ("year", 4),
+    "%H": ("hour", 2),
+    "%M": ("minute", 2),
+    "%S": ("second", 2),
+}
+
+
+def _fixed_layout(
+    fmt: str,
+) -> Tuple[int, Dict[str, Tuple[int, int]], List[Tuple[int, int]]]:
+    """(comprimento, {campo: (início, largura)}, [(posição, código do separador)])"""
+    fields, literals, position, index = {}, [], 0, 0
+    while index < len(fmt):
+        directive = fmt[index : index + 2]
+        if directive in _FIELD_WIDTHS:
+            name, width = _FIELD_WIDTHS[directive]
+            fields[name] = (position, width)
+            position += width
+            index += 2
+        else:
+            literals.append((position, ord(fmt[index])))
+            position += 1
+            index += 1
+    return position, fields, literals
+
+
+def _compile_format(fmt: str) -> "re.Pattern":
+    pattern = re.escape(fmt)
+    for directive, group in _FIELD_PATTERNS.items():
+        pattern = pattern.replace(re.escape(directive), group)
+    return re.compile(pattern.replace(r"\ ", r"\s+") + "$")
+
+
+class FormattedDateParser:
+    """
+    Parse de checkOut com inferência do formato da coluna
+
+    O formato dominante (detect() numa amostra, ou o primeiro que funcionar)
+    é tentado primeiro com uma regex pré-compilada; só os valores que não
+    encaixam percorrem a lista completa. Strings repetidas vêm da cache.
+    Casos que a regex não resolve (ex.: dia 31/02) caem no strptime
+    original, por isso o resultado é sempre igual ao do parse sequencial.
+    """
+
+    SAMPLE_SIZE = 200
+    CACHE_SIZE = 100000
+
+    _compiled = {fmt: _compile_format(fmt) for fmt in DATE_FORMATS}
+    _layouts = {fmt: _fixed_layout(fmt) for fmt in DATE_FORMATS}
+
+    def __init__(self, primary_format: Optional[str] = None):
+        self.primary_format = primary_format
+        self._cache: Dict[str, Optional[datetime]] = {}
+
+    def detect(self, values: Iterable) -> Optional[str]:
+        """Formato mais frequente numa amostra de strings não vazias"""
+        counts = Counter()
+        sampled = 0
+        for value in values:
+            if not isinstance(value, str) or not value.strip():
+                continue
+            fmt = self._match_format(value.strip())
+            if fmt:
+                counts[fmt] += 1
+            sampled += 1
+            if sampled >= self.SAMPLE_SIZE:
+                break
+
+        if counts:
+            self.primary_format = counts.most_common(1)[0][0]
+        return self.primary_format
+
+    def parse(self, date_str: str) -> Optional[datetime]:
+        if not date_str:
+            return None
+        try:
+            return self._cache[date_str]
+        except KeyError:
+            pass
+
+        value = date_str.strip()
+        parsed = self._parse_fast(value, self.primary_format) if value else None
+        if parsed is None and value:
+            parsed = self._parse_any(value)
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[date_str] = parsed
+        return parsed
+
+    def parse_series(self, values: pd.Series) -> pd.Series:
+        """
+        Versão vectorizada: valores no formato inferido com zeros à esquerda
+        são convertidos em bloco; parse individual só para as restantes linhas
+        """
+        strings = values.map(
+            lambda value: value.strip() if isinstance(value, str) else None
+        )
+        fmt = self.detect(strings.dropna().head(self.SAMPLE_SIZE * 5))
+
+        parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+        pending = strings.notna() & strings.ne("")
+        if fmt:
+            # Valores com largura fixa: aritmética sobre os códigos dos caracteres
+            fixed = self._parse_fixed_width(strings[pending], fmt)
+            parsed[fixed.index] = fixed
+            pending &= parsed.isna()
+
+        # Restantes (sem zeros à esquerda, outros formatos, inválidos): parse
+        # individual com a semântica exacta de strptime (pd.to_datetime aceita
+        # p.ex. segundos = 60) e cache por valor
+        if pending.any():
+            parsed[pending] = pd.to_datetime(
+                strings[pending].map(self.parse), errors="coerce"
+            )
+        return parsed
+
+    def _parse_fixed_width(self, strings: pd.Series, fmt: str) -> pd.Series:
+        """
+        Valores com o comprimento exacto do formato (campos com zeros à
+        esquerda): dígitos lidos de uma matriz de códigos Unicode, validados
+        (mês, dias do mês, hora...) e convertidos para datetime64 sem strptime
+        """
+        length, fields, literals = self._layouts[fmt]
+        if strings.empty:
+            return pd.Series(dtype="datetime64[ns]")
+
+        # Uma coluna extra: tem de ficar vazia (0) para o comprimento ser exacto
+        codes = (
+            strings.to_numpy(dtype=f"U{length + 1}")
+            .view(np.uint32)
+            .reshape(-1, length + 1)
+        )
+        ok = codes[:, length] == 0
+        for position, code in literals:
+            ok &= codes[:, position] == code
+
+        numbers = {}
+        for name, (start, width) in fields.items():
+            value = np.zeros(len(codes), dtype=np.int64)
+            for position in range(start, start + width):
+                digit = codes[:, position] - np.uint32(
+                    ord("0")
+                )  # Não-dígitos dão >= 10 (unsigned)
+                ok &= digit < 10
+                value = value * 10 + digit
+            numbers[name] = value
+
+        zeros = np.zeros(len(codes), dtype=np.int64)
+        year, month, day = numbers["year"], numbers["month"], numbers["day"]
+        hour, minute, second = (
+            numbers.get(name, zeros) for name in ("hour", "minute", "second")
+        )
+        ok &= (year > 1677) & (year < 2262)  # Limites de datetime64[ns]
+        ok &= (month >= 1) & (month <= 12) & (day >= 1)
+        ok &= (hour <= 23) & (minute <= 59) & (second <= 59)
+
+        month_start = (
+            (np.where(ok, year, 1970) - 1970) * 12 + np.where(ok, month, 1) - 1
+        )
+        month_start = month_start.astype("datetime64[M]")
+        days_in_month = (
+            (month_start + 1).astype("datetime64[D]")
+            - month_start.astype("datetime64[D]")
+        ).astype(np.int64)
+        ok &= day <= days_in_month
+
+        result = (
+            month_start.astype("datetime64[D]").astype("datetime64[ns]")
+            + (day - 1).astype("timedelta64[D]")
+            + hour.astype("timedelta64[h]")
+            + minute.astype("timedelta64[m]")
+            + second.astype("timedelta64[s]")
+        )
+        return pd.Series(result[ok], index=strings.index[ok])
+
+    def _parse_fast(self, value: str, fmt: Optional[str]) -> Optional[datetime]:
+        if fmt is None:
+            return None
+        match = self._compiled[fmt].match(value)
+        if not match:
+            return None
+        fields = match.groupdict()
+        try:
+            return datetime(
+                int(fields["year"]),
+                int(fields["month"]),
+                int(fields["day"]),
+                int(fields.get("hour") or 0),
+                int(fields.get("minute") or 0),
+                int(fields.get("second") or 0),
+            )
+        except ValueError:
+            return None
+
+    def _match_format(self, value: str) -> Optional[str]:
+        for fmt in DATE_FORMATS:
+            if self._parse_fast(value, fmt) is not None:
+                return fmt
+        return None
+
+    def _parse_any(self, value: str) -> Optional[datetime]:
+        """Lista completa; o primeiro formato que funcionar passa a dominante"""
+        for fmt in DATE_FORMATS:
+            if fmt == self.primary_format:
+                continue
+            parsed = self._parse_fast(value, fmt)
+            if parsed is not None:
+                self.primary_format = self.primary_format or fmt
+                return parsed
+
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+
+        logger.warning("Formato de data não reconhecido: %s", value)
+        return None
+
+
+def _wall_clock(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+class BatchComparison(NamedTuple):
+    """Resultado de compare_batch: um array por coluna, alinhados com a entrada"""
+
+    date_difference_days: np.ndarray  # int64
+    needs_approval: np.ndarray  # bool
+    color_class: np.ndarray  # 'success' | 'warning' | 'danger'
+
 
 class DateComparator:
     """Comparador de datas para validação de discrepâncias"""
-    
-    # Limiar: 01:00 do dia seguinte = +1 dia
-    THRESHOLD_HOUR = 1
-    
-    def compare_dates(self, checkout_timestamp: Optional[datetime], checkout_formatted: str) -> Tuple[int, bool]:
+
+    # Limiar: 01:00 do dia seguinte = +1 dia (APPROVAL_THRESHOLD_HOUR para mudar a regra;
+    # bookings já gravados: python -m app.services.reclassify_service)
+    THRESHOLD_HOUR = int(os.getenv("APPROVAL_THRESHOLD_HOUR", "1"))
+
+    def __init__(self, threshold_hour: Optional[int] = None):
+        self.parser = FormattedDateParser()
+        if threshold_hour is not None:
+            self.THRESHOLD_HOUR = threshold_hour
+
+    def compare_dates(
+        self, checkout_timestamp: Optional[datetime], checkout_formatted: str
+    ) -> Tuple[int, bool]:
         """
         Compara timestamp vs data formatada
-        
+
         Returns:
             (dias_diferenca, needs_approval)
         """
         try:
             if not checkout_timestamp:
                 return 0, False
-            
+
             # Parse data formatada
             formatted_date = self._parse_formatted_date(checkout_formatted)
             if not formatted_date:
                 return 0, False
-            
+
+            # Comparação em hora local do timestamp (a data formatada não tem timezone)
+            if checkout_timestamp.tzinfo is not None:
+                checkout_timestamp = checkout_timestamp.replace(tzinfo=None)
+
             # Calcular diferença
             diff = abs((checkout_timestamp.date() - formatted_date.date()).days)
-            
+
             # Verificar se precisa aprovação
-            needs_approval = self._needs_approval(checkout_timestamp, formatted_date, diff)
-            
+            needs_approval = self._needs_approval(
+                checkout_timestamp, formatted_date, diff
+            )
+
             return diff, needs_approval
-            
+
         except Exception as e:
-            print(f"Erro comparar datas: {e}")
+            logger.warning("Erro comparar datas: %s", e)
             return 0, False
-    
+
     def _parse_formatted_date(self, date_str: str) -> Optional[datetime]:
-        """Parse string de data em vários formatos"""
-        if not date_str or date_str.strip() == '':
+        """Parse string de data em vários formatos (formato inferido + cache)"""
+        if not date_str or date_str.strip() == "":
             return None
-        
-        # Formatos possíveis
-        formats = [
-            '%d/%m/%Y, %H:%M',     # 22/06/2025, 21:56
-            '%d/%m/%Y %H:%M',      # 22/06/2025 21:56
-            '%d-%m-%Y, %H:%M',     # 22-06-2025, 21:56
-            '%d-%m-%Y %H:%M',      # 22-06-2025 21:56
-            '%Y-%m-%d %H:%M:%S',   # 2025-06-22 21:56:00
-            '%Y-%m-%d %H:%M',      # 2025-06-22 21:56
-            '%d/%m/%Y',            # 22/06/2025
-            '%d-%m-%Y',            # 22-06-2025
-            '%Y-%m-%d',            # 2025-06-22
-        ]
-        
-        for fmt in formats:
-            try:
-                return datetime.strptime(date_str.strip(), fmt)
-            except ValueError:
-                continue
-        
-        print(f"Formato de data não reconhecido: {date_str}")
-        return None
-    
-    def _needs_approval(self, timestamp: datetime, formatted: datetime, days_diff: int) -> bool:
+
+        return self.parser.parse(date_str)
+
+    def _needs_approval(
+        self, timestamp: datetime, formatted: datetime, days_diff: int
+    ) -> bool:
         """
         Determina se precisa aprovação manual
-        
-        Regra: apartir de 1 dia a uma da manhã do dia seguinte
+
+        Regra: apartir de 1 dia a uma da manhã (THRESHOLD_HOUR) do dia seguinte;
+        um checkOut no dia seguinte antes dessa hora fica dentro do limite
         """
         if days_diff == 0:
             return False
-        
-        if days_diff >= 1:
+
+        if days_diff == 1 and formatted > timestamp:
             # Verificar se passou da 01:00 do dia seguinte
             next_day_threshold = timestamp.replace(
-                hour=self.THRESHOLD_HOUR, 
-                minute=0, 
-                second=0, 
-                microsecond=0
+                hour=self.THRESHOLD_HOUR, minute=0, second=0, microsecond=0
             ) + timedelta(days=1)
-            
+
             # Se a data formatada é depois da 01:00 do dia seguinte
-            if formatted >= next_day_threshold:
-                return True
-        
-        return days_diff >= 1
-    
+            return formatted >= next_day_threshold
+
+        return True
+
+    def compare_batch(self, checkout_timestamps, checkout_formatted) -> BatchComparison:
+        """
+        compare_dates para colunas inteiras (Series, arrays datetime64 ou listas)
+
+        checkout_formatted pode ser texto (parse vectorizado com o formato
+        inferido) ou já datetime64. Linhas sem timestamp ou com data
+        formatada inválida dão (0, False), como no caminho linha a linha.
+        """
+        timestamps = pd.Series(checkout_timestamps)
+        if pd.api.types.is_datetime64_any_dtype(timestamps):
+            if getattr(timestamps.dt, "tz", None) is not None:
+                timestamps = timestamps.dt.tz_localize(None)
+        else:
+            # Hora local de cada timestamp (mistura de naive/aware não é vectorizável)
+            timestamps = pd.to_datetime(timestamps.map(_wall_clock), errors="coerce")
+
+        formatted = pd.Series(checkout_formatted)
+        if not pd.api.types.is_datetime64_any_dtype(formatted):
+            formatted = self.parser.parse_series(formatted.astype(object))
+        elif getattr(formatted.dt, "tz", None) is not None:
+            formatted = formatted.dt.tz_localize(None)
+
+        ts = timestamps.to_numpy(dtype="datetime64[ns]")
+        fd = formatted.to_numpy(dtype="datetime64[ns]")
+        valid = ~(np.isnat(ts) | np.isnat(fd))
+
+        ts_day = ts.astype("datetime64[D]")
+        diff = np.abs((ts_day - fd.astype("datetime64[D]")).astype(np.int64))
+        diff[~valid] = 0
+
+        # _needs_approval: no dia seguinte ao timestamp só a partir das 01:00
+        threshold = (
+            ts_day.astype("datetime64[ns]")
+            + np.timedelta64(1, "D")
+            + np.timedelta64(self.THRESHOLD_HOUR, "h")
+        )
+        within_limit = np.zeros(len(ts), dtype=bool)
+        within_limit[valid] = (
+            (diff[valid] == 1)
+            & (fd[valid] > ts[valid])
+            & (fd[valid] < threshold[valid])
+        )
+        needs_approval = valid & (diff != 0) & ~within_limit
+
+        color_class = np.select(
+            [diff == 0, (diff == 1) & ~needs_approval],
+            ["success", "warning"],
+            default="danger",
+        ).astype(object)
+        return BatchComparison(diff, needs_approval, color_class)
+
     def get_color_class(self, days_diff: int, needs_approval: bool) -> str:
         """
         Determina classe CSS para colorir linha
-        
+
         Returns:
             'success' (verde), 'warning' (amarelo), 'danger' (vermelho)
         """
         if days_diff == 0:
-            return 'success'
+            return "success"
         elif days_diff == 1 and not needs_approval:
-            return 'warning'
+            return "warning"
         else:
-            return 'danger'
-    
+            return "danger"
+
     def format_difference_message(self, days_diff: int, needs_approval: bool) -> str:
         """Mensagem explicativa da diferença"""
         if days_diff == 0:
@@ -115,17 +432,32 @@ class DateComparator:
                 return "⚠️ Diferença de 1 dia - Dentro do limite"
         else:
             return f"❌ Diferença de {days_diff} dias - Requer aprovação"
-    
+
     def get_batch_stats(self, bookings: list) -> dict:
         """Estatísticas do lote processado"""
         total = len(bookings)
-        needs_approval = sum(1 for b in bookings if b.get('needs_approval', False))
-        perfect_match = sum(1 for b in bookings if b.get('date_difference_days', 0) == 0)
-        
+        needs_approval = sum(1 for b in bookings if b.get("needs_approval", False))
+        perfect_match = sum(
+            1 for b in bookings if b.get("date_difference_days", 0) == 0
+        )
+
+        return self._stats(total, perfect_match, needs_approval)
+
+    def batch_stats(self, comparison: BatchComparison) -> dict:
+        """get_batch_stats a partir dos arrays de compare_batch"""
+        return self._stats(
+            len(comparison.needs_approval),
+            int(np.count_nonzero(comparison.date_difference_days == 0)),
+            int(np.count_nonzero(comparison.needs_approval)),
+        )
+
+    def _stats(self, total: int, perfect_match: int, needs_approval: int) -> dict:
         return {
-            'total_bookings': total,
-            'perfect_matches': perfect_match,
-            'needs_approval': needs_approval,
-            'auto_approved': total - needs_approval,
-            'approval_rate': round((total - needs_approval) / total * 100, 2) if total > 0 else 0
+            "total_bookings": total,
+            "perfect_matches": perfect_match,
+            "needs_approval": needs_approval,
+            "auto_approved": total - needs_approval,
+            "approval_rate": round((total - needs_approval) / total * 100, 2)
+            if total > 0
+            else 0,
         }
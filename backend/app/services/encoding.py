@@ -0,0 +1,51 @@
+"""
+Codificação compacta de linhas (tuplos) para respostas JSON/NDJSON
+
+Usado quando o cliente pede uma projecção de colunas: os valores vão
+directamente para json.dumps, sem passar por modelos Pydantic.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Sequence
+
+
+def json_default(value: Any):
+    """Tipos da BD que o json da stdlib não conhece"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+
+def dumps(payload: Any) -> bytes:
+    return json.dumps(
+        payload, default=json_default, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def rows_to_objects(
+    fields: Sequence[str], rows: Sequence[Sequence[Any]]
+) -> List[Dict[str, Any]]:
+    """[{campo: valor}, ...] (colunas extra no fim das linhas são ignoradas)"""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def rows_to_columns(
+    fields: Sequence[str], rows: Sequence[Sequence[Any]]
+) -> Dict[str, List[Any]]:
+    """{campo: [valores]}: os nomes dos campos aparecem uma só vez"""
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    return {name: list(values) for name, values in zip(fields, columns)}
+
+
+def iter_ndjson(
+    fields: Sequence[str], rows: Sequence[Sequence[Any]], chunk_size: int = 1000
+) -> Iterator[bytes]:
+    """Um objecto JSON por linha, enviado em blocos de chunk_size linhas"""
+    for start in range(0, len(rows), chunk_size):
+        lines = [
+            dumps(dict(zip(fields, row))) for row in rows[start : start + chunk_size]
+        ]
+        yield b"\n".join(lines) + b"\n"
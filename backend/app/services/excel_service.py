@@ -1,145 +1,318 @@
 """
 Serviço para processar ficheiros Excel
 """
-import pandas as pd
-import openpyxl
-from datetime import datetime
-from typing import List, Dict, Any
-from fastapi import UploadFile, HTTPException
+import hashlib
 import io
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from fastapi import HTTPException, UploadFile
+
+from .metrics_service import count_rows, record_stage, stage
+
+logger = logging.getLogger(__name__)
+
 
 class ExcelProcessor:
     """Processador de ficheiros Excel do MultiPark"""
-    
+
     REQUIRED_COLUMNS = [
-        'licensePlate', 'checkoutDate', 'extraServices', 'parkingType', 
-        'checkOut', 'campaign', 'paymentMethod', 'lastname', 'name', 
-        'alocation', 'priceOnDelivery', 'campaignPay', 'bookingDate', 
-        'checkIn', 'lastName', 'bookingPrice', 'hasOnlinePayment', 
-        'stats', 'row', 'deliveryPrice', 'paymentIntentId', 'parkBrand'
+        "licensePlate",
+        "checkoutDate",
+        "extraServices",
+        "parkingType",
+        "checkOut",
+        "campaign",
+        "paymentMethod",
+        "lastname",
+        "name",
+        "alocation",
+        "priceOnDelivery",
+        "campaignPay",
+        "bookingDate",
+        "checkIn",
+        "lastName",
+        "bookingPrice",
+        "hasOnlinePayment",
+        "stats",
+        "row",
+        "deliveryPrice",
+        "paymentIntentId",
+        "parkBrand",
+    ]
+
+    # Campo do booking -> (coluna Excel, tipo), pela ordem de _process_row
+    FIELD_COLUMNS = [
+        ("license_plate", "licensePlate", "str"),
+        ("checkout_timestamp", "checkoutDate", "timestamp"),
+        ("checkout_formatted", "checkOut", "str"),
+        ("price_delivery", "priceOnDelivery", "float"),
+        ("park_brand", "parkBrand", "lower"),
+        ("payment_method", "paymentMethod", "str"),
+        ("name", "name", "str"),
+        ("lastname", "lastname", "str"),
+        ("extra_services", "extraServices", "str"),
+        ("parking_type", "parkingType", "str"),
+        ("campaign", "campaign", "str"),
+        ("alocation", "alocation", "str"),
+        ("campaign_pay", "campaignPay", "bool"),
+        ("booking_date", "bookingDate", "str"),
+        ("check_in", "checkIn", "str"),
+        ("booking_price", "bookingPrice", "float"),
+        ("has_online_payment", "hasOnlinePayment", "bool"),
+        ("stats", "stats", "str"),
+        ("row", "row", "str"),
+        ("delivery_price", "deliveryPrice", "float"),
+        ("payment_intent_id", "paymentIntentId", "str"),
     ]
-    
-    async def process_file(self, file: UploadFile) -> List[Dict[str, Any]]:
+
+    TIMESTAMP_FORMATS = ["%d/%m/%Y, %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
+    FIREBASE_SECONDS_PATTERN = r"^(?:(?!seconds=).)*seconds=\s*([+-]?\d+)\s*(?:,|.$)"
+    TRUE_STRINGS = ["true", "1", "yes", "sim"]
+
+    # Modo streaming
+    CHUNK_SIZE = 5000
+    SPOOL_BLOCK_SIZE = 1024 * 1024
+
+    # Linhas com erro guardadas com mensagem (as restantes só são contadas)
+    MAX_ROW_ERRORS = 100
+
+    def __init__(self):
+        self.row_errors: List[str] = []
+        self.row_error_count = 0
+
+    async def process_file(
+        self, file: UploadFile, vectorized: bool = True
+    ) -> List[Dict[str, Any]]:
         """
         Processa ficheiro Excel e retorna lista de bookings
+
+        Com vectorized=True a transformação é feita por coluna (transform_frame);
+        caso contrário linha a linha com _process_row.
         """
+        contents = await file.read()
+        return self.read_bookings(io.BytesIO(contents), vectorized)
+
+    def read_bookings(self, source, vectorized: bool = True) -> List[Dict[str, Any]]:
+        """Lê um ficheiro Excel (caminho ou buffer) e retorna lista de bookings"""
         try:
             # Ler ficheiro
-            contents = await file.read()
-            df = pd.read_excel(io.BytesIO(contents))
-            
+            with stage("read_excel"):
+                df = pd.read_excel(source)
+
             # Validar colunas
             self._validate_columns(df)
-            
+
             # Processar dados
-            bookings_data = []
-            for _, row in df.iterrows():
-                booking_data = self._process_row(row)
-                if booking_data:  # Skip rows vazias
-                    bookings_data.append(booking_data)
-            
+            with stage("process_rows"):
+                if vectorized:
+                    bookings_data = self.to_records(self.transform_frame(df))
+                else:
+                    bookings_data = []
+                    for index, row in df.iterrows():
+                        booking_data = self._process_row(row, line=index + 2)
+                        if booking_data:  # Skip rows vazias
+                            bookings_data.append(booking_data)
+
+            count_rows("read", len(bookings_data))
             return bookings_data
-            
+
         except Exception as e:
             raise HTTPException(
-                status_code=400, 
-                detail=f"Erro ao processar Excel: {str(e)}"
+                status_code=400, detail=f"Erro ao processar Excel: {str(e)}"
             )
-    
+
+    async def spool_upload(self, file: UploadFile) -> Tuple[str, str]:
+        """
+        Copia o upload em blocos para um ficheiro temporário
+
+        Returns:
+            (caminho, sha256 do conteúdo)
+        """
+        suffix = os.path.splitext(file.filename or "")[1] or ".xlsx"
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spool:
+            while True:
+                block = await file.read(self.SPOOL_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                spool.write(block)
+        return spool.name, digest.hexdigest()
+
+    def iter_chunks(
+        self, path: str, chunk_size: Optional[int] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Lê um .xlsx em modo read_only e produz bookings em blocos de chunk_size
+
+        Só um bloco de linhas está em memória de cada vez; cada linha passa
+        por _process_row tal como no modo em memória. A leitura de cada bloco
+        (openpyxl + _process_row) conta na etapa read_stream.
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        try:
+            workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        except Exception as e:
+            raise HTTPException(
+                status_code=400, detail=f"Erro ao processar Excel: {str(e)}"
+            )
+
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            self._validate_columns(
+                pd.DataFrame(columns=[str(col) for col in header if col is not None])
+            )
+
+            chunk = []
+            started = time.perf_counter()
+            for line, values in enumerate(rows, start=2):
+                # Células vazias como NaN, tal como em pd.read_excel
+                row = {
+                    column: (np.nan if value is None else value)
+                    for column, value in zip(header, values)
+                }
+                booking_data = self._process_row(row, line)
+                if booking_data:  # Skip rows vazias
+                    chunk.append(booking_data)
+                if len(chunk) >= chunk_size:
+                    self._chunk_read(chunk, started)
+                    yield chunk
+                    chunk = []
+                    started = time.perf_counter()
+
+            if chunk:
+                self._chunk_read(chunk, started)
+                yield chunk
+        finally:
+            workbook.close()
+
+    def _chunk_read(self, chunk: List[Dict[str, Any]], started: float):
+        record_stage("read_stream", time.perf_counter() - started)
+        count_rows("read", len(chunk))
+
     def _validate_columns(self, df: pd.DataFrame):
         """Validar se Excel tem colunas necessárias"""
-        missing_columns = [col for col in self.REQUIRED_COLUMNS if col not in df.columns]
-        
+        missing_columns = [
+            col for col in self.REQUIRED_COLUMNS if col not in df.columns
+        ]
+
         if missing_columns:
             raise HTTPException(
                 status_code=400,
-                detail=f"Colunas em falta no Excel: {', '.join(missing_columns)}"
+                detail=f"Colunas em falta no Excel: {', '.join(missing_columns)}",
             )
-    
-    def _process_row(self, row: pd.Series) -> Dict[str, Any]:
-        """Processar uma linha do Excel"""
+
+    def _process_row(
+        self, row: pd.Series, line: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Processar uma linha do Excel (line: número da linha na folha, para os erros)"""
         try:
             # Skip se não tem matrícula
-            if pd.isna(row['licensePlate']) or not row['licensePlate']:
+            if pd.isna(row["licensePlate"]) or not row["licensePlate"]:
                 return None
-            
+
             # Processar timestamp checkout
-            checkout_timestamp = self._parse_timestamp(row['checkoutDate'])
-            
+            checkout_timestamp = self._parse_timestamp(row["checkoutDate"])
+
             return {
-                'license_plate': str(row['licensePlate']).strip(),
-                'checkout_timestamp': checkout_timestamp,
-                'checkout_formatted': str(row.get('checkOut', '')).strip(),
-                'price_delivery': self._safe_float(row.get('priceOnDelivery', 0)),
-                'park_brand': str(row.get('parkBrand', '')).strip().lower(),
-                'payment_method': str(row.get('paymentMethod', '')).strip(),
-                'name': str(row.get('name', '')).strip(),
-                'lastname': str(row.get('lastname', '')).strip(),
-                'extra_services': str(row.get('extraServices', '')).strip(),
-                'parking_type': str(row.get('parkingType', '')).strip(),
-                'campaign': str(row.get('campaign', '')).strip(),
-                'alocation': str(row.get('alocation', '')).strip(),
-                'campaign_pay': self._safe_bool(row.get('campaignPay')),
-                'booking_date': str(row.get('bookingDate', '')).strip(),
-                'check_in': str(row.get('checkIn', '')).strip(),
-                'booking_price': self._safe_float(row.get('bookingPrice', 0)),
-                'has_online_payment': self._safe_bool(row.get('hasOnlinePayment')),
-                'stats': str(row.get('stats', '')).strip(),
-                'row': str(row.get('row', '')).strip(),
-                'delivery_price': self._safe_float(row.get('deliveryPrice', 0)),
-                'payment_intent_id': str(row.get('paymentIntentId', '')).strip()
+                "license_plate": str(row["licensePlate"]).strip(),
+                "checkout_timestamp": checkout_timestamp,
+                "checkout_formatted": str(row.get("checkOut", "")).strip(),
+                "price_delivery": self._safe_float(row.get("priceOnDelivery", 0)),
+                "park_brand": str(row.get("parkBrand", "")).strip().lower(),
+                "payment_method": str(row.get("paymentMethod", "")).strip(),
+                "name": str(row.get("name", "")).strip(),
+                "lastname": str(row.get("lastname", "")).strip(),
+                "extra_services": str(row.get("extraServices", "")).strip(),
+                "parking_type": str(row.get("parkingType", "")).strip(),
+                "campaign": str(row.get("campaign", "")).strip(),
+                "alocation": str(row.get("alocation", "")).strip(),
+                "campaign_pay": self._safe_bool(row.get("campaignPay")),
+                "booking_date": str(row.get("bookingDate", "")).strip(),
+                "check_in": str(row.get("checkIn", "")).strip(),
+                "booking_price": self._safe_float(row.get("bookingPrice", 0)),
+                "has_online_payment": self._safe_bool(row.get("hasOnlinePayment")),
+                "stats": str(row.get("stats", "")).strip(),
+                "row": str(row.get("row", "")).strip(),
+                "delivery_price": self._safe_float(row.get("deliveryPrice", 0)),
+                "payment_intent_id": str(row.get("paymentIntentId", "")).strip(),
             }
-            
+
         except Exception as e:
-            print(f"Erro a processar linha: {e}")
+            logger.warning("Erro a processar linha: %s", e, extra={"line": line})
+            self._row_error(line, e)
             return None
-    
+
+    def _row_error(self, line: Optional[int], error: Exception):
+        self.row_error_count += 1
+        if len(self.row_errors) < self.MAX_ROW_ERRORS:
+            self.row_errors.append(f"Linha {line}: {error}" if line else str(error))
+
+    def error_messages(self) -> List[str]:
+        """Erros das linhas ignoradas (até MAX_ROW_ERRORS e o total das restantes)"""
+        messages = list(self.row_errors)
+        if self.row_error_count > len(messages):
+            messages.append(
+                f"... e mais {self.row_error_count - len(messages)} linhas com erro"
+            )
+        return messages
+
     def _parse_timestamp(self, timestamp_value) -> datetime:
         """
-        Parse timestamp do Firebase formato: 
+        Parse timestamp do Firebase formato:
         Timestamp(seconds=1750625764, nanoseconds=637000000)
         """
         try:
             if pd.isna(timestamp_value):
                 return None
-                
+
             timestamp_str = str(timestamp_value)
-            
+
             # Se já é datetime
             if isinstance(timestamp_value, datetime):
                 return timestamp_value
-            
+
             # Parse Firebase timestamp
-            if 'Timestamp(' in timestamp_str:
+            if "Timestamp(" in timestamp_str:
                 # Extract seconds
-                start = timestamp_str.find('seconds=') + 8
-                end = timestamp_str.find(',', start)
+                start = timestamp_str.find("seconds=") + 8
+                end = timestamp_str.find(",", start)
                 seconds = int(timestamp_str[start:end])
-                
+
                 return datetime.fromtimestamp(seconds)
-            
+
             # Parse string data normal
-            for fmt in ['%d/%m/%Y, %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']:
+            for fmt in self.TIMESTAMP_FORMATS:
                 try:
                     return datetime.strptime(timestamp_str, fmt)
                 except ValueError:
                     continue
-            
+
             return None
-            
+
         except Exception as e:
-            print(f"Erro parse timestamp {timestamp_value}: {e}")
+            logger.warning("Erro parse timestamp %s: %s", timestamp_value, e)
             return None
-    
+
     def _safe_float(self, value) -> float:
         """Converter para float seguro"""
         try:
-            if pd.isna(value) or value == '':
+            if pd.isna(value) or value == "":
                 return 0.0
             return float(value)
         except (ValueError, TypeError):
             return 0.0
-    
+
     def _safe_bool(self, value) -> bool:
         """Converter para bool seguro"""
         try:
@@ -148,28 +321,189 @@ class ExcelProcessor:
             if isinstance(value, bool):
                 return value
             if isinstance(value, str):
-                return value.lower() in ['true', '1', 'yes', 'sim']
+                return value.lower() in ["true", "1", "yes", "sim"]
             return bool(value)
         except (ValueError, TypeError):
             return False
-    
+
+    def transform_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Transformação colunar equivalente a _process_row
+
+        Cada coluna é limpa/convertida numa única operação vectorizada.
+        Devolve um DataFrame (NumPy) só com as linhas que têm matrícula,
+        com as colunas de booking pela mesma ordem de _process_row.
+        """
+        plates = df["licensePlate"]
+        keep = plates.notna() & plates.astype(bool)
+        source = df[keep]
+
+        columns = {}
+        for field, column, kind in self.FIELD_COLUMNS:
+            values = source[column]
+            if kind == "str":
+                columns[field] = self._str_column(values)
+            elif kind == "lower":
+                columns[field] = self._str_column(values).str.lower()
+            elif kind == "float":
+                columns[field] = self._float_column(values)
+            elif kind == "bool":
+                columns[field] = self._bool_column(values)
+            else:
+                columns[field] = self._timestamp_column(values)
+
+        return pd.DataFrame(columns, index=source.index)
+
+    def to_records(self, frame: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Converte o lote colunar para a lista de dicts usada na ingestão"""
+        return frame.to_dict("records")
+
+    def _str_column(self, values: pd.Series) -> pd.Series:
+        """str(valor).strip() por coluna"""
+        if pd.api.types.is_datetime64_any_dtype(
+            values
+        ) or pd.api.types.is_timedelta64_dtype(values):
+            values = values.map(str)  # astype(str) omite a hora quando é 00:00
+        return values.astype(str).str.strip()
+
+    def _float_column(self, values: pd.Series) -> pd.Series:
+        """Equivalente vectorizado de _safe_float"""
+        if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(
+            values
+        ):
+            values = pd.to_numeric(values.replace("", np.nan), errors="coerce")
+        return values.astype(float).fillna(0.0)
+
+    def _bool_column(self, values: pd.Series) -> pd.Series:
+        """Equivalente vectorizado de _safe_bool"""
+        if pd.api.types.is_bool_dtype(values):
+            return values.astype(bool)
+
+        present = values.notna()
+        if pd.api.types.is_numeric_dtype(values):
+            return present & values.fillna(0).astype(bool)
+
+        result = present & values.astype(bool)
+        if pd.api.types.infer_dtype(values, skipna=True) in (
+            "string",
+            "mixed",
+            "mixed-integer",
+        ):
+            lowered = values.str.lower()
+            is_str = lowered.notna()
+            result = result.where(~is_str, lowered.isin(self.TRUE_STRINGS))
+        return result.astype(bool)
+
+    def _timestamp_column(self, values: pd.Series) -> pd.Series:
+        """
+        Equivalente vectorizado de _parse_timestamp
+
+        Os segundos dos Timestamp(seconds=...) do Firebase são extraídos com
+        uma única regex sobre a coluna; as restantes strings passam pelos
+        TIMESTAMP_FORMATS com pd.to_datetime.
+        """
+        result = pd.Series([None] * len(values), index=values.index, dtype=object)
+        if len(values) == 0:
+            return result
+
+        if pd.api.types.is_datetime64_any_dtype(values):
+            present = values.notna()
+            result[present] = self._datetime_objects(values[present])
+            return result
+
+        present = values.notna()
+        is_datetime = present & values.map(lambda v: isinstance(v, datetime))
+        if is_datetime.any():
+            result[is_datetime] = values[is_datetime].map(
+                lambda v: v.to_pydatetime() if isinstance(v, pd.Timestamp) else v
+            )
+
+        pending = present & ~is_datetime
+        if not pending.any():
+            return result
+
+        text = values[pending].astype(str)
+        is_firebase = text.str.contains("Timestamp(", regex=False)
+
+        firebase = text[is_firebase]
+        if len(firebase):
+            seconds = pd.to_numeric(
+                firebase.str.extract(self.FIREBASE_SECONDS_PATTERN, flags=re.DOTALL)[0],
+                errors="coerce",
+            ).dropna()
+            if len(seconds):
+                result[seconds.index] = self._from_epoch_seconds(
+                    seconds.astype("int64")
+                )
+
+        other = text[~is_firebase]
+        if len(other):
+            parsed = pd.Series(pd.NaT, index=other.index, dtype="datetime64[ns]")
+            for fmt in self.TIMESTAMP_FORMATS:
+                missing = parsed.isna()
+                if not missing.any():
+                    break
+                parsed[missing] = pd.to_datetime(
+                    other[missing], format=fmt, errors="coerce"
+                )
+            parsed = parsed.dropna()
+            if len(parsed):
+                result[parsed.index] = self._datetime_objects(parsed)
+
+        return result
+
+    def _from_epoch_seconds(self, seconds: pd.Series) -> pd.Series:
+        """datetime.fromtimestamp por coluna (hora local, naive)"""
+        if time.timezone == 0 and not time.daylight:
+            converted = pd.to_datetime(seconds, unit="s", errors="coerce").dropna()
+            return self._datetime_objects(converted)
+
+        # Fuso horário local com DST: conversão exacta por valor distinto
+        unique = {value: self._safe_fromtimestamp(value) for value in seconds.unique()}
+        return seconds.map(unique).astype(object)
+
+    def _datetime_objects(self, values: pd.Series) -> pd.Series:
+        """datetime64 -> objectos datetime do Python numa só conversão NumPy"""
+        if getattr(values.dtype, "tz", None) is not None:
+            return values.astype(object)
+        converted = values.to_numpy(dtype="datetime64[us]").astype(object)
+        return pd.Series(converted, index=values.index, dtype=object)
+
+    def _safe_fromtimestamp(self, seconds: int):
+        try:
+            return datetime.fromtimestamp(int(seconds))
+        except (ValueError, OverflowError, OSError):
+            return None
+
     def get_summary(self, bookings_data: List[Dict]) -> Dict[str, Any]:
         """Sumário dos dados processados"""
         if not bookings_data:
             return {
-                'total_records': 0,
-                'total_amount': 0,
-                'unique_brands': [],
-                'payment_methods': []
+                "total_records": 0,
+                "total_amount": 0,
+                "unique_brands": [],
+                "payment_methods": [],
             }
-        
-        total_amount = sum(booking['price_delivery'] for booking in bookings_data)
-        unique_brands = list(set(booking['park_brand'] for booking in bookings_data if booking['park_brand']))
-        payment_methods = list(set(booking['payment_method'] for booking in bookings_data if booking['payment_method']))
-        
+
+        total_amount = sum(booking["price_delivery"] for booking in bookings_data)
+        unique_brands = list(
+            set(
+                booking["park_brand"]
+                for booking in bookings_data
+                if booking["park_brand"]
+            )
+        )
+        payment_methods = list(
+            set(
+                booking["payment_method"]
+                for booking in bookings_data
+                if booking["payment_method"]
+            )
+        )
+
         return {
-            'total_records': len(bookings_data),
-            'total_amount': total_amount,
-            'unique_brands': unique_brands,
-            'payment_methods': payment_methods
+            "total_records": len(bookings_data),
+            "total_amount": total_amount,
+            "unique_brands": unique_brands,
+            "payment_methods": payment_methods,
         }
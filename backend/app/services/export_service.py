@@ -0,0 +1,185 @@
+"""
+Exportação de bookings com os seus splits em CSV, Parquet ou Arrow IPC
+
+O resultado (bookings LEFT JOIN financial_splits, com os filtros de
+BookingFilters, por ordem de id) é lido em blocos com yield_per, que em
+PostgreSQL usa um cursor do lado do servidor. Cada bloco é codificado e
+enviado logo, por isso a memória fica constante e os primeiros bytes
+saem antes de a query terminar.
+
+Parquet e Arrow precisam do pyarrow (opcional); sem ele só há CSV.
+"""
+import csv
+import io
+from datetime import date, datetime
+from typing import Any, Iterator, List, Sequence
+
+from sqlalchemy import select
+from sqlmodel import Session
+
+from ..models import Booking, BookingFilters, ExportFormat, FinancialSplit
+from .filters import booking_conditions
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende do ambiente
+    pa = pq = None
+
+SPLIT_COLUMNS = [
+    "partner_bps",
+    "total_amount",
+    "partner_amount_60",
+    "multipark_amount_40",
+]
+
+MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv; charset=utf-8",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+    ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+}
+
+EXTENSIONS = {
+    ExportFormat.CSV: "csv",
+    ExportFormat.PARQUET: "parquet",
+    ExportFormat.ARROW: "arrows",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Ficheiro só de escrita que guarda os bytes até serem enviados (tell() conta tudo o que foi escrito)"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _python_type(column) -> type:
+    try:
+        return column.type.python_type
+    except NotImplementedError:  # AutoString do SQLModel
+        return str
+
+
+class BookingExportService:
+    """Colunas de bookings + colunas do split, em blocos de CHUNK_SIZE linhas"""
+
+    CHUNK_SIZE = 5000
+
+    def __init__(self, chunk_size: int = None):
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        bookings = Booking.__table__
+        splits = FinancialSplit.__table__
+        self.columns = [*bookings.c, *[splits.c[name] for name in SPLIT_COLUMNS]]
+        self.fields = [column.name for column in self.columns]
+
+    @staticmethod
+    def available(export_format: ExportFormat) -> bool:
+        return export_format == ExportFormat.CSV or pa is not None
+
+    def filename(self, export_format: ExportFormat) -> str:
+        return f"bookings_{datetime.utcnow():%Y%m%d_%H%M%S}.{EXTENSIONS[export_format]}"
+
+    def iter_chunks(
+        self, session: Session, filters: BookingFilters
+    ) -> Iterator[Sequence[Sequence[Any]]]:
+        """Blocos de linhas lidos do cursor (nunca o resultado inteiro)"""
+        bookings = Booking.__table__
+        splits = FinancialSplit.__table__
+        query = (
+            select(*self.columns)
+            .select_from(
+                bookings.outerjoin(splits, splits.c.booking_id == bookings.c.id)
+            )
+            .where(*booking_conditions(filters, bookings))
+            .order_by(bookings.c.id)
+            .execution_options(yield_per=self.chunk_size)
+        )
+        result = session.execute(query)
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+    def stream(
+        self, session: Session, filters: BookingFilters, export_format: ExportFormat
+    ) -> Iterator[bytes]:
+        chunks = self.iter_chunks(session, filters)
+        if export_format == ExportFormat.CSV:
+            return self._csv(chunks)
+        if export_format == ExportFormat.PARQUET:
+            return self._parquet(chunks)
+        return self._arrow(chunks)
+
+    def _csv(self, chunks: Iterator[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.fields)
+        for rows in chunks:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")  # Só o cabeçalho (sem linhas)
+
+    def _arrow(self, chunks: Iterator[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+        schema = self.arrow_schema()
+        sink = _ChunkSink()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for rows in chunks:
+                writer.write_batch(self._record_batch(schema, rows))
+                yield sink.drain()
+        yield sink.drain()
+
+    def _parquet(self, chunks: Iterator[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+        """Um row group por bloco; o rodapé vai no fim"""
+        schema = self.arrow_schema()
+        sink = _ChunkSink()
+        with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+            for rows in chunks:
+                writer.write_batch(self._record_batch(schema, rows))
+                yield sink.drain()
+        yield sink.drain()
+
+    def arrow_schema(self):
+        types = {
+            int: pa.int64(),
+            float: pa.float64(),
+            bool: pa.bool_(),
+            datetime: pa.timestamp("us"),
+            date: pa.date32(),
+        }
+        return pa.schema(
+            [
+                pa.field(column.name, types.get(_python_type(column), pa.string()))
+                for column in self.columns
+            ]
+        )
+
+    def _record_batch(self, schema, rows: Sequence[Sequence[Any]]):
+        columns = list(zip(*rows))
+        return pa.RecordBatch.from_arrays(
+            [
+                pa.array(values, type=field.type)
+                for values, field in zip(columns, schema)
+            ],
+            schema=schema,
+        )
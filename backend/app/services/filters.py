@@ -0,0 +1,76 @@
+"""
+Filtros de bookings (BookingFilters) traduzidos para condições SQL e
+cursores opacos para paginação keyset
+"""
+import base64
+import json
+from datetime import date, datetime, time, timezone
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from ..models import Booking, BookingFilters
+
+
+def utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Datas com timezone -> UTC sem timezone (como são guardadas)"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def is_day_aligned(value: Optional[datetime]) -> bool:
+    """Limite que coincide com a meia-noite UTC (ou ausente)"""
+    return value is None or utc_naive(value).time() == time(0)
+
+
+def booking_conditions(filters: BookingFilters, table=None) -> List:
+    """
+    Condições WHERE para os campos de BookingFilters
+
+    date_from/date_to filtram checkout_timestamp no intervalo [date_from, date_to);
+    min_amount/max_amount filtram price_delivery (inclusivos).
+    """
+    table = table if table is not None else Booking.__table__
+    conditions = []
+
+    if filters.park_brand is not None:
+        conditions.append(table.c.park_brand == filters.park_brand)
+    if filters.payment_method is not None:
+        conditions.append(table.c.payment_method == filters.payment_method)
+    if filters.needs_approval is not None:
+        conditions.append(table.c.needs_approval == filters.needs_approval)
+    if filters.status_approved is not None:
+        conditions.append(table.c.status_approved == filters.status_approved)
+    if filters.date_from is not None:
+        conditions.append(table.c.checkout_timestamp >= utc_naive(filters.date_from))
+    if filters.date_to is not None:
+        conditions.append(table.c.checkout_timestamp < utc_naive(filters.date_to))
+    if filters.min_amount is not None:
+        conditions.append(table.c.price_delivery >= filters.min_amount)
+    if filters.max_amount is not None:
+        conditions.append(table.c.price_delivery <= filters.max_amount)
+
+    return conditions
+
+
+def encode_cursor(values: list) -> str:
+    """Chave do último item de uma página -> cursor opaco (base64 de JSON)"""
+    raw = json.dumps(
+        [
+            value.isoformat() if isinstance(value, (date, datetime)) else value
+            for value in values
+        ]
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Valores JSON do cursor (datas continuam em texto ISO)"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
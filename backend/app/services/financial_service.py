@@ -1,161 +1,321 @@
 """
 Serviço para cálculos financeiros 60/40
 """
-from typing import Tuple, Dict, List
-from decimal import Decimal, ROUND_HALF_UP
+import heapq
 from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+
+CENT = Decimal("0.01")
+
+# Valores até 1e10 com <= 4 casas decimais são inteiros exactos em float64 (x 10^4)
+# e x partner_bps (<= 10000) ainda cabe em int64
+EXACT_LIMIT = 1e10
+
+# Divisão por omissão (sem regras em split_rules): 60% parceiro
+DEFAULT_PARTNER_BPS = 6000
+
+
+class SplitCents(NamedTuple):
+    """Divisão de um lote em cêntimos (int64); partner + multipark == total"""
+
+    total: np.ndarray
+    partner: np.ndarray
+    multipark: np.ndarray
+
 
 class FinancialCalculator:
-    """Calculadora para divisão financeira Parceiro/Multipark"""
-    
-    PARTNER_PERCENTAGE = Decimal('0.60')  # 60%
-    MULTIPARK_PERCENTAGE = Decimal('0.40')  # 40%
-    
-    def calculate_split(self, amount: float) -> Tuple[float, float]:
+    """
+    Calculadora para divisão financeira Parceiro/Multipark
+
+    A parte do parceiro vem em pontos base (partner_bps); por omissão 60/40.
+    Com rules (SplitRuleSet) cada booking usa a regra da sua marca e data.
+    """
+
+    PARTNER_PERCENTAGE = Decimal("0.60")  # 60%
+    MULTIPARK_PERCENTAGE = Decimal("0.40")  # 40%
+
+    def __init__(self, rules=None):
+        self.rules = rules
+
+    def calculate_split(
+        self, amount: float, partner_bps: int = DEFAULT_PARTNER_BPS
+    ) -> Tuple[float, float]:
         """
-        Calcula divisão 60% Parceiro / 40% Multipark
-        
+        Calcula divisão 60% Parceiro / 40% Multipark (ou partner_bps)
+
         Args:
             amount: Valor em priceOnDelivery
-            
+
         Returns:
             (partner_60_percent, multipark_40_percent)
         """
-        if amount <= 0:
-            return 0.0, 0.0
-        
-        # Usar Decimal para precisão
-        total = Decimal(str(amount))
-        
-        partner_amount = (total * self.PARTNER_PERCENTAGE).quantize(
-            Decimal('0.01'), rounding=ROUND_HALF_UP
+        _, partner, multipark = self._split_decimal(amount, partner_bps)
+        return partner / 100, multipark / 100
+
+    def calculate_splits(
+        self, amounts: Iterable[float], partner_bps=DEFAULT_PARTNER_BPS
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """calculate_split para um lote inteiro: (partner, multipark) em euros"""
+        split = self.split_cents(amounts, partner_bps)
+        return split.partner / 100, split.multipark / 100
+
+    def split_cents(
+        self, amounts: Iterable[float], partner_bps=DEFAULT_PARTNER_BPS
+    ) -> SplitCents:
+        """
+        Divisão vectorizada em cêntimos inteiros, com os resultados de
+        calculate_split (ROUND_HALF_UP sobre Decimal(str(amount)))
+
+        Cada valor é convertido para décimos de milésimo inteiros; o parceiro
+        é arredondado (half-up) e a Multipark recebe o resto, por isso
+        partner + multipark é sempre o total arredondado ao cêntimo. Valores
+        com mais de 4 casas decimais (ou não finitos) seguem o caminho Decimal.
+        partner_bps: um valor para o lote ou um por booking.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        partner_bps = np.broadcast_to(
+            np.asarray(partner_bps, dtype=np.int64), amounts.shape
         )
-        multipark_amount = (total * self.MULTIPARK_PERCENTAGE).quantize(
-            Decimal('0.01'), rounding=ROUND_HALF_UP
+        units = np.rint(amounts * 10000)
+        with np.errstate(invalid="ignore"):
+            exact = (np.abs(amounts) < EXACT_LIMIT) & (units / 10000 == amounts)
+        units = np.where(exact, units, 0).astype(np.int64)
+
+        # Half-up (para longe de zero, como ROUND_HALF_UP) de 1e-4 para cêntimos
+        total = np.sign(units) * ((np.abs(units) + 50) // 100)
+        positive = units > 0
+        partner = np.where(positive, (units * partner_bps + 500000) // 1000000, 0)
+        multipark = np.where(positive, total - partner, 0)
+
+        for index in np.flatnonzero(~exact):
+            total[index], partner[index], multipark[index] = self._split_decimal(
+                float(amounts[index]), int(partner_bps[index])
+            )
+        return SplitCents(total, partner, multipark)
+
+    def _split_decimal(
+        self, amount: float, partner_bps: int = DEFAULT_PARTNER_BPS
+    ) -> Tuple[int, int, int]:
+        """(total, partner, multipark) em cêntimos com Decimal; valores <= 0 não são divididos"""
+        total = int(Decimal(str(amount)).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+        if amount <= 0:
+            return total, 0, 0
+
+        partner = (Decimal(str(amount)) * Decimal(partner_bps) / 10000).quantize(
+            CENT, rounding=ROUND_HALF_UP
         )
-        
-        return float(partner_amount), float(multipark_amount)
-    
-    def calculate_batch_totals(self, bookings: List[dict]) -> Dict[str, float]:
+        partner = int(partner * 100)
+        return total, partner, total - partner
+
+    def calculate_batch_totals(self, bookings: Iterable[Mapping]) -> Dict[str, float]:
         """
         Calcula totais para um lote de bookings
         """
-        total_amount = 0.0
-        total_partner = 0.0
-        total_multipark = 0.0
-        
-        for booking in bookings:
-            amount = booking.get('price_delivery', 0)
-            partner, multipark = self.calculate_split(amount)
-            
-            total_amount += amount
-            total_partner += partner
-            total_multipark += multipark
-        
-        return {
-            'total_amount': round(total_amount, 2),
-            'partner_60_percent': round(total_partner, 2),
-            'multipark_40_percent': round(total_multipark, 2),
-            'count_bookings': len(bookings)
-        }
-    
-    def get_breakdown_by_brand(self, bookings: List[dict]) -> Dict[str, Dict]:
+        return FinancialReportBuilder(self).consume(bookings).summary()
+
+    def get_breakdown_by_brand(self, bookings: Iterable[Mapping]) -> Dict[str, Dict]:
         """
         Breakdown financeiro por park_brand
         """
-        breakdown = {}
-        
-        for booking in bookings:
-            brand = booking.get('park_brand', 'unknown')
-            amount = booking.get('price_delivery', 0)
-            
-            if brand not in breakdown:
-                breakdown[brand] = {
-                    'total_amount': 0.0,
-                    'partner_60': 0.0,
-                    'multipark_40': 0.0,
-                    'count': 0
-                }
-            
-            partner, multipark = self.calculate_split(amount)
-            breakdown[brand]['total_amount'] += amount
-            breakdown[brand]['partner_60'] += partner
-            breakdown[brand]['multipark_40'] += multipark
-            breakdown[brand]['count'] += 1
-        
-        # Round values
-        for brand_data in breakdown.values():
-            brand_data['total_amount'] = round(brand_data['total_amount'], 2)
-            brand_data['partner_60'] = round(brand_data['partner_60'], 2)
-            brand_data['multipark_40'] = round(brand_data['multipark_40'], 2)
-        
-        return breakdown
-    
-    def get_breakdown_by_payment_method(self, bookings: List[dict]) -> Dict[str, Dict]:
+        return FinancialReportBuilder(self).consume(bookings).breakdown("park_brand")
+
+    def get_breakdown_by_payment_method(
+        self, bookings: Iterable[Mapping]
+    ) -> Dict[str, Dict]:
         """
         Breakdown financeiro por payment_method
         """
-        breakdown = {}
-        
-        for booking in bookings:
-            method = booking.get('payment_method', 'unknown')
-            amount = booking.get('price_delivery', 0)
-            
-            if method not in breakdown:
-                breakdown[method] = {
-                    'total_amount': 0.0,
-                    'partner_60': 0.0,
-                    'multipark_40': 0.0,
-                    'count': 0
-                }
-            
-            partner, multipark = self.calculate_split(amount)
-            breakdown[method]['total_amount'] += amount
-            breakdown[method]['partner_60'] += partner
-            breakdown[method]['multipark_40'] += multipark
-            breakdown[method]['count'] += 1
-        
-        # Round values
-        for method_data in breakdown.values():
-            method_data['total_amount'] = round(method_data['total_amount'], 2)
-            method_data['partner_60'] = round(method_data['partner_60'], 2)
-            method_data['multipark_40'] = round(method_data['multipark_40'], 2)
-        
-        return breakdown
-    
-    def validate_split_accuracy(self, original_amount: float, partner: float, multipark: float) -> bool:
+        return (
+            FinancialReportBuilder(self).consume(bookings).breakdown("payment_method")
+        )
+
+    def _split_bookings(
+        self, bookings: Sequence[Mapping]
+    ) -> Tuple[np.ndarray, SplitCents]:
+        """Valores (price_delivery) e divisão de todos os bookings numa só passagem"""
+        amounts = np.array(
+            [booking.get("price_delivery", 0) for booking in bookings], dtype=np.float64
+        )
+        partner_bps = (
+            self.rules.resolve_bookings(bookings)
+            if self.rules is not None
+            else DEFAULT_PARTNER_BPS
+        )
+        return amounts, self.split_cents(amounts, partner_bps)
+
+    def validate_split_accuracy(
+        self, original_amount: float, partner: float, multipark: float
+    ) -> bool:
         """
         Valida se a divisão está correta (sem perda de precisão)
+
+        split_cents/calculate_split já garantem partner + multipark igual ao
+        total arredondado ao cêntimo; mantido para validar dados externos.
         """
         total_split = partner + multipark
         return abs(original_amount - total_split) < 0.01  # Tolerância de 1 cêntimo
-    
-    def generate_financial_report(self, bookings: List[dict]) -> Dict[str, any]:
+
+    def generate_financial_report(
+        self, bookings: Iterable[Mapping], chunk_size: int = 10000
+    ) -> Dict[str, Any]:
         """
         Gera relatório financeiro completo
+
+        Uma só passagem sobre bookings (lista ou iterador, p.ex. um cursor
+        session.execute(...).mappings() com yield_per), em blocos de chunk_size.
         """
-        batch_totals = self.calculate_batch_totals(bookings)
-        brand_breakdown = self.get_breakdown_by_brand(bookings)
-        payment_breakdown = self.get_breakdown_by_payment_method(bookings)
-        
-        # Top performers
-        top_brands = sorted(
-            brand_breakdown.items(), 
-            key=lambda x: x[1]['total_amount'], 
-            reverse=True
-        )[:5]
-        
-        top_payment_methods = sorted(
-            payment_breakdown.items(), 
-            key=lambda x: x[1]['total_amount'], 
-            reverse=True
-        )[:5]
-        
+        return FinancialReportBuilder(self).consume(bookings, chunk_size).report()
+
+
+class FinancialReportBuilder:
+    """
+    Acumulador do relatório financeiro, alimentado por blocos de bookings
+
+    Cada bloco é dividido (split_cents) e agrupado uma vez por marca x
+    método de pagamento; os totais por marca, por método e o resumo saem
+    desse cross-tab. Parceiro/Multipark são somados em cêntimos inteiros.
+    """
+
+    TOP_N = 5
+
+    def __init__(self, calculator: Optional[FinancialCalculator] = None):
+        self.calculator = calculator or FinancialCalculator()
+        # chave -> [total_amount, partner_cents, multipark_cents, count]
+        self.cross: Dict[Tuple[Any, Any], List] = {}
+        self.groups: Dict[str, Dict[Any, List]] = {
+            "park_brand": {},
+            "payment_method": {},
+        }
+        self.totals = [0.0, 0, 0, 0]
+
+    def consume(
+        self, bookings: Iterable[Mapping], chunk_size: int = 10000
+    ) -> "FinancialReportBuilder":
+        """Acumula todos os bookings do iterável, chunk_size de cada vez"""
+        rows = iter(bookings)
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+            self.add(chunk)
+        return self
+
+    def add(self, bookings: Sequence[Mapping]):
+        """Acumula um bloco de bookings"""
+        if not bookings:
+            return
+        amounts, split = self.calculator._split_bookings(bookings)
+
+        pairs: Dict[Tuple[Any, Any], int] = {}
+        codes = np.array(
+            [
+                pairs.setdefault(
+                    (
+                        booking.get("park_brand", "unknown"),
+                        booking.get("payment_method", "unknown"),
+                    ),
+                    len(pairs),
+                )
+                for booking in bookings
+            ],
+            dtype=np.int64,
+        )
+        size = len(pairs)
+        totals = np.bincount(codes, weights=amounts, minlength=size)
+        partner = np.bincount(
+            codes, weights=split.partner, minlength=size
+        )  # Cêntimos < 2^53: exactos
+        multipark = np.bincount(codes, weights=split.multipark, minlength=size)
+        counts = np.bincount(codes, minlength=size)
+
+        for (brand, method), index in pairs.items():
+            values = (
+                float(totals[index]),
+                int(partner[index]),
+                int(multipark[index]),
+                int(counts[index]),
+            )
+            for group, key in (
+                (self.cross, (brand, method)),
+                (self.groups["park_brand"], brand),
+                (self.groups["payment_method"], method),
+            ):
+                _accumulate(group.setdefault(key, [0.0, 0, 0, 0]), values)
+        _accumulate(
+            self.totals,
+            (
+                float(amounts.sum()),
+                int(split.partner.sum()),
+                int(split.multipark.sum()),
+                len(amounts),
+            ),
+        )
+
+    def summary(self) -> Dict[str, float]:
+        total, partner, multipark, count = self.totals
+        return {
+            "total_amount": round(total, 2),
+            "partner_60_percent": round(partner / 100, 2),
+            "multipark_40_percent": round(multipark / 100, 2),
+            "count_bookings": count,
+        }
+
+    def breakdown(self, field: str) -> Dict[Any, Dict]:
+        """Por park_brand ou payment_method, pela ordem da primeira ocorrência"""
+        return {
+            key: _breakdown_row(values) for key, values in self.groups[field].items()
+        }
+
+    def cross_tab(self) -> Dict[Any, Dict[Any, Dict]]:
+        """{marca: {método: totais}}"""
+        table: Dict[Any, Dict[Any, Dict]] = {}
+        for (brand, method), values in self.cross.items():
+            table.setdefault(brand, {})[method] = _breakdown_row(values)
+        return table
+
+    def report(self) -> Dict[str, Any]:
+        brand_breakdown = self.breakdown("park_brand")
+        payment_breakdown = self.breakdown("payment_method")
         return {
-            'summary': batch_totals,
-            'by_brand': brand_breakdown,
-            'by_payment_method': payment_breakdown,
-            'top_brands': dict(top_brands),
-            'top_payment_methods': dict(top_payment_methods),
-            'generated_at': str(datetime.utcnow())
+            "summary": self.summary(),
+            "by_brand": brand_breakdown,
+            "by_payment_method": payment_breakdown,
+            "by_brand_and_payment_method": self.cross_tab(),
+            "top_brands": self._top(brand_breakdown),
+            "top_payment_methods": self._top(payment_breakdown),
+            "generated_at": str(datetime.utcnow()),
         }
+
+    def _top(self, breakdown: Dict[Any, Dict]) -> Dict[Any, Dict]:
+        """Top-N por total_amount (heap; empates pela ordem de ocorrência, como sorted)"""
+        return dict(
+            heapq.nlargest(
+                self.TOP_N, breakdown.items(), key=lambda item: item[1]["total_amount"]
+            )
+        )
+
+
+def _accumulate(target: List, values: Tuple):
+    for index, value in enumerate(values):
+        target[index] += value
+
+
+def _breakdown_row(values: List) -> Dict[str, Any]:
+    total, partner, multipark, count = values
+    return {
+        "total_amount": round(total, 2),
+        "partner_60": round(partner / 100, 2),
+        "multipark_40": round(multipark / 100, 2),
+        "count": count,
+    }
@@ -0,0 +1,577 @@
+"""
+Serviço de ingestão em lote de bookings e divisões financeiras
+"""
+import io
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import bindparam, insert, or_, select, text, update
+from sqlmodel import Session
+
+from ..database import dialect_insert
+from ..models import Booking, BookingBase, ExcelUpload, FinancialSplit, SplitWriteMode
+from .analytics_service import touch_bookings
+from .cache_service import mark_changed
+from .date_service import DateComparator
+from .financial_service import FinancialCalculator
+from .metrics_service import count_rows, stage
+from .rollup_service import (
+    RollupDelta,
+    RollupService,
+    contribution_delta,
+    contributions,
+)
+from .split_rules import split_rule_cache
+from .split_service import split_write_mode
+
+# Colunas que definem o conteúdo de um booking (comparadas no re-upload)
+DATA_COLUMNS = list(BookingBase.__fields__) + ["date_difference_days", "needs_approval"]
+
+# Valores de paymentIntentId que significam "vazio" depois de str()
+EMPTY_STRINGS = {"", "nan", "none", "nat"}
+
+# Tabela temporária do COPY (ON CONFLICT só existe em INSERT)
+STAGING_TABLE = "bookings_copy_stage"
+
+
+def booking_natural_key(booking_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Chave natural do booking para deduplicação
+
+    paymentIntentId quando existe; senão matrícula + timestamp de checkout.
+    Sem nenhum dos dois não há chave (o booking é sempre inserido).
+    """
+    payment_intent_id = str(booking_data.get("payment_intent_id") or "").strip()
+    if payment_intent_id.lower() not in EMPTY_STRINGS:
+        return f"pi:{payment_intent_id}"
+
+    checkout_timestamp = booking_data.get("checkout_timestamp")
+    license_plate = str(booking_data.get("license_plate") or "").strip()
+    if checkout_timestamp and license_plate:
+        return f"lp:{license_plate}|{checkout_timestamp.strftime('%Y-%m-%dT%H:%M:%S')}"
+
+    return None
+
+
+def find_upload(session: Session, content_hash: str) -> Optional[ExcelUpload]:
+    """Upload anterior com o mesmo conteúdo (hash SHA-256)"""
+    return (
+        session.execute(
+            select(ExcelUpload).where(ExcelUpload.content_hash == content_hash)
+        )
+        .scalars()
+        .first()
+    )
+
+
+class BulkIngestor:
+    """
+    Insere bookings e splits em lotes multi-row dentro de uma única transacção
+
+    Em PostgreSQL (psycopg2) usa COPY com ids pré-reservados da sequência;
+    nos outros dialectos (SQLite nos testes) usa INSERT multi-row com
+    RETURNING id para ligar cada split ao seu booking.
+
+    Com dedup=True os bookings cuja chave natural já existe são actualizados
+    (INSERT ... ON CONFLICT DO UPDATE) se mudaram, ou ignorados se são iguais.
+    Os novos entram com ON CONFLICT (natural_key) DO NOTHING: uma chave
+    inserida entretanto por outro upload (ou por um pedido repetido) não
+    aborta o lote e é tratada como já existente.
+
+    Os splits dos bookings novos só são inseridos em SplitWriteMode.APP; em
+    TRIGGER é o trigger AFTER INSERT da BD que os cria (ver split_service).
+    """
+
+    BATCH_SIZE = 1000
+    LOOKUP_CHUNK = 500
+
+    def __init__(
+        self,
+        session: Session,
+        batch_size: Optional[int] = None,
+        use_copy: Optional[bool] = None,
+        dedup: bool = True,
+        content_hash: Optional[str] = None,
+        filename: Optional[str] = None,
+        split_mode: Optional[SplitWriteMode] = None,
+    ):
+        self.session = session
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.dedup = dedup
+        self.content_hash = content_hash
+        self.filename = filename
+        self.comparator = DateComparator()
+        self.calculator = FinancialCalculator()
+        self.rollup = RollupService()
+
+        bind = session.get_bind()
+        if use_copy is None:
+            use_copy = (
+                bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+            )
+        self.use_copy = use_copy
+        self.split_mode = split_mode or split_write_mode(session)
+
+        self.bookings_count = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.needs_approval = 0
+        self._started = time.perf_counter()
+
+    def ingest(self, bookings_data: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Ingere todos os bookings e faz commit uma única vez"""
+        return self.ingest_batches(self._chunked(bookings_data))
+
+    def ingest_batches(self, batches: Iterable[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Ingere blocos à medida que são produzidos (ex.: leitura em streaming)"""
+        try:
+            for batch in batches:
+                for start in range(0, len(batch), self.batch_size):
+                    self.add_batch(batch[start : start + self.batch_size])
+        except Exception:
+            self.session.rollback()
+            raise
+
+        return self.finish()
+
+    def _chunked(
+        self, bookings_data: Iterable[Dict[str, Any]]
+    ) -> Iterable[List[Dict[str, Any]]]:
+        batch = []
+        for booking_data in bookings_data:
+            batch.append(booking_data)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def add_batch(self, bookings_data: List[Dict[str, Any]]):
+        """Insere um lote na transacção corrente (sem commit)"""
+        if not bookings_data:
+            return
+
+        now = datetime.utcnow()
+        with stage("compare_dates"):
+            comparison = self.comparator.compare_batch(
+                [data.get("checkout_timestamp") for data in bookings_data],
+                pd.Series(
+                    [data.get("checkout_formatted") for data in bookings_data],
+                    dtype=object,
+                ),
+            )
+        booking_rows = [
+            self._booking_row(data, now, int(date_diff), bool(needs_approval))
+            for data, date_diff, needs_approval in zip(
+                bookings_data,
+                comparison.date_difference_days,
+                comparison.needs_approval,
+            )
+        ]
+
+        skipped = self.skipped
+        try:
+            if self.dedup:
+                with stage("classify"):
+                    new_rows, changed_rows, changed_ids = self._classify(booking_rows)
+            else:
+                new_rows, changed_rows, changed_ids = booking_rows, [], []
+
+            if new_rows:
+                with stage("insert"):
+                    new_rows, conflicts = self._insert_new(new_rows, now)
+                mark_changed(self.session)  # COPY não passa pelos eventos do ORM
+                if conflicts:
+                    changed_rows, changed_ids = self._reclassify_conflicts(
+                        conflicts, changed_rows, changed_ids
+                    )
+            if changed_rows:
+                with stage("upsert"):
+                    connection = self.session.connection()
+                    before = contributions(connection, changed_ids)
+                    self._upsert_changed(changed_rows, now)
+                    touch_bookings(self.session, changed_ids)
+                    self.rollup.apply(
+                        connection,
+                        contribution_delta(
+                            before, contributions(connection, changed_ids)
+                        ),
+                    )
+        except Exception:
+            self.session.rollback()
+            raise
+
+        count_rows("inserted", len(new_rows))
+        count_rows("updated", len(changed_rows))
+        count_rows("skipped", self.skipped - skipped)
+        self.bookings_count += len(booking_rows)
+        self.inserted += len(new_rows)
+        self.updated += len(changed_rows)
+        self.needs_approval += sum(
+            1 for row in new_rows + changed_rows if row["needs_approval"]
+        )
+
+    def finish(self) -> Dict[str, Any]:
+        """Commit da transacção e estatísticas de throughput"""
+        try:
+            if self.content_hash:
+                self.session.execute(
+                    insert(ExcelUpload.__table__).values(
+                        content_hash=self.content_hash,
+                        filename=self.filename,
+                        bookings_count=self.bookings_count,
+                        inserted=self.inserted,
+                        updated=self.updated,
+                        skipped=self.skipped,
+                        created_at=datetime.utcnow(),
+                    )
+                )
+            with stage("commit"):
+                self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        elapsed = time.perf_counter() - self._started
+        return {
+            "bookings_count": self.bookings_count,
+            "needs_approval": self.needs_approval,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.bookings_count / elapsed, 1)
+            if elapsed > 0
+            else 0.0,
+        }
+
+    def _booking_row(
+        self,
+        booking_data: Dict[str, Any],
+        now: datetime,
+        date_diff: int,
+        needs_approval: bool,
+    ) -> Dict[str, Any]:
+        """Linha da tabela bookings com a comparação de datas do lote"""
+        row = {
+            column.name: booking_data.get(column.name)
+            for column in Booking.__table__.columns
+            if column.name != "id"
+        }
+        row.update(
+            {
+                "price_delivery": float(booking_data.get("price_delivery") or 0),
+                "date_difference_days": date_diff,
+                "needs_approval": needs_approval,
+                "status_approved": not needs_approval,  # Auto-aprova se não precisar
+                "approved_at": None,
+                "natural_key": booking_natural_key(booking_data),
+                "created_at": now,
+                "updated_at": None,
+            }
+        )
+        return row
+
+    def _split_rows(
+        self, booking_ids: List[int], booking_rows: List[Dict[str, Any]], now: datetime
+    ) -> List[Dict[str, Any]]:
+        """Linhas da tabela financial_splits (regra por marca/dia e divisão vectorizada do lote)"""
+        partner_bps = split_rule_cache.get(self.session).resolve_bookings(booking_rows)
+        with stage("calculate_split"):
+            partner, multipark = self.calculator.calculate_splits(
+                [row["price_delivery"] for row in booking_rows], partner_bps
+            )
+        return [
+            {
+                "booking_id": booking_id,
+                "partner_amount_60": float(partner_60),
+                "multipark_amount_40": float(multipark_40),
+                "total_amount": row["price_delivery"],
+                "partner_bps": int(bps),
+                "created_at": now,
+            }
+            for booking_id, row, partner_60, multipark_40, bps in zip(
+                booking_ids, booking_rows, partner, multipark, partner_bps
+            )
+        ]
+
+    def _classify(
+        self, booking_rows: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict], List[Dict], List[int]]:
+        """Separa o lote em novos, alterados (e os seus ids) e repetidos (contados em skipped)"""
+        latest = {}
+        for row in booking_rows:
+            if row["natural_key"] is not None:
+                latest[row["natural_key"]] = row  # Dentro do ficheiro ganha a última
+
+        existing = self._existing(list(latest))
+
+        new_rows, changed_rows, changed_ids = [], [], []
+        for row in booking_rows:
+            key = row["natural_key"]
+            if key is None:
+                new_rows.append(row)
+            elif latest[key] is not row:
+                self.skipped += 1
+            elif key not in existing:
+                new_rows.append(row)
+            elif _differs(existing[key], row):
+                changed_rows.append(row)
+                changed_ids.append(existing[key]["id"])
+            else:
+                self.skipped += 1
+
+        return new_rows, changed_rows, changed_ids
+
+    def _reclassify_conflicts(
+        self,
+        conflicts: List[Dict[str, Any]],
+        changed_rows: List[Dict[str, Any]],
+        changed_ids: List[int],
+    ) -> Tuple[List[Dict], List[int]]:
+        """Linhas cuja chave foi inserida por outra transacção depois de _classify"""
+        unseen, late_rows, late_ids = self._classify(conflicts)
+        self.skipped += len(
+            unseen
+        )  # Invisíveis no snapshot (isolamento acima de READ COMMITTED)
+        return changed_rows + late_rows, changed_ids + late_ids
+
+    def _existing(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Bookings já na BD para as chaves dadas"""
+        table = Booking.__table__
+        columns = [table.c.id, table.c.natural_key] + [
+            table.c[name] for name in DATA_COLUMNS
+        ]
+
+        existing = {}
+        for start in range(0, len(keys), self.LOOKUP_CHUNK):
+            chunk = keys[start : start + self.LOOKUP_CHUNK]
+            result = self.session.execute(
+                select(*columns).where(table.c.natural_key.in_(chunk))
+            )
+            for row in result.mappings():
+                existing[row["natural_key"]] = dict(row)
+        return existing
+
+    def _insert_new(
+        self, booking_rows: List[Dict[str, Any]], now: datetime
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """Bookings novos e os seus splits; devolve (linhas inseridas, linhas cuja chave já existia)"""
+        if self.use_copy:
+            booking_ids = self._copy_bookings(booking_rows)
+        else:
+            booking_ids = self._insert_bookings(booking_rows)
+
+        conflicts = [
+            row
+            for booking_id, row in zip(booking_ids, booking_rows)
+            if booking_id is None
+        ]
+        if conflicts:
+            booking_rows = [
+                row
+                for booking_id, row in zip(booking_ids, booking_rows)
+                if booking_id is not None
+            ]
+            booking_ids = [
+                booking_id for booking_id in booking_ids if booking_id is not None
+            ]
+        if not booking_rows:
+            return booking_rows, conflicts
+        touch_bookings(self.session, booking_ids)
+
+        if self.split_mode == SplitWriteMode.TRIGGER:
+            # Splits escritos pelo trigger: o rollup lê o que a BD gravou
+            connection = self.session.connection()
+            self.rollup.apply(
+                connection,
+                contribution_delta({}, contributions(connection, booking_ids)),
+            )
+            return booking_rows, conflicts
+
+        split_rows = self._split_rows(booking_ids, booking_rows, now)
+        if self.use_copy:
+            self._copy_rows(FinancialSplit.__table__.name, split_rows)
+        else:
+            self.session.execute(insert(FinancialSplit.__table__), split_rows)
+
+        # Bookings novos: o delta do rollup sai directamente das linhas inseridas
+        delta = RollupDelta()
+        for booking_row, split_row in zip(booking_rows, split_rows):
+            delta.add_booking(dict(booking_row, **split_row))
+        self.rollup.apply(self.session.connection(), delta)
+        return booking_rows, conflicts
+
+    def _upsert_changed(self, booking_rows: List[Dict[str, Any]], now: datetime):
+        """INSERT ... ON CONFLICT (natural_key) DO UPDATE e actualização dos splits"""
+        table = Booking.__table__
+        rows = [dict(row, updated_at=now) for row in booking_rows]
+
+        stmt = dialect_insert(self.session, table)
+        values = {name: stmt.excluded[name] for name in DATA_COLUMNS}
+        values.update(
+            {
+                # Uma aprovação manual anterior mantém-se
+                "status_approved": or_(
+                    table.c.status_approved, stmt.excluded.status_approved
+                ),
+                "updated_at": stmt.excluded.updated_at,
+            }
+        )
+        stmt = stmt.on_conflict_do_update(index_elements=["natural_key"], set_=values)
+        result = self.session.execute(
+            stmt.returning(table.c.id, table.c.natural_key), rows
+        )
+        ids_by_key = {natural_key: booking_id for booking_id, natural_key in result}
+
+        split_table = FinancialSplit.__table__
+        splits = self._split_rows(
+            [ids_by_key[row["natural_key"]] for row in rows], rows, now
+        )
+        split_rows = [
+            {"b_" + name: value for name, value in split.items()} for split in splits
+        ]
+        self.session.execute(
+            update(split_table)
+            .where(split_table.c.booking_id == bindparam("b_booking_id"))
+            .values(
+                partner_amount_60=bindparam("b_partner_amount_60"),
+                multipark_amount_40=bindparam("b_multipark_amount_40"),
+                total_amount=bindparam("b_total_amount"),
+                partner_bps=bindparam("b_partner_bps"),
+            ),
+            split_rows,
+        )
+
+    def _insert_bookings(
+        self, booking_rows: List[Dict[str, Any]]
+    ) -> List[Optional[int]]:
+        """
+        INSERT multi-row com RETURNING id, alinhado com booking_rows
+
+        As linhas com chave natural levam ON CONFLICT (natural_key) DO NOTHING
+        (id None: a chave já existia); as restantes nunca colidem.
+        """
+        table = Booking.__table__
+        keyed = [row for row in booking_rows if row["natural_key"] is not None]
+        keyless = [row for row in booking_rows if row["natural_key"] is None]
+
+        ids_by_key = {}
+        if keyed:
+            stmt = dialect_insert(self.session, table).on_conflict_do_nothing(
+                index_elements=["natural_key"]
+            )
+            result = self.session.execute(
+                stmt.returning(table.c.id, table.c.natural_key), keyed
+            )
+            ids_by_key = {natural_key: booking_id for booking_id, natural_key in result}
+
+        keyless_ids = iter(())
+        if keyless:
+            result = self.session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                keyless,
+            )
+            keyless_ids = iter([row[0] for row in result])
+
+        return [
+            next(keyless_ids)
+            if row["natural_key"] is None
+            else ids_by_key.pop(row["natural_key"], None)
+            for row in booking_rows
+        ]
+
+    def _copy_bookings(self, booking_rows: List[Dict[str, Any]]) -> List[Optional[int]]:
+        """
+        COPY para PostgreSQL com ids reservados antecipadamente
+
+        O COPY vai para uma tabela temporária (apagada no commit) e daí para
+        bookings com INSERT ... SELECT ... ON CONFLICT (natural_key) DO NOTHING;
+        id None para as linhas cuja chave já existia.
+        """
+        result = self.session.execute(
+            text(
+                "SELECT nextval(pg_get_serial_sequence('bookings', 'id')) FROM generate_series(1, :n)"
+            ),
+            {"n": len(booking_rows)},
+        )
+        booking_ids = [row[0] for row in result]
+
+        rows = [
+            dict(row, id=booking_id)
+            for booking_id, row in zip(booking_ids, booking_rows)
+        ]
+        self.session.execute(
+            text(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (LIKE bookings INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        )
+        self.session.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+        self._copy_rows(STAGING_TABLE, rows)
+
+        column_list = ", ".join(f'"{column}"' for column in rows[0])
+        inserted = set(
+            self.session.execute(
+                text(
+                    f"INSERT INTO bookings ({column_list}) SELECT {column_list} FROM {STAGING_TABLE} "
+                    "ON CONFLICT (natural_key) DO NOTHING RETURNING id"
+                )
+            ).scalars()
+        )
+        return [
+            booking_id if booking_id in inserted else None for booking_id in booking_ids
+        ]
+
+    def _copy_rows(self, table_name: str, rows: List[Dict[str, Any]]):
+        """COPY ... FROM STDIN em formato texto"""
+        columns = list(rows[0].keys())
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(_copy_value(row[column]) for column in columns))
+            buffer.write("\n")
+        buffer.seek(0)
+
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        dbapi_connection = self.session.connection().connection
+        with dbapi_connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table_name} ({column_list}) FROM STDIN", buffer)
+
+
+def _differs(current: Dict[str, Any], row: Dict[str, Any]) -> bool:
+    """Compara o booking da BD com a linha nova, normalizando tipos da BD"""
+    for name in DATA_COLUMNS:
+        old, new = current.get(name), row.get(name)
+        if old is None or new is None:
+            if old is not new:
+                return True
+        elif isinstance(new, float) or isinstance(old, float):
+            if abs(float(old) - float(new)) >= 0.005:
+                return True
+        elif isinstance(old, datetime):
+            if old.tzinfo is not None:
+                old = old.astimezone(timezone.utc).replace(tzinfo=None)
+            if old != new:
+                return True
+        elif old != new:
+            return True
+    return False
+
+
+def _copy_value(value) -> str:
+    """Serializa um valor para o formato texto do COPY"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
@@ -0,0 +1,233 @@
+"""
+Serviço de jobs em background para ingestão de ficheiros Excel
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from ..database import new_session
+from ..models import ExcelUploadResponse, JobStatus
+from .excel_service import ExcelProcessor
+from .ingestion_service import BulkIngestor, find_upload
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """Estado e progresso de um job (actualizado pela thread do worker)"""
+
+    def __init__(
+        self, kind: str, filename: Optional[str] = None, reference: Optional[str] = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.reference = reference
+        self.status = JobStatus.QUEUED
+        self.rows_done = 0
+        self.errors: List[str] = []
+        self.result: Optional[Any] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._started = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.status = JobStatus.RUNNING
+            self.started_at = datetime.utcnow()
+            self._started = time.perf_counter()
+
+    def progress(self, rows_done: int, errors: Optional[List[str]] = None):
+        with self._lock:
+            self.rows_done = rows_done
+            if errors is not None:
+                self.errors = errors
+
+    def complete(self, result: Any):
+        with self._lock:
+            self.result = result
+            self.status = JobStatus.COMPLETED
+            self.finished_at = datetime.utcnow()
+
+    def fail(self, error: str):
+        with self._lock:
+            self.errors.append(error)
+            self.status = JobStatus.FAILED
+            self.finished_at = datetime.utcnow()
+
+    @property
+    def rows_per_second(self) -> float:
+        if not self._started:
+            return 0.0
+        if self.finished_at:
+            elapsed = (self.finished_at - self.started_at).total_seconds()
+        else:
+            elapsed = time.perf_counter() - self._started
+        return round(self.rows_done / elapsed, 1) if elapsed > 0 else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cópia consistente do estado para a API"""
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "filename": self.filename,
+                "reference": self.reference,
+                "status": self.status,
+                "rows_done": self.rows_done,
+                "rows_per_second": self.rows_per_second,
+                "errors": list(self.errors),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "result": self.result,
+            }
+
+
+class JobManager:
+    """
+    Pool de workers (threads) sem broker externo
+
+    Os jobs ficam em memória; só os últimos MAX_JOBS são mantidos.
+    """
+
+    MAX_JOBS = 200
+
+    def __init__(
+        self, max_workers: Optional[int] = None, session_factory: Callable = new_session
+    ):
+        self.max_workers = max_workers or int(os.getenv("UPLOAD_WORKERS", "2"))
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="upload-job"
+        )
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        fn: Callable,
+        *args,
+        filename: Optional[str] = None,
+        reference: Optional[str] = None,
+    ) -> Job:
+        """Agenda fn(job, *args) num worker e devolve o job"""
+        job = Job(kind, filename, reference)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+            self._futures[job.id] = self._executor.submit(self._run, job, fn, *args)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Bloqueia até o job terminar (usado em testes e scripts)"""
+        future = self._futures.get(job_id)
+        if future:
+            future.result(timeout=timeout)
+        return self.get(job_id)
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _run(self, job: Job, fn: Callable, *args):
+        job.start()
+        try:
+            job.complete(fn(job, *args))
+        except HTTPException as e:
+            job.fail(str(e.detail))
+        except Exception as e:
+            logger.exception(
+                "Erro no job %s", job.id, extra={"job_id": job.id, "kind": job.kind}
+            )
+            job.fail(str(e))
+        finally:
+            with self._lock:
+                self._futures.pop(job.id, None)
+
+    def _evict(self):
+        while len(self._jobs) > self.MAX_JOBS:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+                break
+            self._jobs.pop(oldest_id)
+
+
+def run_upload_job(
+    job: Job, path: str, content_hash: str, session_factory: Callable
+) -> ExcelUploadResponse:
+    """
+    Pipeline completo de um upload: ExcelProcessor -> DateComparator ->
+    FinancialCalculator -> BD, com progresso por bloco
+    """
+    processor = ExcelProcessor()
+    try:
+        with session_factory() as session:
+            previous = find_upload(session, content_hash)
+        if previous:
+            return ExcelUploadResponse(
+                message=f"Ficheiro já processado em {previous.created_at:%d/%m/%Y %H:%M}",
+                bookings_count=0,
+                needs_approval=0,
+                skipped=previous.bookings_count,
+                success=True,
+            )
+
+        if path.endswith(".xlsx"):
+            batches = processor.iter_chunks(path)
+        else:
+            bookings_data = processor.read_bookings(path)
+            batches = (
+                bookings_data[start : start + processor.CHUNK_SIZE]
+                for start in range(0, len(bookings_data), processor.CHUNK_SIZE)
+            )
+
+        with session_factory() as session:
+            ingestor = BulkIngestor(
+                session, content_hash=content_hash, filename=job.filename
+            )
+            result = ingestor.ingest_batches(
+                _tracked(batches, ingestor, processor, job)
+            )
+    finally:
+        os.unlink(path)
+
+    return ExcelUploadResponse(
+        message=f"Processados {result['bookings_count']} registos",
+        bookings_count=result["bookings_count"],
+        needs_approval=result["needs_approval"],
+        inserted=result["inserted"],
+        updated=result["updated"],
+        skipped=result["skipped"],
+        errors=list(job.errors),
+        success=True,
+    )
+
+
+def _tracked(batches, ingestor: BulkIngestor, processor: ExcelProcessor, job: Job):
+    """Actualiza o progresso (linhas e erros por linha) depois de cada bloco inserido"""
+    for batch in batches:
+        yield batch
+        job.progress(ingestor.bookings_count, processor.error_messages())
+    job.progress(
+        ingestor.bookings_count, processor.error_messages()
+    )  # Linhas depois do último bloco
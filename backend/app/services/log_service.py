@@ -0,0 +1,120 @@
+"""
+Logging estruturado e com limite de taxa para o pacote app
+
+Cada módulo usa logging.getLogger(__name__) com mensagens %-formatadas
+(o template é a chave do limite) e campos extra=... que saem como
+chave=valor (LOG_FORMAT=text) ou como campos de um objecto JSON
+(LOG_FORMAT=json). Cada template pode ser emitido no máximo
+LOG_RATE_LIMIT vezes por LOG_RATE_WINDOW segundos por logger; os
+suprimidos são contados e indicados no registo seguinte que passar.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# Atributos de qualquer LogRecord (o resto veio de extra=...)
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> Dict:
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if key not in _RECORD_ATTRIBUTES
+    }
+
+
+class RateLimitFilter(logging.Filter):
+    """Deixa passar `burst` registos por (logger, template) em cada janela de `window` segundos"""
+
+    def __init__(self, burst: int = 10, window: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._windows: Dict[
+            Tuple[str, str], list
+        ] = {}  # chave -> [início, emitidos, suprimidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class StructuredFormatter(logging.Formatter):
+    """Uma linha por registo: texto com chave=valor ou JSON"""
+
+    def __init__(self, json_output: bool = False):
+        super().__init__()
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+            timespec="milliseconds"
+        )
+        fields = _fields(record)
+        if record.exc_info:
+            fields["exception"] = self.formatException(record.exc_info)
+
+        if self.json_output:
+            return json.dumps(
+                {
+                    "ts": timestamp,
+                    "level": record.levelname,
+                    "logger": record.name,
+                    "message": record.getMessage(),
+                    **fields,
+                },
+                default=str,
+                ensure_ascii=False,
+            )
+
+        extra = "".join(f" {key}={value}" for key, value in fields.items())
+        return f"{timestamp} {record.levelname} {record.name}: {record.getMessage()}{extra}"
+
+
+_configured = False
+
+
+def setup_logging(level: Optional[str] = None, log_format: Optional[str] = None):
+    """Handler do logger 'app' (uma vez por processo)"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        StructuredFormatter(
+            json_output=(log_format or os.getenv("LOG_FORMAT", "text")) == "json"
+        )
+    )
+    handler.addFilter(
+        RateLimitFilter(
+            burst=int(os.getenv("LOG_RATE_LIMIT", "10")),
+            window=float(os.getenv("LOG_RATE_WINDOW", "60")),
+        )
+    )
+
+    logger = logging.getLogger("app")
+    logger.addHandler(handler)
+    logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
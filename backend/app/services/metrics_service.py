@@ -0,0 +1,361 @@
+"""
+Métricas do processo em formato de texto Prometheus (GET /metrics)
+
+- multipark_stage_seconds{stage}: duração de cada etapa do upload
+  (read_excel, process_rows, compare_dates, calculate_split, insert, commit...)
+- multipark_rows_total{stage}: linhas lidas/inseridas/actualizadas/ignoradas
+  (rows/s = rate() no Prometheus)
+- multipark_http_request_seconds{method,route,status}: por endpoint (rota, não URL)
+- multipark_db_query_seconds{operation}: todas as queries via eventos do SQLAlchemy
+- pools da BD e cache de respostas: lidos no momento do scrape (collectors)
+
+Sem dependências externas. Com METRICS_ENABLED=false cada ponto de medição
+é só a verificação de um booleano (stage() devolve um context manager nulo).
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monotónico por combinação de labels"""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+    ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues: str):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Histograma com buckets fixos (contagens cumulativas só ao exportar)"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [contagem por bucket (+Inf no fim), soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                    0,
+                ]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def total(self, *labelvalues: str) -> float:
+        series = self._series.get(labelvalues)
+        return series[1] if series else 0.0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(
+                (labelvalues, ([*counts], total, count))
+                for labelvalues, (counts, total, count) in self._series.items()
+            )
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}"
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+        return False
+
+
+class MetricsRegistry:
+    """Métricas registadas + collectors (gauges lidos no scrape) e exportação em texto"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, str, Sequence[str], Callable]] = []
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        metric = Counter(self, name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets=LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(self, name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_collector(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable,
+    ):
+        """collect() -> {(valores dos labels): valor}, chamado em cada render()"""
+        self._collectors.append((name, documentation, tuple(labelnames), collect))
+
+    def timer(self, histogram: Histogram, *labelvalues: str):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(histogram, labelvalues)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for name, documentation, labelnames, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception:  # Um collector com erro não pode partir o scrape
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for labelvalues, value in sorted(values.items()):
+                lines.append(
+                    f"{name}{_labels(labelnames, labelvalues)} {_number(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+metrics = MetricsRegistry(
+    enabled=os.getenv("METRICS_ENABLED", "true").lower() == "true"
+)
+
+STAGE_SECONDS = metrics.histogram(
+    "multipark_stage_seconds", "Duração das etapas do pipeline de upload", ["stage"]
+)
+ROWS = metrics.counter(
+    "multipark_rows_total", "Linhas processadas por etapa do upload", ["stage"]
+)
+HTTP_SECONDS = metrics.histogram(
+    "multipark_http_request_seconds",
+    "Duração dos pedidos HTTP por rota",
+    ["method", "route", "status"],
+)
+DB_QUERY_SECONDS = metrics.histogram(
+    "multipark_db_query_seconds", "Duração das queries à BD por operação", ["operation"]
+)
+
+
+def stage(name: str):
+    """with stage('read_excel'): ... regista a duração em multipark_stage_seconds"""
+    return metrics.timer(STAGE_SECONDS, name)
+
+
+def record_stage(name: str, seconds: float):
+    """Para etapas que não cabem num with (ex.: blocos de um gerador)"""
+    STAGE_SECONDS.observe(seconds, name)
+
+
+def count_rows(stage_name: str, rows: int):
+    if rows:
+        ROWS.inc(rows, stage_name)
+
+
+def _operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ""
+    return (
+        operation
+        if operation in ("SELECT", "INSERT", "UPDATE", "DELETE", "COPY", "WITH")
+        else "OTHER"
+    )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if metrics.enabled and context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, _operation(statement))
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware ASGI: duração por método + rota (o template, ex. /api/upload-jobs/{job_id})
+    + status; pedidos sem rota contam como "unmatched" para não criar séries por URL
+
+    Respostas dadas antes do router (HITs da cache de respostas) não têm
+    scope["route"]: a rota é procurada nas rotas do router da aplicação.
+    """
+
+    def __init__(self, app, router=None):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route") or self._match(scope)
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], path, str(status[0])
+            )
+
+    def _match(self, scope):
+        """Rota que o router escolheria para este pedido (None se nenhuma)"""
+        if self.router is None:
+            return None
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
@@ -0,0 +1,379 @@
+"""
+Reclassificação de bookings quando a regra de aprovação muda
+
+date_difference_days e needs_approval são calculados na ingestão. Depois de
+mudar a regra (APPROVAL_THRESHOLD_HOUR, lógica do DateComparator) os bookings
+já gravados são reavaliados em blocos de ids no servidor:
+
+- só bookings sem aprovação manual (approved_at nulo) são lidos/alterados;
+  os auto-aprovados na ingestão (status_approved = not needs_approval)
+  voltam a pendentes se a nova regra os marcar, e vice-versa;
+- só as linhas cujo resultado muda são escritas (UPDATE em lote);
+- o rollup recebe o delta de pending_count de cada bloco;
+- cada bloco é confirmado juntamente com o checkpoint da sua fatia de ids,
+  por isso uma execução interrompida retoma sem repetir nem saltar linhas.
+
+    python -m app.services.reclassify_service --threshold-hour 2 --workers 4
+    python -m app.services.reclassify_service --resume <run_key>
+"""
+import argparse
+import logging
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import bindparam, func
+from sqlalchemy import select as core_select
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from ..database import engine, new_session
+from ..models import Booking, ReclassificationCheckpoint, ReclassificationResult
+from .analytics_service import touch_bookings
+from .date_service import DateComparator
+from .log_service import setup_logging
+from .rollup_service import RollupDelta, RollupService, checkout_day
+
+logger = logging.getLogger(__name__)
+
+# Colunas lidas por bloco: as da comparação, os valores actuais e o grupo do rollup
+COLUMNS = [
+    "id",
+    "checkout_timestamp",
+    "checkout_formatted",
+    "date_difference_days",
+    "needs_approval",
+    "status_approved",
+    "park_brand",
+    "payment_method",
+]
+
+
+class ReclassificationService:
+    """
+    Execuções identificadas por run_key, com uma ou mais fatias de ids
+
+    Cada fatia (ReclassificationCheckpoint) é processada por um worker;
+    com workers > 1 as fatias correm em processos separados, cada um com a
+    sua ligação (engine configurado por SUPABASE_URL).
+    """
+
+    CHUNK_SIZE = 5000
+
+    def __init__(self, session_factory: Callable = new_session):
+        self.session_factory = session_factory
+        self.rollup = RollupService()
+
+    def start(self, threshold_hour: Optional[int] = None, slices: int = 1) -> str:
+        """Cria os checkpoints de uma nova execução e devolve o run_key"""
+        threshold_hour = (
+            DateComparator.THRESHOLD_HOUR if threshold_hour is None else threshold_hour
+        )
+        table = Booking.__table__
+        run_key = uuid.uuid4().hex
+
+        with self.session_factory() as session:
+            low, high = session.execute(
+                core_select(func.min(table.c.id), func.max(table.c.id)).where(
+                    table.c.approved_at.is_(None)
+                )
+            ).one()
+            if low is None:
+                edges = [0, 0]
+            else:
+                slices = max(1, min(slices, high - low + 1))
+                edges = [
+                    low - 1 + (high - low + 1) * index // slices
+                    for index in range(slices + 1)
+                ]
+
+            for start_id, end_id in zip(edges, edges[1:]):
+                session.add(
+                    ReclassificationCheckpoint(
+                        run_key=run_key,
+                        threshold_hour=threshold_hour,
+                        start_id=start_id,
+                        end_id=end_id,
+                        last_id=start_id,
+                        finished_at=datetime.utcnow() if low is None else None,
+                    )
+                )
+            session.commit()
+        return run_key
+
+    def run(
+        self,
+        run_key: str,
+        workers: int = 1,
+        chunk_size: Optional[int] = None,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> ReclassificationResult:
+        """
+        Processa as fatias por terminar da execução
+
+        progress(linhas lidas nesta chamada) é chamado depois de cada bloco
+        (ou de cada fatia, com workers > 1).
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        with self.session_factory() as session:
+            pending = session.exec(
+                select(ReclassificationCheckpoint.id)
+                .where(ReclassificationCheckpoint.run_key == run_key)
+                .where(ReclassificationCheckpoint.finished_at.is_(None))
+                .order_by(ReclassificationCheckpoint.id)
+            ).all()
+            if not pending and not self._checkpoints(session, run_key):
+                raise HTTPException(
+                    status_code=404, detail="Reclassificação não encontrada"
+                )
+
+        started = time.perf_counter()
+        scanned = 0
+
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(pending)), initializer=_init_worker
+            ) as executor:
+                futures = [
+                    executor.submit(_run_slice, checkpoint_id, chunk_size)
+                    for checkpoint_id in pending
+                ]
+                for future in as_completed(futures):
+                    scanned += future.result()
+                    if progress:
+                        progress(scanned)
+        else:
+            for checkpoint_id in pending:
+                offset = scanned
+                scanned += self.run_slice(
+                    checkpoint_id,
+                    chunk_size,
+                    progress and (lambda rows, offset=offset: progress(offset + rows)),
+                )
+
+        with self.session_factory() as session:
+            return self._summary(
+                session, run_key, scanned, time.perf_counter() - started
+            )
+
+    def run_slice(
+        self,
+        checkpoint_id: int,
+        chunk_size: int,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> int:
+        """Blocos da fatia até ao fim (ou excepção); devolve as linhas lidas"""
+        scanned = 0
+        with self.session_factory() as session:
+            checkpoint = session.get(ReclassificationCheckpoint, checkpoint_id)
+            comparator = DateComparator(threshold_hour=checkpoint.threshold_hour)
+
+            while checkpoint.finished_at is None:
+                scanned += self._process_chunk(
+                    session, comparator, checkpoint, chunk_size
+                )
+                if progress:
+                    progress(scanned)
+        return scanned
+
+    def _process_chunk(
+        self,
+        session: Session,
+        comparator: DateComparator,
+        checkpoint: ReclassificationCheckpoint,
+        chunk_size: int,
+    ) -> int:
+        """Um bloco de ids: compare_batch, UPDATE das linhas alteradas, rollup e checkpoint numa transacção"""
+        table = Booking.__table__
+        stmt = (
+            core_select(*[table.c[name] for name in COLUMNS])
+            .where(
+                table.c.id > checkpoint.last_id,
+                table.c.id <= checkpoint.end_id,
+                table.c.approved_at.is_(None),
+            )
+            .order_by(table.c.id)
+            .limit(chunk_size)
+            .with_for_update()  # Aprovações concorrentes esperam pelo fim do bloco
+        )
+        now = datetime.utcnow()
+
+        try:
+            rows = session.execute(stmt).mappings().all()
+            if rows:
+                comparison = comparator.compare_batch(
+                    [row["checkout_timestamp"] for row in rows],
+                    [row["checkout_formatted"] for row in rows],
+                )
+                current_days = np.array(
+                    [
+                        -1
+                        if row["date_difference_days"] is None
+                        else row["date_difference_days"]
+                        for row in rows
+                    ]
+                )
+                current_needs = np.array([bool(row["needs_approval"]) for row in rows])
+                changed = np.flatnonzero(
+                    (comparison.date_difference_days != current_days)
+                    | (comparison.needs_approval != current_needs)
+                )
+
+                updates, delta = [], RollupDelta()
+                for index in changed:
+                    row = rows[index]
+                    needs_approval = bool(comparison.needs_approval[index])
+                    # Como na ingestão: auto-aprovado se não precisar de aprovação
+                    approved = (
+                        not needs_approval
+                        if needs_approval != current_needs[index]
+                        else bool(row["status_approved"])
+                    )
+                    updates.append(
+                        {
+                            "b_id": row["id"],
+                            "b_days": int(comparison.date_difference_days[index]),
+                            "b_needs": needs_approval,
+                            "b_approved": approved,
+                        }
+                    )
+                    pending = int(needs_approval and not approved) - int(
+                        current_needs[index] and not row["status_approved"]
+                    )
+                    if pending:
+                        key = (
+                            checkout_day(row["checkout_timestamp"]),
+                            row["park_brand"] or "",
+                            row["payment_method"] or "",
+                        )
+                        delta.add(key, 0, pending)
+
+                if updates:
+                    session.execute(
+                        update(table)
+                        .where(table.c.id == bindparam("b_id"))
+                        .values(
+                            date_difference_days=bindparam("b_days"),
+                            needs_approval=bindparam("b_needs"),
+                            status_approved=bindparam("b_approved"),
+                            updated_at=now,
+                        ),
+                        updates,
+                    )
+                    self.rollup.apply(session.connection(), delta)
+                    touch_bookings(session, [row["b_id"] for row in updates])
+
+                checkpoint.last_id = rows[-1]["id"]
+                checkpoint.rows_scanned += len(rows)
+                checkpoint.rows_changed += len(updates)
+
+            checkpoint.updated_at = now
+            if len(rows) < chunk_size:
+                checkpoint.finished_at = now
+            session.add(checkpoint)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return len(rows)
+
+    def _checkpoints(
+        self, session: Session, run_key: str
+    ) -> List[ReclassificationCheckpoint]:
+        return session.exec(
+            select(ReclassificationCheckpoint).where(
+                ReclassificationCheckpoint.run_key == run_key
+            )
+        ).all()
+
+    def _summary(
+        self, session: Session, run_key: str, scanned: int, elapsed: float
+    ) -> ReclassificationResult:
+        """Totais da execução (todas as chamadas) e throughput desta chamada"""
+        checkpoints = self._checkpoints(session, run_key)
+        return ReclassificationResult(
+            run_key=run_key,
+            threshold_hour=checkpoints[0].threshold_hour,
+            slices=len(checkpoints),
+            rows_scanned=sum(checkpoint.rows_scanned for checkpoint in checkpoints),
+            rows_changed=sum(checkpoint.rows_changed for checkpoint in checkpoints),
+            elapsed_seconds=round(elapsed, 3),
+            rows_per_second=round(scanned / elapsed, 1) if elapsed > 0 else 0.0,
+            finished=all(
+                checkpoint.finished_at is not None for checkpoint in checkpoints
+            ),
+        )
+
+
+def _init_worker():
+    """Processo filho: não reutilizar ligações herdadas do pai"""
+    engine.dispose(close=False)
+
+
+def _run_slice(checkpoint_id: int, chunk_size: int) -> int:
+    return ReclassificationService().run_slice(checkpoint_id, chunk_size)
+
+
+def run_reclassify_job(
+    job, run_key: str, session_factory: Callable
+) -> ReclassificationResult:
+    """Job em background (JobManager): uma fatia, progresso por bloco"""
+    return ReclassificationService(session_factory).run(run_key, progress=job.progress)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Reavalia date_difference_days/needs_approval dos bookings sem aprovação manual"
+    )
+    parser.add_argument(
+        "--threshold-hour",
+        type=int,
+        default=None,
+        help="Hora limite do dia seguinte (por omissão APPROVAL_THRESHOLD_HOUR)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processos em paralelo (uma fatia de ids cada)",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=ReclassificationService.CHUNK_SIZE
+    )
+    parser.add_argument(
+        "--resume", metavar="RUN_KEY", help="Retomar uma execução interrompida"
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    service = ReclassificationService()
+    run_key = args.resume or service.start(args.threshold_hour, slices=args.workers)
+    logger.info("Reclassificação %s", run_key)
+
+    last_report = [time.perf_counter()]
+
+    def report(rows: int):
+        if time.perf_counter() - last_report[0] >= 5:
+            last_report[0] = time.perf_counter()
+            logger.info("%d linhas lidas", rows, extra={"run_key": run_key})
+
+    result = service.run(
+        run_key, workers=args.workers, chunk_size=args.chunk_size, progress=report
+    )
+    logger.info(
+        "Reclassificação %s: %d linhas lidas, %d alteradas em %s s (%s linhas/s)%s",
+        result.run_key,
+        result.rows_scanned,
+        result.rows_changed,
+        result.elapsed_seconds,
+        result.rows_per_second,
+        "" if result.finished else " - por terminar",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Relatórios financeiros 60/40 agregados na BD com paginação keyset
+"""
+from datetime import date
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import distinct, func, literal, select, tuple_
+from sqlalchemy.types import Date
+from sqlmodel import Session
+
+from ..models import (
+    Booking,
+    BookingFilters,
+    FinancialBreakdownRow,
+    FinancialReport,
+    FinancialSplit,
+    ReportGroup,
+    StatsRollup,
+)
+from .filters import (
+    booking_conditions,
+    decode_cursor,
+    encode_cursor,
+    is_day_aligned,
+    utc_naive,
+)
+from .rollup_service import as_date, group_expressions
+
+# Parte de cada conta: (coluna em financial_splits, coluna no rollup)
+SHARES = {
+    "partner": ("partner_amount_60", "partner_cents"),
+    "multipark": ("multipark_amount_40", "multipark_cents"),
+}
+
+# Sentinela para ordenar/paginar grupos sem data de checkout
+NO_DAY = date.min
+NO_DAY_LITERAL = literal(NO_DAY, Date, literal_execute=True)
+
+
+def _report_cursor(cursor: str, group_by: List[ReportGroup]) -> list:
+    """Valores da chave do último grupo devolvido"""
+    values = decode_cursor(cursor, len(group_by))
+    try:
+        return [
+            date.fromisoformat(value) if group == ReportGroup.DAY else str(value)
+            for group, value in zip(group_by, values)
+        ]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+class FinancialReportService:
+    """
+    Breakdown por marca, método de pagamento e/ou dia
+
+    Filtros só por marca/método e datas alinhadas à meia-noite UTC são
+    respondidos pelo rollup (stats_rollup); os restantes usam GROUP BY sobre
+    bookings JOIN financial_splits, servido pelos índices compostos.
+    """
+
+    MAX_LIMIT = 1000
+
+    def breakdown(
+        self,
+        session: Session,
+        share: str,
+        filters: BookingFilters,
+        group_by: Optional[List[ReportGroup]] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> FinancialReport:
+        group_by = list(
+            dict.fromkeys(
+                group_by or [ReportGroup.PARK_BRAND, ReportGroup.PAYMENT_METHOD]
+            )
+        )
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        if self.uses_rollup(filters):
+            source, keys, aggregates, conditions = self._rollup_source(
+                share, filters, group_by
+            )
+            scale = 100  # Valores do rollup em cêntimos
+        else:
+            source, keys, aggregates, conditions = self._join_source(
+                session, share, filters, group_by
+            )
+            scale = 1
+
+        totals = session.execute(
+            select(*aggregates).select_from(source).where(*conditions)
+        ).one()
+
+        stmt = select(*keys, *aggregates).select_from(source).where(*conditions)
+        if cursor:
+            stmt = stmt.where(tuple_(*keys) > tuple_(*_report_cursor(cursor, group_by)))
+        # Grupos do rollup que ficaram a zero (bookings removidos) não aparecem
+        stmt = (
+            stmt.group_by(*keys)
+            .having(aggregates[0] > 0)
+            .order_by(*keys)
+            .limit(limit + 1)
+        )
+        rows = session.execute(stmt).all()
+
+        return build_report(share, group_by, totals, rows, limit, scale)
+
+    def uses_rollup(self, filters: BookingFilters) -> bool:
+        """O rollup só tem dia x marca x método: outros filtros vão à tabela"""
+        return (
+            filters.needs_approval is None
+            and filters.status_approved is None
+            and filters.min_amount is None
+            and filters.max_amount is None
+            and is_day_aligned(filters.date_from)
+            and is_day_aligned(filters.date_to)
+        )
+
+    def _rollup_source(
+        self, share: str, filters: BookingFilters, group_by: List[ReportGroup]
+    ):
+        table = StatsRollup.__table__
+        columns = {
+            ReportGroup.PARK_BRAND: table.c.park_brand,
+            ReportGroup.PAYMENT_METHOD: table.c.payment_method,
+            ReportGroup.DAY: func.coalesce(table.c.day, NO_DAY_LITERAL),
+        }
+        keys = [columns[group] for group in group_by]
+
+        conditions = []
+        if filters.park_brand is not None:
+            conditions.append(table.c.park_brand == filters.park_brand)
+        if filters.payment_method is not None:
+            conditions.append(table.c.payment_method == filters.payment_method)
+        if filters.date_from is not None:
+            conditions.append(table.c.day >= utc_naive(filters.date_from).date())
+        if filters.date_to is not None:
+            conditions.append(table.c.day < utc_naive(filters.date_to).date())
+
+        aggregates = [
+            func.sum(table.c.booking_count),
+            func.sum(table.c.total_cents),
+            func.sum(table.c[SHARES[share][1]]),
+        ]
+        return table, keys, aggregates, conditions
+
+    def _join_source(
+        self,
+        session: Session,
+        share: str,
+        filters: BookingFilters,
+        group_by: List[ReportGroup],
+    ):
+        bookings = Booking.__table__
+        splits = FinancialSplit.__table__
+        day, brand, method = group_expressions(session, bookings)
+        columns = {
+            ReportGroup.PARK_BRAND: brand,
+            ReportGroup.PAYMENT_METHOD: method,
+            ReportGroup.DAY: func.coalesce(day, NO_DAY_LITERAL),
+        }
+        keys = [columns[group] for group in group_by]
+
+        # LEFT JOIN: bookings sem split contam como no rollup (valores a zero)
+        source = bookings.outerjoin(splits, splits.c.booking_id == bookings.c.id)
+        aggregates = [
+            func.count(distinct(bookings.c.id)),
+            func.sum(splits.c.total_amount),
+            func.sum(splits.c[SHARES[share][0]]),
+        ]
+        return source, keys, aggregates, booking_conditions(filters, bookings)
+
+
+def build_report(
+    share: str, group_by: List[ReportGroup], totals, rows, limit: int, scale: int
+) -> FinancialReport:
+    """
+    FinancialReport a partir dos totais (contagem, total, parte) e das linhas
+    (chaves de group_by..., contagem, total, parte) ordenadas pelas chaves,
+    com até limit + 1 linhas; valores em euros (scale=1) ou cêntimos (100)
+
+    percentage é a parte efectiva (parte / total): com regras de divisão
+    por marca/data (split_rules) deixa de ser sempre 60 ou 40.
+    """
+    grand_count = int(_number(totals[0]))
+    grand_total = _number(totals[1]) / scale
+    grand_share = _number(totals[2]) / scale
+    keys = len(group_by)
+
+    items = []
+    for row in rows[:limit]:
+        values = dict(zip(group_by, row[:keys]))
+        row_count, row_total, row_share = row[keys:]
+        row_share = _number(row_share) / scale
+        day = as_date(values.get(ReportGroup.DAY))
+        items.append(
+            FinancialBreakdownRow(
+                park_brand=values.get(ReportGroup.PARK_BRAND) or None,
+                payment_method=values.get(ReportGroup.PAYMENT_METHOD) or None,
+                day=None if day == NO_DAY else day,
+                count_bookings=int(_number(row_count)),
+                total_amount=round(_number(row_total) / scale, 2),
+                share_amount=round(row_share, 2),
+                percentage_of_total=round(row_share / grand_share * 100, 2)
+                if grand_share
+                else 0,
+            )
+        )
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(
+            [
+                as_date(value) if group == ReportGroup.DAY else value
+                for group, value in zip(group_by, last[:keys])
+            ]
+        )
+
+    return FinancialReport(
+        share=share,
+        percentage=round(grand_share / grand_total * 100, 2) if grand_total else 0.0,
+        group_by=group_by,
+        count_bookings=grand_count,
+        total_amount=round(grand_total, 2),
+        share_amount=round(grand_share, 2),
+        items=items,
+        next_cursor=next_cursor,
+    )
+
+
+def _number(value) -> float:
+    return float(value or 0)
@@ -0,0 +1,328 @@
+"""
+Rollup das estatísticas por dia x park_brand x payment_method
+
+A tabela stats_rollup é mantida incrementalmente:
+- pela ingestão em lote (BulkIngestor aplica os deltas de cada lote);
+- por escritas ORM em Booking/FinancialSplit (listeners de flush), o que
+  cobre approve_booking e bookings criados directamente na sessão.
+
+Reconstrução completa (backfills, alterações feitas fora da API):
+    python -m app.services.rollup_service rebuild
+"""
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, literal_column, select
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from ..database import dialect_insert
+from ..models import Booking, DashboardStats, FinancialSplit, StatsRollup
+from .log_service import setup_logging
+from .stats_service import StatsService, pending_condition
+
+logger = logging.getLogger(__name__)
+
+GroupKey = Tuple[Optional[date], str, str]
+
+COUNTERS = [
+    "booking_count",
+    "pending_count",
+    "total_cents",
+    "partner_cents",
+    "multipark_cents",
+]
+
+LOOKUP_CHUNK = 500
+
+
+def to_cents(amount) -> int:
+    """Valor em euros -> cêntimos inteiros"""
+    return int(round(float(amount or 0) * 100))
+
+
+def checkout_day(checkout_timestamp) -> Optional[date]:
+    """Dia (UTC) do checkout; timestamps sem timezone já estão em UTC"""
+    if checkout_timestamp is None:
+        return None
+    if isinstance(checkout_timestamp, str):
+        checkout_timestamp = datetime.fromisoformat(checkout_timestamp)
+    if checkout_timestamp.tzinfo is not None:
+        checkout_timestamp = checkout_timestamp.astimezone(timezone.utc)
+    return checkout_timestamp.date()
+
+
+def day_expression(session: Session, column):
+    """date(column) em UTC no SQL do dialecto da sessão"""
+    if session.get_bind().dialect.name == "postgresql":
+        column = func.timezone(literal_column("'UTC'"), column)
+    return func.date(column)
+
+
+def group_expressions(session: Session, source) -> Tuple:
+    """
+    (dia, marca, método) de um grupo do rollup sobre bookings (ou CTE com
+    as mesmas colunas); literais inline para o SELECT e o GROUP BY coincidirem
+    """
+    empty = literal_column("''")
+    return (
+        day_expression(session, source.c.checkout_timestamp),
+        func.coalesce(source.c.park_brand, empty),
+        func.coalesce(source.c.payment_method, empty),
+    )
+
+
+def as_date(value) -> Optional[date]:
+    """date(...) devolve date em PostgreSQL e texto em SQLite"""
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+class RollupDelta:
+    """Acumula deltas por grupo antes de os escrever na BD"""
+
+    def __init__(self):
+        self.groups: Dict[GroupKey, List[int]] = defaultdict(
+            lambda: [0] * len(COUNTERS)
+        )
+
+    def add(self, key: GroupKey, *values: int):
+        counters = self.groups[key]
+        for index, value in enumerate(values):
+            counters[index] += value
+
+    def add_booking(self, row: Dict[str, Any], sign: int = 1):
+        """Contribuição de um booking (colunas do booking + somas do split)"""
+        key = (
+            checkout_day(row.get("checkout_timestamp")),
+            row.get("park_brand") or "",
+            row.get("payment_method") or "",
+        )
+        pending = bool(row.get("needs_approval")) and not row.get("status_approved")
+        self.add(
+            key,
+            sign,
+            sign * int(pending),
+            sign * to_cents(row.get("total_amount")),
+            sign * to_cents(row.get("partner_amount_60")),
+            sign * to_cents(row.get("multipark_amount_40")),
+        )
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Linhas para o UPSERT (grupos com delta nulo são ignorados)"""
+        return [
+            dict(
+                group_key=f"{day.isoformat() if day else ''}|{brand}|{method}",
+                day=day,
+                park_brand=brand,
+                payment_method=method,
+                **dict(zip(COUNTERS, values)),
+            )
+            for (day, brand, method), values in self.groups.items()
+            if any(values)
+        ]
+
+
+def contributions(connection, booking_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Estado actual (booking + somas dos splits) dos bookings dados"""
+    bookings = Booking.__table__
+    splits = FinancialSplit.__table__
+    booking_ids = list(booking_ids)
+
+    result = {}
+    for start in range(0, len(booking_ids), LOOKUP_CHUNK):
+        chunk = booking_ids[start : start + LOOKUP_CHUNK]
+        split_totals = (
+            select(
+                splits.c.booking_id,
+                func.sum(splits.c.total_amount).label("total_amount"),
+                func.sum(splits.c.partner_amount_60).label("partner_amount_60"),
+                func.sum(splits.c.multipark_amount_40).label("multipark_amount_40"),
+            )
+            .where(splits.c.booking_id.in_(chunk))
+            .group_by(splits.c.booking_id)
+            .subquery()
+        )
+
+        stmt = (
+            select(
+                bookings.c.id,
+                bookings.c.checkout_timestamp,
+                bookings.c.park_brand,
+                bookings.c.payment_method,
+                bookings.c.needs_approval,
+                bookings.c.status_approved,
+                split_totals.c.total_amount,
+                split_totals.c.partner_amount_60,
+                split_totals.c.multipark_amount_40,
+            )
+            .select_from(
+                bookings.outerjoin(
+                    split_totals, split_totals.c.booking_id == bookings.c.id
+                )
+            )
+            .where(bookings.c.id.in_(chunk))
+        )
+
+        for row in connection.execute(stmt).mappings():
+            result[row["id"]] = dict(row)
+    return result
+
+
+def contribution_delta(before: Dict[int, Dict], after: Dict[int, Dict]) -> RollupDelta:
+    """Delta entre dois estados dos mesmos bookings"""
+    delta = RollupDelta()
+    for row in before.values():
+        delta.add_booking(row, -1)
+    for row in after.values():
+        delta.add_booking(row, 1)
+    return delta
+
+
+class RollupService:
+    """Leitura, actualização incremental e reconstrução do rollup"""
+
+    def apply(self, connection, delta: RollupDelta):
+        """UPSERT dos deltas: col = col + excluded.col"""
+        rows = delta.rows()
+        if not rows:
+            return
+
+        table = StatsRollup.__table__
+        stmt = dialect_insert(connection, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["group_key"],
+            set_={name: table.c[name] + stmt.excluded[name] for name in COUNTERS},
+        )
+        connection.execute(stmt, rows)
+
+    def rebuild(self, session: Session) -> int:
+        """Recalcula o rollup inteiro a partir de bookings + financial_splits"""
+        bookings = Booking.__table__
+        splits = FinancialSplit.__table__
+
+        split_totals = (
+            select(
+                splits.c.booking_id,
+                func.sum(splits.c.total_amount).label("total_amount"),
+                func.sum(splits.c.partner_amount_60).label("partner_amount_60"),
+                func.sum(splits.c.multipark_amount_40).label("multipark_amount_40"),
+            )
+            .group_by(splits.c.booking_id)
+            .subquery()
+        )
+
+        day, brand, method = group_expressions(session, bookings)
+
+        stmt = (
+            select(
+                day,
+                brand,
+                method,
+                func.count(),
+                func.count().filter(pending_condition(bookings)),
+                func.sum(func.round(split_totals.c.total_amount * 100)),
+                func.sum(func.round(split_totals.c.partner_amount_60 * 100)),
+                func.sum(func.round(split_totals.c.multipark_amount_40 * 100)),
+            )
+            .select_from(
+                bookings.outerjoin(
+                    split_totals, split_totals.c.booking_id == bookings.c.id
+                )
+            )
+            .group_by(day, brand, method)
+        )
+
+        delta = RollupDelta()
+        for day_value, brand_value, method_value, *values in session.execute(stmt):
+            delta.add(
+                (as_date(day_value), brand_value, method_value),
+                *[int(value or 0) for value in values],
+            )
+
+        try:
+            session.execute(delete(StatsRollup.__table__))
+            self.apply(session.connection(), delta)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return len(delta.groups)
+
+    def dashboard_stats(self, session: Session) -> DashboardStats:
+        """DashboardStats a partir do rollup (custo proporcional ao nº de grupos)"""
+        table = StatsRollup.__table__
+        row = session.execute(
+            select(*[func.sum(table.c[name]) for name in COUNTERS])
+        ).one()
+        total, pending, total_cents, partner_cents, multipark_cents = [
+            int(value or 0) for value in row
+        ]
+        return StatsService()._to_stats(
+            total,
+            pending,
+            total_cents / 100,
+            partner_cents / 100,
+            multipark_cents / 100,
+        )
+
+
+# Listeners ORM: estado dos bookings tocados antes e depois de cada flush
+
+
+def touched_booking_ids(session: OrmSession, include_new: bool) -> set:
+    objects = list(session.dirty) + list(session.deleted)
+    if include_new:
+        objects += list(session.new)
+
+    booking_ids = set()
+    for obj in objects:
+        if isinstance(obj, Booking):
+            booking_ids.add(obj.id)
+        elif isinstance(obj, FinancialSplit):
+            booking_ids.add(obj.booking_id)
+            booking = obj.__dict__.get("booking")  # Sem lazy load durante o flush
+            if booking is not None:
+                booking_ids.add(booking.id)
+    booking_ids.discard(None)
+    return booking_ids
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _capture_rollup_before(session, flush_context, instances):
+    booking_ids = touched_booking_ids(session, include_new=True)
+    if booking_ids:
+        session.info["rollup_before"] = contributions(session.connection(), booking_ids)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _apply_rollup_after(session, flush_context):
+    before = session.info.pop("rollup_before", {})
+    booking_ids = touched_booking_ids(session, include_new=True) | set(before)
+    if booking_ids:
+        connection = session.connection()
+        RollupService().apply(
+            connection,
+            contribution_delta(before, contributions(connection, booking_ids)),
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Manutenção do rollup de estatísticas")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args(argv)
+    setup_logging()
+
+    from ..database import new_session
+
+    with new_session() as session:
+        groups = RollupService().rebuild(session)
+    logger.info("Rollup reconstruído: %d grupos", groups)
+
+
+if __name__ == "__main__":
+    main()
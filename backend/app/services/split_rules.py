@@ -0,0 +1,166 @@
+"""
+Regras de divisão Parceiro/Multipark por park_brand e data de início
+
+Para um booking vale a regra da sua marca com o effective_from mais recente
+até ao dia (UTC) do checkout; sem regra da marca em vigor, a regra geral
+(park_brand NULL) e, sem nenhuma, DEFAULT_PARTNER_BPS (60/40). Bookings sem
+checkout usam a regra em vigor hoje. A mesma resolução está no trigger
+create_financial_split() (migração 008).
+
+As regras ficam em memória (split_rule_cache), indexadas por marca com as
+datas ordenadas: resolver um lote custa O(log n) por booking (searchsorted).
+A cache é invalidada nos commits que alteram SplitRule pelo ORM e expira
+ao fim de SPLIT_RULES_TTL segundos (alterações feitas fora deste processo).
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session as OrmSession
+
+from ..models import SplitRule
+from .financial_service import DEFAULT_PARTNER_BPS
+from .rollup_service import checkout_day
+
+# Regras sem effective_from valem desde sempre
+ALWAYS = 0
+
+
+class SplitRuleSet:
+    """Regras indexadas por marca: (dias ordinais ordenados, partner_bps)"""
+
+    def __init__(self, rules: Iterable[Tuple[Optional[str], Optional[date], int, int]]):
+        """rules: (park_brand, effective_from, partner_bps, id); no mesmo dia ganha o id maior"""
+        by_brand = defaultdict(list)
+        for brand, effective_from, partner_bps, rule_id in rules:
+            day = effective_from.toordinal() if effective_from else ALWAYS
+            by_brand[brand].append((day, rule_id, partner_bps))
+
+        self._index: Dict[Optional[str], Tuple[np.ndarray, np.ndarray]] = {}
+        for brand, entries in by_brand.items():
+            entries.sort()
+            self._index[brand] = (
+                np.array([entry[0] for entry in entries], dtype=np.int64),
+                np.array([entry[2] for entry in entries], dtype=np.int64),
+            )
+
+    def __len__(self) -> int:
+        return sum(len(days) for days, _ in self._index.values())
+
+    def partner_bps(self, park_brand: Optional[str], day: Optional[date] = None) -> int:
+        """Regra de um booking"""
+        return int(self.resolve([park_brand], [day])[0])
+
+    def resolve(
+        self, brands: Sequence[Optional[str]], days: Sequence[Optional[date]]
+    ) -> np.ndarray:
+        """partner_bps por booking (marcas e dias do checkout, alinhados)"""
+        today = datetime.utcnow().date().toordinal()
+        ordinals = np.fromiter(
+            (day.toordinal() if day else today for day in days),
+            dtype=np.int64,
+            count=len(days),
+        )
+        result = np.full(len(ordinals), DEFAULT_PARTNER_BPS, dtype=np.int64)
+        if not self._index:
+            return result
+
+        # Bookings agrupados por marca (None = código -1) sem ciclo por booking
+        codes, uniques = pd.factorize(np.array(brands, dtype=object))
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(-1, len(uniques) + 1))
+
+        general = self._index.get(None)
+        for code in range(-1, len(uniques)):
+            indexes = order[bounds[code + 1] : bounds[code + 2]]
+            if not len(indexes):
+                continue
+            brand_rules = self._index.get(uniques[code]) if code >= 0 else None
+            found = np.zeros(len(indexes), dtype=bool)
+            for rules in (brand_rules, general):
+                if rules is None or found.all():
+                    continue
+                missing = indexes[~found]
+                bps, hit = _lookup(rules, ordinals[missing])
+                result[missing[hit]] = bps[hit]
+                found[~found] = hit
+        return result
+
+    def resolve_bookings(self, bookings: Sequence[Mapping[str, Any]]) -> np.ndarray:
+        """resolve() a partir de park_brand e checkout_timestamp de cada booking"""
+        return self.resolve(
+            [booking.get("park_brand") for booking in bookings],
+            [checkout_day(booking.get("checkout_timestamp")) for booking in bookings],
+        )
+
+
+def _lookup(
+    rules: Tuple[np.ndarray, np.ndarray], ordinals: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Regra mais recente com início <= dia: (partner_bps, encontrada)"""
+    days, bps = rules
+    position = np.searchsorted(days, ordinals, side="right") - 1
+    return bps[np.maximum(position, 0)], position >= 0
+
+
+class SplitRuleCache:
+    """SplitRuleSet partilhado pelo processo, recarregado quando invalidado ou expirado"""
+
+    TTL_SECONDS = float(os.getenv("SPLIT_RULES_TTL", "60"))
+
+    def __init__(self):
+        self._rules: Optional[SplitRuleSet] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, session) -> SplitRuleSet:
+        with self._lock:
+            if (
+                self._rules is None
+                or time.monotonic() - self._loaded_at > self.TTL_SECONDS
+            ):
+                table = SplitRule.__table__
+                rows = session.execute(
+                    select(
+                        table.c.park_brand,
+                        table.c.effective_from,
+                        table.c.partner_bps,
+                        table.c.id,
+                    )
+                ).all()
+                self._rules = SplitRuleSet(rows)
+                self._loaded_at = time.monotonic()
+            return self._rules
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+
+split_rule_cache = SplitRuleCache()
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_rule_changes(session, flush_context):
+    if any(
+        isinstance(obj, SplitRule)
+        for obj in [*session.new, *session.dirty, *session.deleted]
+    ):
+        session.info["split_rules_changed"] = True
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_rules(session):
+    if session.info.pop("split_rules_changed", False):
+        split_rule_cache.invalidate()
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_rule_changes(session):
+    session.info.pop("split_rules_changed", None)
@@ -0,0 +1,203 @@
+"""
+Caminho único de escrita dos financial_splits
+
+O schema Supabase tem um trigger AFTER INSERT (create_financial_split) que
+cria o split de cada booking; o BulkIngestor também os sabe inserir em lote.
+Com os dois activos cada booking ficava com dois splits. SPLIT_WRITE_MODE
+escolhe o caminho:
+
+- auto (omissão): trigger se existir e estiver activo na BD, senão aplicação;
+- trigger: só a BD escreve (o arranque falha se o trigger não existir);
+- app: só a aplicação escreve (o arranque falha se o trigger estiver activo:
+  ALTER TABLE bookings DISABLE TRIGGER create_financial_split_trigger).
+
+Splits duplicados já gravados (fica o mais recente de cada booking, o
+rollup é corrigido bloco a bloco):
+    python -m app.services.split_service repair [--dry-run]
+"""
+import argparse
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, select, text
+from sqlmodel import Session
+
+from ..models import FinancialSplit, SplitWriteMode
+from .analytics_service import touch_bookings
+from .log_service import setup_logging
+from .rollup_service import RollupService, contribution_delta, contributions
+
+logger = logging.getLogger(__name__)
+
+SPLIT_TRIGGER_SQL = text(
+    """
+    SELECT EXISTS (
+        SELECT 1
+        FROM pg_trigger t
+        JOIN pg_class c ON c.oid = t.tgrelid
+        JOIN pg_proc p ON p.oid = t.tgfoid
+        WHERE c.relname = 'bookings'
+          AND p.proname = 'create_financial_split'
+          AND NOT t.tgisinternal
+          AND t.tgenabled <> 'D'
+    )
+"""
+)
+
+# Modo detectado por base de dados (URL do engine)
+_modes: Dict[str, SplitWriteMode] = {}
+
+
+def has_split_trigger(connection) -> bool:
+    """Trigger create_financial_split activo em bookings (só existe em PostgreSQL)"""
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(connection.execute(SPLIT_TRIGGER_SQL).scalar())
+
+
+def resolve_split_write_mode(
+    connection, configured: Optional[str] = None
+) -> SplitWriteMode:
+    """Modo efectivo para a BD ligada; configurações incoerentes falham logo"""
+    configured = SplitWriteMode(
+        configured or os.getenv("SPLIT_WRITE_MODE", SplitWriteMode.AUTO.value)
+    )
+    trigger = has_split_trigger(connection)
+
+    if configured == SplitWriteMode.AUTO:
+        return SplitWriteMode.TRIGGER if trigger else SplitWriteMode.APP
+    if configured == SplitWriteMode.TRIGGER and not trigger:
+        raise RuntimeError(
+            "SPLIT_WRITE_MODE=trigger mas o trigger create_financial_split não está activo em bookings"
+        )
+    if configured == SplitWriteMode.APP and trigger:
+        raise RuntimeError(
+            "SPLIT_WRITE_MODE=app com o trigger create_financial_split activo (splits duplicados): "
+            "ALTER TABLE bookings DISABLE TRIGGER create_financial_split_trigger"
+        )
+    return configured
+
+
+def split_write_mode(session: Session) -> SplitWriteMode:
+    """Modo da BD da sessão, detectado uma vez por processo (na ligação da sessão)"""
+    key = str(session.get_bind().url)
+    if key not in _modes:
+        _modes[key] = resolve_split_write_mode(session.connection())
+    return _modes[key]
+
+
+def check_split_write_mode(engine) -> SplitWriteMode:
+    """Verificação no arranque da API: detecta (ou rejeita) o modo e regista-o"""
+    with engine.connect() as connection:
+        mode = resolve_split_write_mode(connection)
+    _modes[str(engine.url)] = mode
+    logger.info("financial_splits escritos por: %s", mode.value)
+    return mode
+
+
+class SplitRepairService:
+    """Remove splits duplicados (mais de um por booking) em blocos de booking_id"""
+
+    CHUNK_SIZE = 1000
+
+    def __init__(self):
+        self.rollup = RollupService()
+
+    def repair(
+        self, session: Session, chunk_size: Optional[int] = None, dry_run: bool = False
+    ) -> Dict[str, float]:
+        """
+        Percorre os booking_id com duplicados por ordem; cada bloco apaga os
+        splits a mais (fica o de maior id) e aplica o delta ao rollup na
+        mesma transacção, por isso pode ser interrompido e repetido
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        splits = FinancialSplit.__table__
+        started = time.perf_counter()
+        last_booking_id = None
+        bookings = removed = 0
+
+        while True:
+            stmt = (
+                select(splits.c.booking_id, func.max(splits.c.id), func.count())
+                .group_by(splits.c.booking_id)
+                .having(func.count() > 1)
+                .order_by(splits.c.booking_id)
+                .limit(chunk_size)
+            )
+            if last_booking_id is not None:
+                stmt = stmt.where(splits.c.booking_id > last_booking_id)
+            groups = session.execute(stmt).all()
+            if not groups:
+                break
+
+            booking_ids = [booking_id for booking_id, _, _ in groups]
+            bookings += len(groups)
+            removed += sum(count - 1 for _, _, count in groups)
+            last_booking_id = booking_ids[-1]
+            if dry_run:
+                continue
+
+            try:
+                connection = session.connection()
+                before = contributions(connection, booking_ids)
+                session.execute(
+                    delete(splits)
+                    .where(splits.c.booking_id.in_(booking_ids))
+                    .where(splits.c.id.not_in([keep_id for _, keep_id, _ in groups]))
+                )
+                self.rollup.apply(
+                    connection,
+                    contribution_delta(before, contributions(connection, booking_ids)),
+                )
+                touch_bookings(session, booking_ids)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+        elapsed = time.perf_counter() - started
+        return {
+            "bookings": bookings,
+            "removed": removed,
+            "dry_run": dry_run,
+            "elapsed_seconds": round(elapsed, 3),
+            "bookings_per_second": round(bookings / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Caminho de escrita e reparação dos financial_splits"
+    )
+    parser.add_argument("command", choices=["mode", "repair"])
+    parser.add_argument("--chunk-size", type=int, default=SplitRepairService.CHUNK_SIZE)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Só contar os duplicados"
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    from ..database import engine, new_session
+
+    if args.command == "mode":
+        check_split_write_mode(engine)
+        return
+
+    with new_session() as session:
+        result = SplitRepairService().repair(session, args.chunk_size, args.dry_run)
+    action = "a remover" if args.dry_run else "removidos"
+    logger.info(
+        "Splits duplicados %s: %d em %d bookings (%s s, %s bookings/s)",
+        action,
+        result["removed"],
+        result["bookings"],
+        result["elapsed_seconds"],
+        result["bookings_per_second"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Serviço de estatísticas agregadas para o dashboard
+"""
+from sqlalchemy import and_, func, not_, select, true
+from sqlmodel import Session
+
+from ..models import Booking, DashboardStats, FinancialSplit
+
+
+def pending_condition(table=None):
+    """Booking pendente: precisa de aprovação e ainda não foi aprovado"""
+    table = table if table is not None else Booking.__table__
+    return and_(table.c.needs_approval, not_(table.c.status_approved))
+
+
+class StatsService:
+    """Estatísticas calculadas na BD (COUNT/SUM), sem carregar objectos ORM"""
+
+    def dashboard_stats(self, session: Session) -> DashboardStats:
+        """Uma única query: contagens de bookings x somas dos splits"""
+        bookings = Booking.__table__
+        splits = FinancialSplit.__table__
+
+        booking_totals = (
+            select(
+                func.count().label("total_bookings"),
+                func.count()
+                .filter(pending_condition(bookings))
+                .label("pending_approval"),
+            )
+            .select_from(bookings)
+            .subquery()
+        )
+
+        split_totals = (
+            select(
+                func.coalesce(func.sum(splits.c.total_amount), 0).label("total_amount"),
+                func.coalesce(func.sum(splits.c.partner_amount_60), 0).label(
+                    "partner_60_percent"
+                ),
+                func.coalesce(func.sum(splits.c.multipark_amount_40), 0).label(
+                    "multipark_40_percent"
+                ),
+            )
+            .select_from(splits)
+            .subquery()
+        )
+
+        # Duas linhas únicas juntas com ON true: um só round trip
+        stmt = select(booking_totals, split_totals).select_from(
+            booking_totals.join(split_totals, true())
+        )
+        row = session.execute(stmt).mappings().one()
+        return self._to_stats(
+            row["total_bookings"],
+            row["pending_approval"],
+            row["total_amount"],
+            row["partner_60_percent"],
+            row["multipark_40_percent"],
+        )
+
+    def _to_stats(
+        self, total, pending, total_amount, partner, multipark
+    ) -> DashboardStats:
+        total = int(total or 0)
+        pending = int(pending or 0)
+        return DashboardStats(
+            total_bookings=total,
+            pending_approval=pending,
+            total_amount=float(total_amount or 0),
+            partner_60_percent=float(partner or 0),
+            multipark_40_percent=float(multipark or 0),
+            approval_rate=round((total - pending) / total * 100, 2) if total else 0,
+        )
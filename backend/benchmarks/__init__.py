@@ -0,0 +1,10 @@
+"""
+Benchmarks de performance do MultiPark Dashboard
+
+Executar a partir de backend/, por exemplo:
+    python -m benchmarks.bench_dashboard_stats --sizes 10000 100000
+
+Suite completa com resultados em JSON e comparação com um baseline:
+    python -m benchmarks.suite --sizes 10000 100000 --output baseline.json
+    python -m benchmarks.suite --sizes 10000 100000 --baseline baseline.json
+"""
@@ -0,0 +1,73 @@
+"""
+Snapshot colunar (BookingSnapshot) vs consultas à BD: carga, memória por
+booking, dashboard stats e breakdowns (rollup e GROUP BY sobre a tabela)
+
+Correr a partir de backend/: python -m benchmarks.bench_analytics_snapshot
+"""
+import argparse
+import statistics
+import time
+
+from sqlmodel import Session
+
+from app.models import BookingFilters, ReportGroup
+from app.services.analytics_service import BookingSnapshot
+from app.services.report_service import FinancialReportService
+from app.services.rollup_service import RollupService
+
+from .seed import create_benchmark_engine, seed_bookings
+
+DAY_BRAND = [ReportGroup.DAY, ReportGroup.PARK_BRAND]
+
+
+def measure(fn, repeat: int) -> float:
+    """Mediana em milissegundos"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--url', default='sqlite://', help='URL da BD (apagada e recriada)')
+    args = parser.parse_args()
+
+    reports = FinancialReportService()
+    cases = [
+        ("stats", lambda session: RollupService().dashboard_stats(session), lambda snapshot: snapshot.dashboard_stats()),
+        ("marca x método (rollup)",
+         lambda session: reports.breakdown(session, 'partner', BookingFilters()),
+         lambda snapshot: snapshot.breakdown('partner', BookingFilters())),
+        ("dia x marca, min_amount (tabela)",
+         lambda session: reports.breakdown(session, 'partner', BookingFilters(min_amount=50), DAY_BRAND, limit=1000),
+         lambda snapshot: snapshot.breakdown('partner', BookingFilters(min_amount=50), DAY_BRAND, limit=1000)),
+    ]
+
+    for size in args.sizes:
+        engine = create_benchmark_engine(args.url)
+        seed_bookings(engine, size)
+        snapshot = BookingSnapshot(lambda: Session(engine), enabled=True)
+
+        started = time.perf_counter()
+        snapshot.load()
+        stats = snapshot.stats()
+        print(
+            f"{size} bookings: carga {time.perf_counter() - started:.2f} s, "
+            f"{stats['bytes_per_booking']} bytes/booking ({stats['bytes'] / 1e6:.1f} MB)"
+        )
+        print(f"  {'':<34} {'BD ms':>10} {'snapshot ms':>12}")
+        for label, database, columnar in cases:
+            with Session(engine) as session:
+                database_ms = measure(lambda: database(session), args.repeat)
+            snapshot_ms = measure(lambda: columnar(snapshot), args.repeat)
+            print(f"  {label:<34} {database_ms:>10.1f} {snapshot_ms:>12.1f}")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+GET /api/bookings: página completa (response_model=List[Booking]) vs
+projecção de colunas (fields=) em JSON, columnar e NDJSON
+
+Mede latência (mediana) e tamanho da resposta para 1k / 10k linhas por página.
+Correr a partir de backend/: python -m benchmarks.bench_bookings_list
+"""
+import argparse
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.database import get_session
+from app.main import app
+
+from .seed import create_benchmark_engine, seed_bookings
+
+# Colunas mostradas na tabela de bookings do frontend
+TABLE_FIELDS = (
+    "license_plate,name,lastname,checkout_timestamp,checkout_formatted,"
+    "date_difference_days,needs_approval,price_delivery,park_brand,status_approved"
+)
+
+VARIANTS = [
+    ("full", {}),
+    ("fields json", {"fields": TABLE_FIELDS}),
+    ("fields columnar", {"fields": TABLE_FIELDS, "format": "columnar"}),
+    ("fields ndjson", {"fields": TABLE_FIELDS, "format": "ndjson"}),
+]
+
+
+def measure(client: TestClient, params: dict, repeat: int):
+    """Mediana em milissegundos e bytes da resposta"""
+    timings, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get("/api/bookings", params=params)
+        timings.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        size = len(response.content)
+    return statistics.median(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1_000, 10_000], help='linhas por página')
+    parser.add_argument('--bookings', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--url', default='sqlite://', help='URL da BD (apagada e recriada)')
+    args = parser.parse_args()
+
+    engine = create_benchmark_engine(args.url)
+    seed_bookings(engine, args.bookings)
+
+    def session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = session_override
+    try:
+        client = TestClient(app)
+        print(f"{'linhas':>8} {'variante':<16} {'ms':>10} {'KiB':>10}")
+        for page in args.pages:
+            for name, params in VARIANTS:
+                ms, size = measure(client, dict(params, limit=page), args.repeat)
+                print(f"{page:>8} {name:<16} {ms:>10.1f} {size / 1024:>10.1f}")
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Latência de /api/dashboard/stats: implementação antiga (ORM em Python)
+vs agregação SQL vs rollup, para 10k / 100k / 1M bookings
+"""
+import argparse
+import statistics
+import time
+
+from sqlmodel import Session, select
+
+from app.models import Booking, FinancialSplit
+from app.services.rollup_service import RollupService
+from app.services.stats_service import StatsService
+
+from .seed import create_benchmark_engine, seed_bookings
+
+
+def legacy_dashboard_stats(session: Session) -> dict:
+    """Implementação original: carrega todas as linhas e soma em Python"""
+    total_bookings = session.exec(select(Booking)).all()
+    pending_approval = session.exec(
+        select(Booking).where(Booking.needs_approval == True, Booking.status_approved == False)  # noqa: E712
+    ).all()
+    financial_splits = session.exec(select(FinancialSplit)).all()
+    return {
+        "total_bookings": len(total_bookings),
+        "pending_approval": len(pending_approval),
+        "total_amount": sum(fs.total_amount for fs in financial_splits),
+    }
+
+
+def measure(fn, engine, repeat: int) -> float:
+    """Mediana em milissegundos (sessão nova a cada execução)"""
+    timings = []
+    for _ in range(repeat):
+        with Session(engine) as session:
+            started = time.perf_counter()
+            fn(session)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='não correr a versão antiga acima deste tamanho')
+    parser.add_argument('--url', default='sqlite://', help='URL da BD (apagada e recriada)')
+    args = parser.parse_args()
+
+    print(f"{'bookings':>10} {'legacy ms':>12} {'sql ms':>10} {'rollup ms':>10}")
+    for size in args.sizes:
+        engine = create_benchmark_engine(args.url)
+        seed_bookings(engine, size)
+
+        sql_ms = measure(StatsService().dashboard_stats, engine, args.repeat)
+        rollup_ms = measure(RollupService().dashboard_stats, engine, args.repeat)
+        legacy = '-'
+        if size <= args.legacy_max:
+            legacy = f"{measure(legacy_dashboard_stats, engine, max(1, args.repeat // 2)):.1f}"
+        print(f"{size:>10} {legacy:>12} {sql_ms:>10.1f} {rollup_ms:>10.1f}")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
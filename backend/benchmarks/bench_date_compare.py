@@ -0,0 +1,55 @@
+"""
+Classificação de discrepâncias de datas: compare_dates linha a linha vs
+compare_batch vectorizado (datetime64 e texto)
+
+Correr a partir de backend/: python -m benchmarks.bench_date_compare
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.services.date_service import DateComparator
+
+
+def generate(count: int, seed: int = 42):
+    """Timestamps e datas formatadas com 0-3 dias de diferença"""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2025-01-01T00:00')
+    timestamps = start + rng.integers(0, 365 * 24 * 60, count).astype('timedelta64[m]')
+    shift = rng.choice([0, 0, 0, 0, 30, 90, 24 * 60, 26 * 60, 3 * 24 * 60], count).astype('timedelta64[m]')
+    return pd.Series(timestamps), pd.Series(timestamps + shift)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1_000_000)
+    parser.add_argument('--per-row-sample', type=int, default=100_000,
+                        help='linhas medidas no caminho antigo (extrapolado para --count)')
+    args = parser.parse_args()
+
+    timestamps, formatted = generate(args.count)
+    formatted_text = formatted.dt.strftime('%d/%m/%Y, %H:%M')
+    comparator = DateComparator()
+
+    sample = args.per_row_sample
+    ts_objects = [value.to_pydatetime() for value in timestamps.head(sample)]
+    text_sample = formatted_text.head(sample).tolist()
+    started = time.perf_counter()
+    for ts, fmt in zip(ts_objects, text_sample):
+        comparator.compare_dates(ts, fmt)
+    per_row = (time.perf_counter() - started) * args.count / sample
+    print(f"{'compare_dates (linha a linha)':<34} {per_row:>8.2f} s (extrapolado de {sample})")
+
+    started = time.perf_counter()
+    comparator.compare_batch(timestamps, formatted)
+    print(f"{'compare_batch datetime64':<34} {time.perf_counter() - started:>8.2f} s")
+
+    started = time.perf_counter()
+    DateComparator().compare_batch(timestamps, formatted_text)
+    print(f"{'compare_batch texto (com parse)':<34} {time.perf_counter() - started:>8.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Parse de checkOut: lista sequencial de strptime (implementação antiga) vs
+FormattedDateParser (formato inferido, regex pré-compilada, cache) vs
+parse_series (conversão vectorizada com o formato inferido)
+
+Correr a partir de backend/: python -m benchmarks.bench_date_parsing
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app.services.date_service import DATE_FORMATS, FormattedDateParser
+
+
+def legacy_parse(date_str):
+    """_parse_formatted_date original: até nove strptime por valor"""
+    if not date_str or date_str.strip() == '':
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def generate(count: int, fmt: str, outlier_rate: float, seed: int = 42):
+    """count strings no formato fmt, com uma fracção noutros formatos/lixo"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    values = []
+    for _ in range(count):
+        moment = start + timedelta(minutes=rng.randrange(0, 365 * 24 * 60))
+        if rng.random() < outlier_rate:
+            values.append(rng.choice([moment.strftime(rng.choice(DATE_FORMATS)), '', 'n/d']))
+        else:
+            values.append(moment.strftime(fmt))
+    return values
+
+
+def timed(label: str, fn, baseline: float = None) -> float:
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    speedup = f"{baseline / elapsed:>8.1f}x" if baseline else ''
+    print(f"{label:<28} {elapsed:>8.2f} s {speedup}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1_000_000)
+    parser.add_argument('--format', default='%Y-%m-%d %H:%M', choices=DATE_FORMATS,
+                        help='formato dominante (os últimos da lista custam mais ao parse antigo)')
+    parser.add_argument('--outliers', type=float, default=0.01)
+    args = parser.parse_args()
+
+    values = generate(args.count, args.format, args.outliers)
+    print(f"{args.count} strings, formato {args.format!r}, {len(set(values))} distintas")
+
+    baseline = timed("legacy strptime", lambda: [legacy_parse(value) for value in values])
+    date_parser = FormattedDateParser()
+    timed("FormattedDateParser.parse", lambda: [date_parser.parse(value) for value in values], baseline)
+
+    # Só o efeito da inferência + regex (sem cache de strings repetidas)
+    fast = FormattedDateParser(args.format)
+    timed("regex sem cache", lambda: [fast._parse_fast(v.strip(), args.format) or fast._parse_any(v.strip()) for v in values], baseline)
+
+    series = pd.Series(values)
+    timed("parse_series (vectorizado)", lambda: FormattedDateParser().parse_series(series), baseline)
+
+
+if __name__ == '__main__':
+    main()
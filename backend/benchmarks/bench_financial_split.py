@@ -0,0 +1,75 @@
+"""
+Divisão 60/40: calculate_split por booking (Decimal, implementação antiga)
+vs split_cents (cêntimos inteiros em NumPy) e generate_financial_report;
+resolução de regras por marca/data (SplitRuleSet) com muitas regras
+
+Correr a partir de backend/: python -m benchmarks.bench_financial_split
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from app.services.financial_service import FinancialCalculator
+from app.services.split_rules import SplitRuleSet
+
+
+def legacy_split(amount):
+    """calculate_split original: dois quantize Decimal por valor"""
+    if amount <= 0:
+        return 0.0, 0.0
+    total = Decimal(str(amount))
+    partner = (total * Decimal('0.60')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    multipark = (total * Decimal('0.40')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return float(partner), float(multipark)
+
+
+def timed(label: str, fn, baseline: float = None) -> float:
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    speedup = f"{baseline / elapsed:>8.1f}x" if baseline else ''
+    print(f"{label:<34} {elapsed:>8.2f} s {speedup}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1_000_000)
+    parser.add_argument('--rules', type=int, default=10_000, help='regras (50 marcas, datas aleatórias)')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    amounts = [rng.randrange(0, 50000) / 100 for _ in range(args.count)]
+    bookings = [
+        {'price_delivery': amount, 'park_brand': rng.choice(['airpark', 'redpark', 'skypark']),
+         'payment_method': rng.choice(['Multibanco', 'Credit Card', 'MB Way'])}
+        for amount in amounts
+    ]
+    calculator = FinancialCalculator()
+
+    baseline = timed("calculate_split (Decimal)", lambda: [legacy_split(amount) for amount in amounts])
+    timed("split_cents (NumPy)", lambda: calculator.split_cents(amounts), baseline)
+
+    print(f"{args.count} bookings, relatório completo:")
+    baseline = timed("  3 passagens Decimal", lambda: [
+        legacy_split(booking['price_delivery']) for _ in range(3) for booking in bookings
+    ])
+    timed("  generate_financial_report", lambda: calculator.generate_financial_report(bookings), baseline)
+
+    brands = [f"brand{index}" for index in range(50)]
+    rules = SplitRuleSet([
+        (rng.choice(brands + [None]), date(2024, 1, 1) + timedelta(days=rng.randrange(730)), rng.randrange(4000, 8000), rule_id)
+        for rule_id in range(args.rules)
+    ])
+    booking_brands = [rng.choice(brands) for _ in amounts]
+    days = [date(2024, 1, 1) + timedelta(days=rng.randrange(730)) for _ in amounts]
+    print(f"{args.count} bookings, {args.rules} regras:")
+    partner_bps = rules.resolve(booking_brands, days)
+    timed("  resolve + split_cents", lambda: calculator.split_cents(amounts, rules.resolve(booking_brands, days)))
+    timed("  só split_cents", lambda: calculator.split_cents(amounts, partner_bps))
+
+
+if __name__ == '__main__':
+    main()
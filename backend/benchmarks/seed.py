@@ -0,0 +1,76 @@
+"""
+Geração de bookings sintéticos para benchmarks
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.models import Booking, FinancialSplit
+from app.services.financial_service import FinancialCalculator
+from app.services.rollup_service import RollupService
+
+BRANDS = ['skypark', 'airpark', 'multipark']
+PAYMENT_METHODS = ['Multibanco', 'Credit Card', 'Cash', 'Other']
+SEED_CHUNK = 20000
+
+
+def create_benchmark_engine(url: str = "sqlite://"):
+    """Engine para benchmark (SQLite em memória por omissão)"""
+    from sqlmodel.pool import StaticPool
+
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def seed_bookings(engine, count: int, seed: int = 42):
+    """Insere count bookings (e splits) com dados aleatórios reprodutíveis e reconstrói o rollup"""
+    rng = random.Random(seed)
+    calculator = FinancialCalculator()
+    start = datetime(2025, 1, 1)
+
+    next_id = 1
+    with engine.begin() as connection:
+        while next_id <= count:
+            bookings, splits = [], []
+            for booking_id in range(next_id, min(next_id + SEED_CHUNK, count + 1)):
+                checkout = start + timedelta(minutes=rng.randrange(0, 365 * 24 * 60))
+                price = round(rng.uniform(5, 120), 2)
+                needs_approval = rng.random() < 0.1
+                bookings.append({
+                    'id': booking_id,
+                    'license_plate': (
+                        f"{rng.randrange(10, 99)}-{rng.choice('ABCDEFGH')}{rng.choice('XYZW')}-{rng.randrange(10, 99)}"
+                    ),
+                    'checkout_timestamp': checkout,
+                    'checkout_formatted': checkout.strftime('%d/%m/%Y, %H:%M'),
+                    'price_delivery': price,
+                    'park_brand': rng.choice(BRANDS),
+                    'payment_method': rng.choice(PAYMENT_METHODS),
+                    'name': 'Nome',
+                    'lastname': 'Apelido',
+                    'date_difference_days': 2 if needs_approval else 0,
+                    'needs_approval': needs_approval,
+                    'status_approved': not needs_approval or rng.random() < 0.5,
+                    'created_at': checkout - timedelta(days=rng.randrange(1, 30)),
+                })
+                partner, multipark = calculator.calculate_split(price)
+                splits.append({
+                    'booking_id': booking_id,
+                    'partner_amount_60': partner,
+                    'multipark_amount_40': multipark,
+                    'total_amount': price,
+                    'created_at': checkout,
+                })
+            connection.execute(insert(Booking.__table__), bookings)
+            connection.execute(insert(FinancialSplit.__table__), splits)
+            next_id += SEED_CHUNK
+
+    with Session(engine) as session:
+        RollupService().rebuild(session)
@@ -0,0 +1,312 @@
+"""
+Suite de benchmarks reprodutível com resultados em JSON e comparação com um baseline
+
+Casos (por tamanho N):
+- upload[memory|stream]: POST /api/upload-excel de um .xlsx sintético com N
+  linhas numa BD vazia (ponta a ponta: leitura, datas, splits, BD)
+- process_file[memory|stream]: ExcelProcessor.process_file / iter_chunks
+- compare_dates[row|batch]: DateComparator.compare_dates por linha vs compare_batch
+- calculate_split[row|batch], generate_financial_report
+- dashboard_stats, bookings_page[first|walk]: endpoints sobre uma BD com N
+  bookings (seed.seed_bookings); a cache de respostas fica desligada
+
+Os casos com Excel só correm para N <= --excel-max (gerar e ler .xlsx grandes
+demora minutos). Os dados são gerados com seeds fixas.
+
+Correr a partir de backend/:
+    python -m benchmarks.suite --sizes 10000 100000 --output results.json
+    python -m benchmarks.suite --sizes 10000 --baseline results.json
+Com --baseline o processo termina com código 1 se algum caso ficar mais de
+--threshold (por omissão 20%) e mais de --min-delta-ms mais lento do que no
+baseline. Os tempos só são comparáveis na mesma máquina (ver "environment").
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.database import get_read_session, get_session
+from app.main import app
+from app.services.cache_service import response_cache
+from app.services.date_service import DateComparator
+from app.services.excel_service import ExcelProcessor
+from app.services.financial_service import FinancialCalculator
+from app.services.log_service import setup_logging
+from app.services.split_rules import split_rule_cache
+
+from .seed import create_benchmark_engine, seed_bookings
+from .synthetic import excel_rows, workbook_bytes
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+CASES = [
+    'upload', 'process_file', 'compare_dates', 'calculate_split',
+    'generate_financial_report', 'dashboard_stats', 'bookings_page',
+]
+
+
+class Suite:
+    """Corre os casos e junta os resultados (mediana, mínimo e máximo em ms)"""
+
+    def __init__(self, repeat: int = 3, only: Optional[List[str]] = None, url: str = 'sqlite://'):
+        self.repeat = repeat
+        self.only = set(only or CASES)
+        self.url = url
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(self, name: str, size: int, fn: Callable, rows: Optional[int] = None, setup: Optional[Callable] = None):
+        """fn() repetido; setup() (não medido) antes de cada repetição"""
+        timings = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        median = statistics.median(timings)
+        result = {
+            'case': name,
+            'size': size,
+            'median_ms': round(median, 3),
+            'min_ms': round(min(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'repeat': self.repeat,
+        }
+        if rows:
+            result['rows_per_second'] = round(rows / (median / 1000), 1) if median > 0 else 0.0
+        self.results.append(result)
+        print(f"  {name:<32} {median:>12.1f} ms" + (f" {result['rows_per_second']:>14,.0f} linhas/s" if rows else ''))
+
+    def run(self, sizes: List[int], excel_max: int):
+        for size in sizes:
+            print(f"{size} bookings")
+            if size <= excel_max and self.only & {'upload', 'process_file'}:
+                self.excel_cases(size)
+            if self.only & {'compare_dates', 'calculate_split', 'generate_financial_report'}:
+                self.batch_cases(size)
+            if self.only & {'dashboard_stats', 'bookings_page'}:
+                self.endpoint_cases(size)
+
+    def excel_cases(self, size: int):
+        data = workbook_bytes(size)
+
+        if 'process_file' in self.only:
+            processor = ExcelProcessor()
+
+            def upload_file():
+                return UploadFile(io.BytesIO(data), filename='bookings.xlsx')
+
+            self.measure('process_file[memory]', size, lambda: asyncio.run(processor.process_file(upload_file())), size)
+            with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as spool:
+                spool.write(data)
+            try:
+                self.measure(
+                    'process_file[stream]', size,
+                    lambda: sum(len(chunk) for chunk in processor.iter_chunks(spool.name)), size
+                )
+            finally:
+                os.unlink(spool.name)
+
+        if 'upload' in self.only:
+            for mode in ('memory', 'stream'):
+                engines = []
+
+                def fresh_database():
+                    engines.append(create_benchmark_engine(self.url))
+                    split_rule_cache.invalidate()
+
+                def upload():
+                    with app_client(engines[-1]) as client:
+                        response = client.post(
+                            '/api/upload-excel', params={'mode': mode},
+                            files={'file': ('bookings.xlsx', data, XLSX_MIME)}
+                        )
+                        response.raise_for_status()
+
+                self.measure(f'upload[{mode}]', size, upload, size, setup=fresh_database)
+                for engine in engines:
+                    engine.dispose()
+
+    def batch_cases(self, size: int):
+        """Sobre os bookings já processados do export sintético (sem ler .xlsx)"""
+        processor = ExcelProcessor()
+        frame = pd.DataFrame(list(excel_rows(size)), columns=ExcelProcessor.REQUIRED_COLUMNS)
+        bookings = processor.to_records(processor.transform_frame(frame))
+        timestamps = [booking['checkout_timestamp'] for booking in bookings]
+        formatted = pd.Series([booking['checkout_formatted'] for booking in bookings], dtype=object)
+        amounts = [booking['price_delivery'] for booking in bookings]
+
+        if 'compare_dates' in self.only:
+            comparator = DateComparator()
+            self.measure('compare_dates[row]', size, lambda: [
+                comparator.compare_dates(timestamp, text) for timestamp, text in zip(timestamps, formatted)
+            ], len(bookings))
+            self.measure('compare_dates[batch]', size, lambda: comparator.compare_batch(timestamps, formatted), len(bookings))
+
+        calculator = FinancialCalculator()
+        if 'calculate_split' in self.only:
+            self.measure(
+                'calculate_split[row]', size,
+                lambda: [calculator.calculate_split(amount) for amount in amounts], len(amounts)
+            )
+            self.measure('calculate_split[batch]', size, lambda: calculator.calculate_splits(amounts), len(amounts))
+        if 'generate_financial_report' in self.only:
+            self.measure(
+                'generate_financial_report', size,
+                lambda: calculator.generate_financial_report(bookings), len(bookings)
+            )
+
+    def endpoint_cases(self, size: int):
+        engine = create_benchmark_engine(self.url)
+        seed_bookings(engine, size)
+        split_rule_cache.invalidate()
+        ttl, response_cache.ttl = response_cache.ttl, 0  # Medir a BD, não a cache
+        try:
+            with app_client(engine) as client:
+                if 'dashboard_stats' in self.only:
+                    self.measure('dashboard_stats', size, lambda: client.get('/api/dashboard/stats').raise_for_status())
+                if 'bookings_page' in self.only:
+                    self.measure(
+                        'bookings_page[first]', size,
+                        lambda: client.get('/api/bookings', params={'limit': 100}).raise_for_status()
+                    )
+                    self.measure('bookings_page[walk]', size, lambda: self._walk(client, pages=20, limit=500), 20 * 500)
+        finally:
+            response_cache.ttl = ttl
+            engine.dispose()
+
+    def _walk(self, client: TestClient, pages: int, limit: int):
+        """Primeiras páginas seguindo o cursor keyset (X-Next-Cursor)"""
+        params = {'limit': limit}
+        for _ in range(pages):
+            response = client.get('/api/bookings', params=params)
+            response.raise_for_status()
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+            params = {'limit': limit, 'cursor': cursor}
+
+
+@contextmanager
+def app_client(engine) -> Iterator[TestClient]:
+    """TestClient com as sessões da aplicação ligadas ao engine do benchmark"""
+    def session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = session_override
+    app.dependency_overrides[get_read_session] = session_override
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+def environment() -> Dict[str, Any]:
+    """Contexto do run, para só comparar resultados comparáveis"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+    }
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float, min_delta_ms: float = 1.0
+) -> List[Dict[str, Any]]:
+    """
+    Variação da mediana de cada caso presente nos dois runs; diferenças
+    abaixo de min_delta_ms (ruído dos casos de poucos ms) contam como iguais
+    """
+    previous = {(result['case'], result['size']): result for result in baseline['results']}
+    rows = []
+    for result in results:
+        before = previous.get((result['case'], result['size']))
+        if before is None or before['median_ms'] <= 0:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        if abs(result['median_ms'] - before['median_ms']) < min_delta_ms:
+            status = 'same'
+        elif ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'improvement'
+        else:
+            status = 'same'
+        rows.append({
+            'case': result['case'],
+            'size': result['size'],
+            'baseline_ms': before['median_ms'],
+            'median_ms': result['median_ms'],
+            'ratio': round(ratio, 3),
+            'status': status,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000], help='ex.: 10000 100000 1000000')
+    parser.add_argument('--excel-max', type=int, default=100_000, help='maior N para os casos com .xlsx')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=CASES, help='só estes casos')
+    parser.add_argument('--url', default='sqlite://', help='URL da BD (apagada e recriada)')
+    parser.add_argument('--output', help='ficheiro JSON com os resultados')
+    parser.add_argument('--baseline', help='JSON de um run anterior para comparar')
+    parser.add_argument('--threshold', type=float, default=0.2, help='variação tolerada (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='diferença mínima para contar como variação')
+    args = parser.parse_args(argv)
+    setup_logging()  # Avisos por linha com limite de taxa
+
+    suite = Suite(args.repeat, args.only, args.url)
+    suite.run(args.sizes, args.excel_max)
+    report = {'environment': environment(), 'results': suite.results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        report['comparison'] = compare(suite.results, baseline, args.threshold, args.min_delta_ms)
+        print(f"\nComparação com {args.baseline} (commit {baseline['environment'].get('commit')}):")
+        for row in report['comparison']:
+            print(
+                f"  {row['case']:<32} {row['size']:>8} {row['baseline_ms']:>12.1f} -> "
+                f"{row['median_ms']:>12.1f} ms  x{row['ratio']:<6} {row['status']}"
+            )
+        regressions = [row for row in report['comparison'] if row['status'] == 'regression']
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"\nResultados em {args.output}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Exports Excel sintéticos (todas as ExcelProcessor.REQUIRED_COLUMNS) para benchmarks
+
+Reprodutíveis pela seed e próximos dos ficheiros reais: checkoutDate
+maioritariamente como Timestamp(seconds=..., nanoseconds=...) do Firebase,
+alguns como texto ou em branco; checkOut no formato principal com uma
+parte noutros DATE_FORMATS e com 0-3 dias de diferença; células vazias
+(matrícula, preço, pagamento online, paymentIntentId) e marcas com
+maiúsculas/espaços.
+
+Correr a partir de backend/:
+    python -m benchmarks.synthetic --rows 100000 -o /tmp/bookings.xlsx
+"""
+import argparse
+import io
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+
+import openpyxl
+
+from app.services.date_service import DATE_FORMATS
+from app.services.excel_service import ExcelProcessor
+
+from .seed import BRANDS, PAYMENT_METHODS
+
+PRIMARY_FORMAT = DATE_FORMATS[0]
+
+# Diferença checkOut - checkoutDate (minutos): a maioria igual, algumas a
+# passar a meia-noite dentro/fora do limiar e algumas com dias de diferença
+SHIFTS = [0] * 14 + [30, 90, 24 * 60, 24 * 60 + 45, 26 * 60, 3 * 24 * 60]
+
+FIRST_NAMES = ['Ana', 'João', 'Maria', 'Pedro', 'Inês', 'Rui', 'Sofia', 'Tiago']
+LAST_NAMES = ['Silva', 'Santos', 'Ferreira', 'Pereira', 'Costa', 'Oliveira', 'Martins']
+EXTRA_SERVICES = ['', '', '', 'Lavagem exterior', 'Lavagem completa', 'Carregamento EV']
+
+
+def _maybe(rng: random.Random, probability: float, value):
+    """value, ou None (célula vazia) com a probabilidade dada"""
+    return None if rng.random() < probability else value
+
+
+def excel_rows(count: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """Linhas do export (coluna Excel -> valor), None para células vazias"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+
+    for index in range(count):
+        checkout = start + timedelta(minutes=rng.randrange(0, 365 * 24 * 60))
+        formatted = checkout + timedelta(minutes=rng.choice(SHIFTS))
+        booked = checkout - timedelta(days=rng.randrange(1, 60), minutes=rng.randrange(0, 24 * 60))
+        price = round(rng.uniform(5, 120), 2)
+
+        kind = rng.random()
+        if kind < 0.85:
+            checkout_value = f"Timestamp(seconds={int(checkout.timestamp())}, nanoseconds={rng.randrange(0, 1000) * 1000000})"
+        elif kind < 0.95:
+            checkout_value = checkout.strftime(PRIMARY_FORMAT)
+        else:
+            checkout_value = None
+
+        date_format = PRIMARY_FORMAT if rng.random() < 0.9 else rng.choice(DATE_FORMATS)
+        brand = rng.choice(BRANDS)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+        plate = f"{rng.randrange(10, 99)}-{rng.choice('ABCDEFGH')}{rng.choice('XYZW')}-{rng.randrange(10, 99)}"
+
+        yield {
+            'licensePlate': _maybe(rng, 0.01, plate),
+            'checkoutDate': checkout_value,
+            'extraServices': rng.choice(EXTRA_SERVICES),
+            'parkingType': rng.choice(['Coberto', 'Descoberto']),
+            'checkOut': _maybe(rng, 0.02, formatted.strftime(date_format)),
+            'campaign': rng.choice(['', '', 'VERAO25', 'BLACKFRIDAY']),
+            'paymentMethod': rng.choice(PAYMENT_METHODS),
+            'lastname': last_name,
+            'name': first_name,
+            'alocation': f"P{rng.randrange(1, 4)}-{rng.randrange(1, 400):03d}",
+            'priceOnDelivery': _maybe(rng, 0.03, price),
+            'campaignPay': _maybe(rng, 0.2, rng.random() < 0.1),
+            'bookingDate': booked.strftime(PRIMARY_FORMAT),
+            'checkIn': (booked + timedelta(days=rng.randrange(0, 3))).strftime(PRIMARY_FORMAT),
+            'lastName': last_name,
+            'bookingPrice': price,
+            'hasOnlinePayment': _maybe(rng, 0.1, rng.random() < 0.7),
+            'stats': rng.choice(['confirmed', 'confirmed', 'confirmed', 'cancelled']),
+            'row': str(index + 2),
+            'deliveryPrice': _maybe(rng, 0.5, round(rng.uniform(0, 15), 2)),
+            'paymentIntentId': _maybe(rng, 0.2, f"pi_{rng.getrandbits(96):024x}"),
+            'parkBrand': brand if rng.random() < 0.9 else f" {brand.capitalize()} ",
+        }
+
+
+def write_workbook(target, count: int, seed: int = 42):
+    """Escreve o .xlsx em modo write_only (caminho ou ficheiro binário)"""
+    columns: List[str] = ExcelProcessor.REQUIRED_COLUMNS
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for row in excel_rows(count, seed):
+        sheet.append([row[column] for column in columns])
+    workbook.save(target)
+
+
+def workbook_bytes(count: int, seed: int = 42) -> bytes:
+    buffer = io.BytesIO()
+    write_workbook(buffer, count, seed)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('-o', '--output', required=True, help='caminho do .xlsx')
+    args = parser.parse_args()
+    write_workbook(args.output, args.rows, args.seed)
+    print(f"{args.rows} linhas escritas em {args.output}")
+
+
+if __name__ == '__main__':
+    main()
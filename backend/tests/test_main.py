@@ -3,12 +3,49 @@ Testes básicos para MultiPark Dashboard API
 """
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, create_engine, SQLModel
+from sqlalchemy import exc
+from sqlmodel import Session, create_engine, SQLModel, select
 from sqlmodel.pool import StaticPool
+import pandas as pd
+import csv
+import io
+import json
+import threading
+import time
+from datetime import datetime
 
-from app.main import app
-from app.database import get_session
-from app.models import Booking, FinancialSplit
+from app.main import app, job_manager
+from app import database
+from app.database import (
+    InstrumentedQueuePool, SessionRouter, get_async_session, get_read_session, get_session, pool_status
+)
+from app.models import Booking, FinancialSplit, SplitWriteMode
+from app.services.excel_service import ExcelProcessor
+from app.services.ingestion_service import BulkIngestor
+from app.services.reclassify_service import ReclassificationService
+from app.services.analytics_service import booking_snapshot
+from app.services.cache_service import response_cache
+from app.services.export_service import BookingExportService
+from app.services.metrics_service import DB_QUERY_SECONDS, HTTP_SECONDS, ROWS, STAGE_SECONDS, metrics
+from app.services.split_rules import split_rule_cache
+from app.services.split_service import SplitRepairService, resolve_split_write_mode
+from app.services.rollup_service import RollupService
+from app.services.stats_service import StatsService
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def distinct_rows(sample, count):
+    """Linhas com matrículas diferentes (não deduplicadas na ingestão)"""
+    return [dict(sample[0], licensePlate=f"XYZ{i:03d}") for i in range(count)]
+
+
+def build_excel(rows):
+    """Gera um ficheiro Excel em memória com todas as colunas obrigatórias"""
+    df = pd.DataFrame(rows, columns=ExcelProcessor.REQUIRED_COLUMNS)
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
 
 
 # Test database setup
@@ -20,6 +57,8 @@ def session_fixture():
         poolclass=StaticPool,
     )
     SQLModel.metadata.create_all(engine)
+    split_rule_cache.invalidate()  # Regras em cache são de outra BD
+    response_cache.clear()
     with Session(engine) as session:
         yield session
 
@@ -30,6 +69,7 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_read_session] = get_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
@@ -54,6 +94,164 @@ class TestMain:
         assert data["total_bookings"] == 0
         assert data["pending_approval"] == 0
         assert data["total_amount"] == 0.0
+    
+    def test_dashboard_stats_aggregates(self, client: TestClient, session: Session):
+        """Teste das somas agregadas na BD"""
+        for plate, price, pending in [("A1", 100.0, False), ("B2", 33.25, True)]:
+            booking = Booking(license_plate=plate, price_delivery=price, needs_approval=pending)
+            session.add(booking)
+            session.commit()
+            session.add(FinancialSplit(
+                booking_id=booking.id,
+                partner_amount_60=round(price * 0.6, 2),
+                multipark_amount_40=round(price * 0.4, 2),
+                total_amount=price
+            ))
+        session.commit()
+        
+        data = client.get("/api/dashboard/stats").json()
+        assert data["total_bookings"] == 2
+        assert data["pending_approval"] == 1
+        assert data["total_amount"] == 133.25
+        assert data["partner_60_percent"] == 79.95
+        assert data["multipark_40_percent"] == 53.3
+        assert data["approval_rate"] == 50.0
+
+
+class TestConnectionPool:
+    """Testes para o pool de ligações instrumentado"""
+    
+    def test_pool_metrics_count_waits_and_timeouts(self, tmp_path):
+        """Checkout com o pool esgotado conta uma espera e um timeout"""
+        pool_engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+        )
+        held = pool_engine.connect()
+        with pytest.raises(exc.TimeoutError):
+            pool_engine.connect()
+        held.close()
+        with pool_engine.connect():
+            status = pool_status(pool_engine)
+        
+        assert (status["size"], status["checked_out"]) == (1, 1)
+        assert (status["checkouts"], status["waits"], status["timeouts"]) == (2, 1, 1)
+        pool_engine.dispose()
+    
+    def test_pool_endpoint(self, client: TestClient):
+        """Estado do pool do engine da aplicação"""
+        data = client.get("/api/db/pool").json()
+        assert data["sync"]["pool"] == "InstrumentedQueuePool"
+        assert data["sync"]["max_overflow"] == 20
+
+
+class TestMetrics:
+    """Testes para as métricas Prometheus (/metrics)"""
+    
+    def test_upload_stages_rows_routes_and_queries(self, client: TestClient, sample_excel_data):
+        """Um upload regista as etapas, as linhas, a rota e as queries; /metrics exporta tudo"""
+        metrics.clear()
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(distinct_rows(sample_excel_data, 3)), XLSX_MIME)})
+        client.get("/api/upload-jobs/nao-existe")
+        first, cached = client.get("/api/dashboard/stats"), client.get("/api/dashboard/stats")
+        assert (first.headers["X-Cache"], cached.headers["X-Cache"]) == ("MISS", "HIT")
+        
+        for stage_name in ("read_excel", "process_rows", "compare_dates", "calculate_split", "insert", "commit"):
+            assert STAGE_SECONDS.count(stage_name) == 1, stage_name
+        assert (ROWS.value("read"), ROWS.value("inserted")) == (3, 3)
+        assert HTTP_SECONDS.count("POST", "/api/upload-excel", "200") == 1
+        assert HTTP_SECONDS.count("GET", "/api/upload-jobs/{job_id}", "404") == 1
+        assert HTTP_SECONDS.count("GET", "/api/dashboard/stats", "200") == 2  # O HIT da cache também
+        assert HTTP_SECONDS.count("GET", "unmatched", "200") == 0
+        assert DB_QUERY_SECONDS.count("INSERT") >= 2
+        
+        response = client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'multipark_stage_seconds_count{stage="read_excel"} 1' in body
+        assert 'multipark_rows_total{stage="inserted"} 3' in body
+        assert 'multipark_stage_seconds_bucket{stage="commit",le="+Inf"} 1' in body
+        assert 'multipark_db_pool_checkouts{engine="sync"}' in body
+    
+    def test_disabled_records_nothing(self, client: TestClient, sample_excel_data, monkeypatch):
+        """Com as métricas desligadas nada é registado"""
+        metrics.clear()
+        monkeypatch.setattr(metrics, "enabled", False)
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(sample_excel_data), XLSX_MIME)})
+        assert STAGE_SECONDS.count("insert") == 0
+        assert ROWS.value("inserted") == 0
+        assert HTTP_SECONDS.count("POST", "/api/upload-excel", "200") == 0
+        assert DB_QUERY_SECONDS.count("INSERT") == 0
+
+
+class TestReadReplica:
+    """Testes para o encaminhamento das leituras para a réplica"""
+    
+    def test_reads_go_to_replica_except_after_writes(self, client: TestClient, session: Session, sample_excel_data, monkeypatch):
+        """Réplica por omissão; primário com o header ou depois de uma escrita (cookie)"""
+        replica = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        SQLModel.metadata.create_all(replica)
+        monkeypatch.setattr(database, "session_router", SessionRouter(session.get_bind(), replica))
+        del app.dependency_overrides[get_read_session]
+        
+        response = client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(sample_excel_data), XLSX_MIME)})
+        assert SessionRouter.STICKY_COOKIE in response.cookies
+        assert client.get("/api/dashboard/stats").json()["total_bookings"] == 1
+        
+        client.cookies.clear()
+        assert client.get("/api/dashboard/stats").json()["total_bookings"] == 0
+        assert client.get("/api/bookings").json() == []
+        headers = {SessionRouter.CONSISTENCY_HEADER: "primary"}
+        assert client.get("/api/dashboard/stats", headers=headers).json()["total_bookings"] == 1
+    
+    def test_async_engine_serves_read_endpoints(self, client: TestClient, sample_excel_data, tmp_path, monkeypatch):
+        """Com o engine assíncrono o dashboard e a listagem leem pela AsyncSession"""
+        pytest.importorskip("aiosqlite")
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from sqlalchemy.pool import NullPool
+        
+        path = tmp_path / "async.db"
+        file_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        SQLModel.metadata.create_all(file_engine)
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+        monkeypatch.setattr(database, "async_session_router", SessionRouter(async_engine))
+        app.dependency_overrides[get_session] = lambda: Session(file_engine)
+        app.dependency_overrides[get_read_session] = get_async_session
+        
+        rows = distinct_rows(sample_excel_data, 2)
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows), XLSX_MIME)})
+        
+        assert client.get("/api/dashboard/stats").json()["total_bookings"] == 2
+        bookings = client.get("/api/bookings").json()
+        assert sorted(booking["license_plate"] for booking in bookings) == ["XYZ000", "XYZ001"]
+        assert client.get("/api/bookings", params={"format": "columnar", "fields": "license_plate"}).json()["id"]
+        file_engine.dispose()
+
+
+class TestResponseCache:
+    """Testes para a cache de respostas do dashboard"""
+    
+    def test_cache_hits_etag_and_invalidation_on_approval(self, client: TestClient, session: Session, sample_excel_data):
+        """Segunda leitura da cache, 304 com If-None-Match e versão nova depois de aprovar"""
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(distinct_rows(sample_excel_data, 2)), XLSX_MIME)})
+        first = client.get("/api/dashboard/stats")
+        second = client.get("/api/dashboard/stats")
+        assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+        assert second.json() == first.json()
+        
+        etag = second.headers["ETag"]
+        not_modified = client.get("/api/dashboard/stats", headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        
+        booking = session.exec(select(Booking)).first()
+        client.patch(f"/api/bookings/{booking.id}/approve")
+        after = client.get("/api/dashboard/stats", headers={"If-None-Match": etag})
+        assert after.status_code == 200
+        assert after.headers["X-Cache"] == "MISS"
+        assert after.json()["approval_rate"] != first.json()["approval_rate"]
+        
+        stats = client.get("/api/cache/stats").json()
+        assert (stats["hits"], stats["misses"], stats["not_modified"]) == (2, 2, 1)
 
 
 class TestBookings:
@@ -65,6 +263,58 @@ class TestBookings:
         assert response.status_code == 200
         assert response.json() == []
     
+    def test_get_bookings_keyset_pagination(self, client: TestClient, sample_excel_data):
+        """Páginas pelo header X-Next-Cursor, sem repetir bookings com o mesmo created_at"""
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(distinct_rows(sample_excel_data, 5)), XLSX_MIME)})
+        
+        seen, cursor = [], None
+        while True:
+            response = client.get("/api/bookings", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+            assert response.status_code == 200
+            seen += [b["id"] for b in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == sorted(seen, reverse=True) and len(set(seen)) == 5
+        assert client.get("/api/bookings?cursor=invalido").status_code == 400
+    
+    def test_get_bookings_filters_in_sql(self, client: TestClient, session: Session):
+        """Filtros de BookingFilters aplicados na query"""
+        session.add(Booking(license_plate="A1", price_delivery=10, park_brand="skypark", payment_method="Cash"))
+        session.add(Booking(license_plate="B2", price_delivery=50, park_brand="airpark", payment_method="Cash",
+                            needs_approval=True))
+        session.add(Booking(license_plate="C3", price_delivery=90, park_brand="airpark", payment_method="Multibanco",
+                            status_approved=True))
+        session.commit()
+        
+        def plates(query):
+            return sorted(b["license_plate"] for b in client.get(f"/api/bookings?{query}").json())
+        
+        assert plates("park_brand=airpark") == ["B2", "C3"]
+        assert plates("payment_method=Cash&min_amount=20") == ["B2"]
+        assert plates("max_amount=60&status_approved=false") == ["A1", "B2"]
+        assert plates("needs_approval=true") == ["B2"]
+    
+    def test_get_bookings_projection_and_formats(self, client: TestClient, session: Session):
+        """fields= lê só as colunas pedidas; columnar e ndjson com os mesmos dados"""
+        for plate, price in [("A1", 10.0), ("B2", 20.5), ("C3", 30.0)]:
+            session.add(Booking(license_plate=plate, price_delivery=price))
+        session.commit()
+        
+        response = client.get("/api/bookings?fields=license_plate,price_delivery&limit=2")
+        assert response.json() == [
+            {"id": 3, "license_plate": "C3", "price_delivery": 30.0},
+            {"id": 2, "license_plate": "B2", "price_delivery": 20.5}
+        ]
+        cursor = response.headers["X-Next-Cursor"]
+        
+        columnar = client.get(f"/api/bookings?fields=license_plate&format=columnar&cursor={cursor}").json()
+        assert columnar == {"id": [1], "license_plate": ["A1"]}
+        
+        lines = client.get("/api/bookings?format=ndjson").text.splitlines()
+        assert len(lines) == 3 and json.loads(lines[0])["license_plate"] == "C3"
+        assert client.get("/api/bookings?fields=nao_existe").status_code == 400
+    
     def test_approve_booking_not_found(self, client: TestClient):
         """Teste aprovar booking que não existe"""
         response = client.patch("/api/bookings/999/approve")
@@ -138,6 +388,515 @@ class TestFileUpload:
         response = client.post("/api/upload-excel")
         assert response.status_code == 422  # Validation error
 
+    def test_upload_excel_bulk_insert(self, client: TestClient, session: Session, sample_excel_data):
+        """Teste upload Excel com inserção em lote de bookings e splits"""
+        files = {"file": ("export.xlsx", build_excel(distinct_rows(sample_excel_data, 3)), XLSX_MIME)}
+        response = client.post("/api/upload-excel", files=files)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["bookings_count"] == 3
+        assert data["needs_approval"] == 3  # Timestamp de 2024 vs data de 2025
+        assert data["rows_per_second"] > 0
+        
+        bookings = session.exec(select(Booking)).all()
+        splits = session.exec(select(FinancialSplit)).all()
+        assert len(bookings) == 3
+        assert {s.booking_id for s in splits} == {b.id for b in bookings}
+        assert all(s.partner_amount_60 == 19.95 and s.multipark_amount_40 == 13.3 for s in splits)
+    
+    def test_upload_excel_stream_mode(self, client: TestClient, session: Session, sample_excel_data):
+        """Teste upload em modo streaming (openpyxl read_only, blocos)"""
+        rows = distinct_rows(sample_excel_data, 4) + [{"licensePlate": None, "priceOnDelivery": 10}]
+        files = {"file": ("export.xlsx", build_excel(rows), XLSX_MIME)}
+        response = client.post("/api/upload-excel?mode=stream", files=files)
+        
+        assert response.status_code == 200
+        assert response.json()["bookings_count"] == 4
+        assert len(session.exec(select(FinancialSplit)).all()) == 4
+
+
+class TestUploadDedup:
+    """Testes para re-upload idempotente"""
+    
+    def test_reupload_same_file_is_skipped(self, client: TestClient, session: Session, sample_excel_data):
+        """Ficheiro idêntico é detectado pelo hash e não insere nada"""
+        content = build_excel(distinct_rows(sample_excel_data, 3))
+        first = client.post("/api/upload-excel", files={"file": ("a.xlsx", content, XLSX_MIME)})
+        second = client.post("/api/upload-excel", files={"file": ("b.xlsx", content, XLSX_MIME)})
+        
+        assert first.json()["inserted"] == 3
+        assert second.json()["inserted"] == 0
+        assert second.json()["skipped"] == 3
+        assert len(session.exec(select(Booking)).all()) == 3
+    
+    def test_overlapping_upload_upserts(self, client: TestClient, session: Session, sample_excel_data):
+        """Linhas com a mesma chave natural são actualizadas ou ignoradas"""
+        rows = distinct_rows(sample_excel_data, 2)
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows), XLSX_MIME)})
+        
+        overlap = [rows[0], dict(rows[1], priceOnDelivery=50.0), dict(rows[1], licensePlate="NEW001")]
+        response = client.post("/api/upload-excel", files={"file": ("b.xlsx", build_excel(overlap), XLSX_MIME)})
+        data = response.json()
+        
+        assert (data["inserted"], data["updated"], data["skipped"]) == (1, 1, 1)
+        assert len(session.exec(select(Booking)).all()) == 3
+        updated = session.exec(select(Booking).where(Booking.license_plate == "XYZ001")).one()
+        split = session.exec(select(FinancialSplit).where(FinancialSplit.booking_id == updated.id)).one()
+        assert updated.price_delivery == 50.0
+        assert (split.partner_amount_60, split.multipark_amount_40) == (30.0, 20.0)
+
+    def test_key_inserted_by_concurrent_upload(self, tmp_path, sample_excel_data, monkeypatch):
+        """Outro upload insere as mesmas chaves entre _classify e o INSERT: o lote não aborta"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'race.db'}")
+        SQLModel.metadata.create_all(engine)
+        split_rule_cache.invalidate()
+        processor = ExcelProcessor()
+        frame = pd.DataFrame(distinct_rows(sample_excel_data, 3), columns=ExcelProcessor.REQUIRED_COLUMNS)
+        bookings = processor.to_records(processor.transform_frame(frame))
+
+        classify = BulkIngestor._classify
+        concurrent = []
+
+        def classify_then_race(ingestor, booking_rows):
+            result = classify(ingestor, booking_rows)
+            if not concurrent:
+                # Mesmo ficheiro com um preço diferente, confirmado noutra ligação
+                concurrent.append(dict(bookings[0], price_delivery=99.0))
+                with Session(engine) as other:
+                    concurrent.append(BulkIngestor(other).ingest([concurrent[0]] + bookings[1:]))
+            return result
+
+        monkeypatch.setattr(BulkIngestor, "_classify", classify_then_race)
+        with Session(engine) as session:
+            result = BulkIngestor(session).ingest(bookings)
+
+            assert concurrent[1]["inserted"] == 3
+            assert (result["inserted"], result["updated"], result["skipped"]) == (0, 1, 2)
+            rows = session.exec(select(Booking).order_by(Booking.license_plate)).all()
+            assert [booking.price_delivery for booking in rows] == [33.25] * 3
+            splits = session.exec(select(FinancialSplit)).all()
+            assert sorted(split.total_amount for split in splits) == [33.25] * 3
+            stats = RollupService().dashboard_stats(session).model_dump()
+            assert stats == pytest.approx(StatsService().dashboard_stats(session).model_dump())
+        engine.dispose()
+
+
+class TestUploadJobs:
+    """Testes para uploads em background"""
+    
+    def test_upload_job_lifecycle(self, client: TestClient, session: Session, sample_excel_data, monkeypatch):
+        """Teste upload assíncrono: job id imediato, progresso e resultado final"""
+        monkeypatch.setattr(job_manager, "session_factory", lambda: Session(session.get_bind()))
+        files = {"file": ("export.xlsx", build_excel(distinct_rows(sample_excel_data, 2)), XLSX_MIME)}
+        response = client.post("/api/upload-jobs", files=files)
+        
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        job_manager.wait(job_id, timeout=30)
+        
+        response = client.get(f"/api/upload-jobs/{job_id}")
+        data = response.json()
+        assert data["status"] == "completed"
+        assert data["rows_done"] == 2
+        assert data["result"]["bookings_count"] == 2
+        assert data["result"]["success"] is True
+        assert len(session.exec(select(Booking)).all()) == 2
+
+    def test_upload_job_reports_row_errors(self, client: TestClient, session: Session, sample_excel_data, monkeypatch):
+        """Linhas ignoradas por erro aparecem em errors (com o número da linha, até MAX_ROW_ERRORS)"""
+        monkeypatch.setattr(job_manager, "session_factory", lambda: Session(session.get_bind()))
+        monkeypatch.setattr(ExcelProcessor, "MAX_ROW_ERRORS", 1)
+        calls = []
+
+        def parse_timestamp(processor, value):
+            calls.append(value)
+            if len(calls) > 1:
+                raise ValueError("timestamp inválido")
+            return datetime(2024, 7, 11, 15, 30)
+        monkeypatch.setattr(ExcelProcessor, "_parse_timestamp", parse_timestamp)
+
+        files = {"file": ("export.xlsx", build_excel(distinct_rows(sample_excel_data, 3)), XLSX_MIME)}
+        job_id = client.post("/api/upload-jobs", files=files).json()["job_id"]
+        job_manager.wait(job_id, timeout=30)
+
+        data = client.get(f"/api/upload-jobs/{job_id}").json()
+        assert data["status"] == "completed"
+        assert data["rows_done"] == 1
+        assert data["errors"] == ["Linha 3: timestamp inválido", "... e mais 1 linhas com erro"]
+        assert data["result"]["errors"] == data["errors"]
+
+    def test_upload_job_not_found(self, client: TestClient):
+        """Teste job inexistente"""
+        response = client.get("/api/upload-jobs/naoexiste")
+        assert response.status_code == 404
+
+
+class TestStatsRollup:
+    """Testes para o rollup incremental das estatísticas"""
+    
+    def test_rollup_tracks_uploads_and_approvals(self, client: TestClient, session: Session, sample_excel_data):
+        """Upload, re-upload com alterações e aprovação mantêm o rollup igual à agregação directa"""
+        rows = distinct_rows(sample_excel_data, 3)
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows), XLSX_MIME)})
+        changed = [dict(rows[0], priceOnDelivery=50.0, parkBrand="skypark")]
+        client.post("/api/upload-excel", files={"file": ("b.xlsx", build_excel(changed), XLSX_MIME)})
+        booking = session.exec(select(Booking)).first()
+        client.patch(f"/api/bookings/{booking.id}/approve")
+        
+        data = client.get("/api/dashboard/stats").json()
+        assert data == pytest.approx(StatsService().dashboard_stats(session).model_dump())
+        assert data["total_bookings"] == 3
+        assert data["total_amount"] == 116.5
+        
+        RollupService().rebuild(session)
+        assert client.get("/api/dashboard/stats").json() == data
+
+
+class TestFinancialReports:
+    """Testes para os relatórios financeiros paginados"""
+    
+    @pytest.fixture
+    def report_data(self, client: TestClient, sample_excel_data):
+        """5 bookings: 3 multipark/Credit Card em julho, 2 skypark/Cash em agosto"""
+        rows = distinct_rows(sample_excel_data, 3) + [
+            dict(sample_excel_data[0], licensePlate=f"SKY{i}", parkBrand="skypark", paymentMethod="Cash",
+                 priceOnDelivery=10.0, checkoutDate=f"Timestamp(seconds={1723000000 + i}, nanoseconds=0)")
+            for i in range(2)
+        ]
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows), XLSX_MIME)})
+    
+    def test_partner_breakdown_by_brand_and_method(self, client: TestClient, report_data):
+        """Breakdown 60% por marca x método, com totais globais"""
+        data = client.get("/api/financial/partner").json()
+        assert data["percentage"] == 60
+        assert (data["count_bookings"], data["total_amount"], data["share_amount"]) == (5, 119.75, 71.85)
+        assert [(r["park_brand"], r["payment_method"], r["count_bookings"], r["share_amount"]) for r in data["items"]] == [
+            ("multipark", "Credit Card", 3, 59.85),
+            ("skypark", "Cash", 2, 12.0)
+        ]
+        assert data["next_cursor"] is None
+    
+    def test_keyset_pagination_and_date_filter(self, client: TestClient, report_data):
+        """Páginas seguidas pelo cursor e filtro por intervalo de datas"""
+        first = client.get("/api/financial/multipark?group_by=park_brand&limit=1").json()
+        second = client.get(f"/api/financial/multipark?group_by=park_brand&limit=1&cursor={first['next_cursor']}").json()
+        assert [r["park_brand"] for r in first["items"] + second["items"]] == ["multipark", "skypark"]
+        assert second["next_cursor"] is None
+        
+        august = "date_from=2024-08-01T00:00:00&date_to=2024-09-01T00:00:00"
+        data = client.get(f"/api/financial/multipark?group_by=day&{august}").json()
+        assert [(r["day"], r["count_bookings"], r["share_amount"]) for r in data["items"]] == [("2024-08-07", 2, 8.0)]
+        assert client.get("/api/financial/multipark?cursor=lixo").status_code == 400
+    
+    def test_rollup_and_join_paths_agree(self, client: TestClient, report_data):
+        """Filtros não suportados pelo rollup caem no GROUP BY sobre a tabela"""
+        rollup = client.get("/api/financial/partner?group_by=day&group_by=park_brand").json()
+        joined = client.get("/api/financial/partner?group_by=day&group_by=park_brand&min_amount=0").json()
+        assert rollup == joined
+
+    def test_percentage_follows_split_rules(self, client: TestClient, sample_excel_data):
+        """Com uma regra 70/30 para skypark a percentagem é a efectiva, não 60/40"""
+        client.post("/api/split-rules", json={"park_brand": "skypark", "partner_bps": 7000})
+        rows = distinct_rows(sample_excel_data, 3) + [
+            dict(sample_excel_data[0], licensePlate=f"SKY{i}", parkBrand="skypark", priceOnDelivery=10.0)
+            for i in range(2)
+        ]
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows), XLSX_MIME)})
+
+        partner = client.get("/api/financial/partner").json()
+        multipark = client.get("/api/financial/multipark?min_amount=0").json()
+        assert (partner["share_amount"], partner["percentage"]) == (73.85, 61.67)
+        assert (multipark["share_amount"], multipark["percentage"]) == (45.9, 38.33)
+
+
+class TestExport:
+    """Testes para a exportação de bookings com splits"""
+    
+    def test_csv_export_with_filters(self, client: TestClient, sample_excel_data):
+        """Cabeçalho, uma linha por booking filtrado e colunas do split"""
+        rows = distinct_rows(sample_excel_data, 3)
+        rows[2]["parkBrand"] = "skypark"
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows), XLSX_MIME)})
+        
+        response = client.get("/api/export/bookings", params={"park_brand": "multipark"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        lines = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(lines) == 2
+        assert {line["park_brand"] for line in lines} == {"multipark"}
+        assert all(line["partner_bps"] == "6000" and line["total_amount"] for line in lines)
+        
+        empty = client.get("/api/export/bookings", params={"park_brand": "nenhum"})
+        assert empty.text.splitlines() == [",".join(BookingExportService().fields)]
+    
+    @pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+    def test_columnar_export(self, client: TestClient, sample_excel_data, export_format):
+        """Parquet e Arrow IPC lidos de volta com o pyarrow"""
+        pyarrow = pytest.importorskip("pyarrow")
+        import pyarrow.parquet
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(distinct_rows(sample_excel_data, 3)), XLSX_MIME)})
+        
+        content = client.get("/api/export/bookings", params={"format": export_format}).content
+        if export_format == "parquet":
+            table = pyarrow.parquet.read_table(io.BytesIO(content))
+        else:
+            table = pyarrow.ipc.open_stream(content).read_all()
+        assert table.num_rows == 3
+        assert table.column("total_amount").to_pylist() == table.column("price_delivery").to_pylist()
+        assert str(table.schema.field("checkout_timestamp").type) == "timestamp[us]"
+
+
+class TestAnalyticsSnapshot:
+    """Testes para o snapshot colunar em memória"""
+    
+    REPORTS = [
+        "/api/dashboard/stats",
+        "/api/financial/partner",
+        "/api/financial/multipark?group_by=day&group_by=park_brand",
+        "/api/financial/partner?group_by=payment_method&group_by=day&min_amount=20",
+        "/api/financial/partner?needs_approval=true&status_approved=false",
+        "/api/financial/multipark?group_by=day&date_from=2024-08-01T00:00:00&date_to=2024-08-07T12:00:00",
+        "/api/financial/partner?group_by=park_brand&limit=1",
+    ]
+    
+    def test_snapshot_matches_database_through_writes(self, client: TestClient, session: Session, sample_excel_data, monkeypatch):
+        """Upload, re-upload, aprovações (ORM, ids, filtro): snapshot = consultas à BD"""
+        monkeypatch.setattr(booking_snapshot, "session_factory", lambda: Session(session.get_bind()))
+        monkeypatch.setattr(booking_snapshot, "enabled", True)
+        monkeypatch.setattr(response_cache, "ttl", 0)
+        booking_snapshot.load()
+        
+        def assert_same():
+            for url in self.REPORTS:
+                from_snapshot = client.get(url).json()
+                booking_snapshot.enabled = False
+                from_database = client.get(url).json()
+                booking_snapshot.enabled = True
+                assert from_snapshot == from_database, url
+        
+        rows = distinct_rows(sample_excel_data, 3) + [
+            dict(sample_excel_data[0], licensePlate=f"SKY{i}", parkBrand="skypark", paymentMethod="Cash",
+                 priceOnDelivery=10.0 + i, checkoutDate=f"Timestamp(seconds={1723000000 + i * 40000}, nanoseconds=0)",
+                 checkOut="01/01/2024, 10:00")
+            for i in range(3)
+        ]
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows), XLSX_MIME)})
+        assert_same()
+        
+        client.post("/api/upload-excel", files={"file": ("b.xlsx", build_excel([dict(rows[0], priceOnDelivery=50.0)]), XLSX_MIME)})
+        booking_ids = session.exec(select(Booking.id).order_by(Booking.id)).all()
+        client.patch(f"/api/bookings/{booking_ids[3]}/approve")
+        client.post("/api/bookings/approve", json={"booking_ids": booking_ids[4:5], "approved_by": "ops"})
+        assert_same()
+        
+        client.post("/api/bookings/approve-matching", json={"filters": {"park_brand": "skypark"}, "approved_by": "ops"})
+        assert_same()
+        
+        stats = client.get("/api/analytics/snapshot").json()
+        assert (stats["bookings"], stats["pending"], stats["bytes_per_booking"]) == (6, 0, 53)
+    
+    def test_periodic_reload_does_not_block_reads(self, client: TestClient, session: Session, sample_excel_data, monkeypatch):
+        """Recarga expirada corre em background: leituras servem o snapshot anterior com os pendentes aplicados"""
+        monkeypatch.setattr(booking_snapshot, "session_factory", lambda: Session(session.get_bind()))
+        monkeypatch.setattr(booking_snapshot, "enabled", True)
+        monkeypatch.setattr(response_cache, "ttl", 0)
+        booking_snapshot.load()
+        rows = distinct_rows(sample_excel_data, 3)
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(rows[:2]), XLSX_MIME)})
+        
+        building, release = threading.Event(), threading.Event()
+        build = booking_snapshot._build
+        
+        def slow_build():
+            building.set()
+            release.wait(10)
+            return build()
+        
+        monkeypatch.setattr(booking_snapshot, "_build", slow_build)
+        monkeypatch.setattr(booking_snapshot, "_next_reload", 0.0)
+        started = time.perf_counter()
+        assert client.get("/api/dashboard/stats").json()["total_bookings"] == 2
+        assert building.wait(10)
+        assert time.perf_counter() - started < 5  # Não esperou pela carga (bloqueada até release)
+        
+        # Durante a carga: escrita nova aplicada como delta ao snapshot anterior
+        client.post("/api/upload-excel", files={"file": ("b.xlsx", build_excel(rows[2:]), XLSX_MIME)})
+        assert client.get("/api/dashboard/stats").json()["total_bookings"] == 3
+        
+        release.set()
+        deadline = time.monotonic() + 10
+        while booking_snapshot._reloading and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not booking_snapshot._reloading
+        assert booking_snapshot.stats()["bookings"] == 3
+        assert client.get("/api/dashboard/stats").json()["total_bookings"] == 3
+
+
+class TestBulkApproval:
+    """Testes para aprovação em lote"""
+    
+    @pytest.fixture
+    def pending_ids(self, session: Session):
+        bookings = [
+            Booking(license_plate=f"P{i}", park_brand=brand, needs_approval=True)
+            for i, brand in enumerate(["skypark", "skypark", "airpark"])
+        ]
+        bookings.append(Booking(license_plate="OK1", status_approved=True))
+        session.add_all(bookings)
+        session.commit()
+        return [booking.id for booking in bookings]
+    
+    def test_approve_ids_reports_missing_and_already_approved(self, client: TestClient, session: Session, pending_ids):
+        """Um UPDATE para todos os ids; inexistentes e já aprovados são reportados"""
+        payload = {"booking_ids": pending_ids[:2] + [pending_ids[3], 999], "approved_by": "ops", "notes": "lote"}
+        data = client.post("/api/bookings/approve", json=payload).json()
+        
+        assert data["approved"] == 2
+        assert data["approved_ids"] == pending_ids[:2]
+        assert data["already_approved_ids"] == [pending_ids[3]]
+        assert data["not_found_ids"] == [999]
+        
+        booking = session.get(Booking, pending_ids[0])
+        session.refresh(booking)
+        assert (booking.approved_by, booking.approval_notes) == ("ops", "lote")
+        assert client.get("/api/dashboard/stats").json()["pending_approval"] == 1
+    
+    def test_approve_matching_filter(self, client: TestClient, session: Session, pending_ids):
+        """Modo por filtro: só os pendentes da marca são aprovados e o rollup acompanha"""
+        payload = {"filters": {"park_brand": "skypark"}, "approved_by": "ops"}
+        data = client.post("/api/bookings/approve-matching", json=payload).json()
+        
+        assert data["approved"] == 2
+        stats = client.get("/api/dashboard/stats").json()
+        assert stats["pending_approval"] == 1
+        assert stats == pytest.approx(StatsService().dashboard_stats(session).model_dump())
+
+
+class TestReclassification:
+    """Testes para a reavaliação de needs_approval/date_difference_days"""
+    
+    @pytest.fixture
+    def stale_bookings(self, session: Session):
+        """
+        Valores gravados por uma regra antiga: A, E e F mudam; F foi
+        auto-aprovado na ingestão e D aprovado manualmente (approved_at)
+        """
+        checkout = datetime(2025, 6, 22, 10, 0)
+        rows = [
+            ("A", "24/06/2025, 10:00", 0, False, False, None),
+            ("B", "22/06/2025, 18:00", 0, False, False, None),
+            ("C", "23/06/2025, 09:00", 1, True, False, None),
+            ("D", "25/06/2025, 10:00", 0, False, True, datetime(2025, 6, 23)),
+            ("E", "22/06/2025, 11:00", 3, True, False, None),
+            ("F", "26/06/2025, 10:00", 0, False, True, None),
+        ]
+        bookings = {
+            plate: Booking(
+                license_plate=plate, checkout_timestamp=checkout, checkout_formatted=formatted,
+                date_difference_days=days, needs_approval=needs, status_approved=approved,
+                approved_at=approved_at, park_brand="skypark"
+            )
+            for plate, formatted, days, needs, approved, approved_at in rows
+        }
+        session.add_all(bookings.values())
+        session.commit()
+        return {plate: booking.id for plate, booking in bookings.items()}
+    
+    def test_resumes_after_interruption(self, client: TestClient, session: Session, stale_bookings):
+        """Interrompida após o 1º bloco, a retoma não repete nem salta linhas; aprovados à mão intocados"""
+        service = ReclassificationService(lambda: Session(session.get_bind()))
+        run_key = service.start(threshold_hour=1)
+        
+        def interrupt(rows):
+            raise RuntimeError("interrompido")
+        with pytest.raises(RuntimeError):
+            service.run(run_key, chunk_size=2, progress=interrupt)
+        
+        result = service.run(run_key, chunk_size=2)
+        assert result.finished
+        assert (result.rows_scanned, result.rows_changed) == (5, 3)
+        
+        session.expire_all()
+        values = {}
+        for plate, booking_id in stale_bookings.items():
+            booking = session.get(Booking, booking_id)
+            values[plate] = (booking.date_difference_days, booking.needs_approval, booking.status_approved)
+        assert values == {
+            "A": (2, True, False), "B": (0, False, False), "C": (1, True, False),
+            "D": (0, False, True), "E": (0, False, True), "F": (4, True, False)
+        }
+        assert client.get("/api/dashboard/stats").json()["pending_approval"] == 3
+        stats = client.get("/api/dashboard/stats").json()
+        assert stats == pytest.approx(StatsService().dashboard_stats(session).model_dump())
+    
+    def test_reclassify_job(self, client: TestClient, session: Session, stale_bookings, monkeypatch):
+        """Job em background: run_key em reference, resultado com throughput; leituras seguintes no primário"""
+        monkeypatch.setattr(job_manager, "session_factory", lambda: Session(session.get_bind()))
+        monkeypatch.setattr(database, "session_router", SessionRouter(session.get_bind(), create_engine("sqlite://")))
+        response = client.post("/api/reclassify-jobs", params={"threshold_hour": 1})
+        
+        assert response.status_code == 202
+        assert SessionRouter.STICKY_COOKIE in response.cookies
+        job_id = response.json()["job_id"]
+        job_manager.wait(job_id, timeout=30)
+        
+        data = client.get(f"/api/upload-jobs/{job_id}").json()
+        assert data["status"] == "completed"
+        assert data["reference"] == data["result"]["run_key"]
+        assert (data["rows_done"], data["result"]["rows_changed"]) == (5, 3)
+
+
+class TestSplitRules:
+    """Testes para regras de divisão por marca"""
+    
+    def test_rules_applied_on_upload_and_cache_invalidated(self, client: TestClient, session: Session, sample_excel_data):
+        """Regra da marca aplicada na ingestão; nova regra invalida a cache"""
+        response = client.post("/api/split-rules", json={"park_brand": "multipark", "partner_bps": 7000})
+        assert response.status_code == 201
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(sample_excel_data), XLSX_MIME)})
+        
+        client.post("/api/split-rules", json={"park_brand": "multipark", "partner_bps": 5000, "effective_from": "2024-01-01"})
+        later = [dict(sample_excel_data[0], licensePlate="NEW001")]
+        client.post("/api/upload-excel", files={"file": ("b.xlsx", build_excel(later), XLSX_MIME)})
+        
+        splits = session.exec(select(FinancialSplit).order_by(FinancialSplit.id)).all()
+        assert [(s.partner_bps, s.partner_amount_60, s.multipark_amount_40) for s in splits] == [
+            (7000, 23.28, 9.97),
+            (5000, 16.63, 16.62)
+        ]
+        assert len(client.get("/api/split-rules").json()) == 2
+
+
+class TestSplitWritePath:
+    """Testes para o caminho único de escrita dos splits"""
+    
+    def test_mode_detection(self, session: Session):
+        """SQLite não tem o trigger: auto escolhe a aplicação e trigger é rejeitado"""
+        connection = session.connection()
+        assert resolve_split_write_mode(connection) == SplitWriteMode.APP
+        assert resolve_split_write_mode(connection, "app") == SplitWriteMode.APP
+        with pytest.raises(RuntimeError):
+            resolve_split_write_mode(connection, "trigger")
+    
+    def test_repair_removes_duplicates_and_fixes_rollup(self, client: TestClient, session: Session, sample_excel_data):
+        """Fica um split por booking (o mais recente) e o rollup volta a bater certo"""
+        client.post("/api/upload-excel", files={"file": ("a.xlsx", build_excel(distinct_rows(sample_excel_data, 3)), XLSX_MIME)})
+        for booking in session.exec(select(Booking)).all()[:2]:
+            session.add(FinancialSplit(booking_id=booking.id, total_amount=10.0, partner_amount_60=6.0, multipark_amount_40=4.0))
+        session.commit()
+        
+        assert SplitRepairService().repair(session, dry_run=True)["removed"] == 2
+        result = SplitRepairService().repair(session, chunk_size=1)
+        assert (result["bookings"], result["removed"]) == (2, 2)
+        
+        splits = session.exec(select(FinancialSplit)).all()
+        assert len({s.booking_id for s in splits}) == len(splits) == 3
+        assert [s.total_amount for s in splits].count(10.0) == 2
+        assert client.get("/api/dashboard/stats").json() == pytest.approx(StatsService().dashboard_stats(session).model_dump())
+        assert SplitRepairService().repair(session)["removed"] == 0
+
 
 # Testes de integração
 class TestIntegration:
@@ -215,7 +974,6 @@ def sample_excel_data():
 
 # Marks para categorizar testes
 pytestmark = [
-    pytest.mark.asyncio,
     pytest.mark.unit
 ]
 
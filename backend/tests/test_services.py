@@ -0,0 +1,402 @@
+"""
+Testes para os serviços de processamento (Excel, datas, finanças)
+"""
+import io
+import json
+import logging
+import random
+from datetime import date, datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import cache_service
+from app.services.date_service import DATE_FORMATS, DateComparator, FormattedDateParser
+from app.services.excel_service import ExcelProcessor
+from app.services.financial_service import DEFAULT_PARTNER_BPS, FinancialCalculator
+from app.services.log_service import RateLimitFilter, StructuredFormatter
+from app.services.metrics_service import MetricsRegistry
+from app.services.split_rules import SplitRuleSet
+
+
+@pytest.fixture
+def mixed_excel_frame():
+    """DataFrame com os casos difíceis do export (blanks, tipos mistos, timestamps)"""
+    rows = [
+        {
+            "licensePlate": "AA-11-BB",
+            "checkoutDate": "Timestamp(seconds=1750625764, nanoseconds=637000000)",
+            "checkOut": "22/06/2025, 21:56",
+            "priceOnDelivery": 33.25,
+            "parkBrand": " SkyPark ",
+            "paymentMethod": "Multibanco",
+            "name": "Ana",
+            "lastname": "Costa",
+            "campaignPay": "Sim",
+            "hasOnlinePayment": True,
+            "row": 3,
+            "bookingPrice": "12.5",
+            "deliveryPrice": "",
+        },
+        {"licensePlate": None, "checkoutDate": "2025-06-22"},
+        {"licensePlate": "", "checkoutDate": "2025-06-22"},
+        {"licensePlate": "ZZ", "checkoutDate": "2025-06-22 21:56:00", "priceOnDelivery": "abc",
+         "campaignPay": 1, "hasOnlinePayment": "no"},
+        {"licensePlate": "YY", "checkoutDate": "2025-06-22", "priceOnDelivery": None, "campaignPay": 0.0},
+        {"licensePlate": "XX", "checkoutDate": "22/06/2025, 21:56", "campaignPay": "TRUE"},
+        {"licensePlate": "WW", "checkoutDate": "Timestamp(seconds=abc, nanoseconds=0)"},
+        {"licensePlate": "VV", "checkoutDate": datetime(2025, 1, 2, 3, 4)},
+        {"licensePlate": 12345, "checkoutDate": "Timestamp(seconds=1720710600)"},
+        {"licensePlate": "UU", "checkoutDate": "garbage", "stats": np.nan},
+    ]
+    return pd.DataFrame(rows, columns=ExcelProcessor.REQUIRED_COLUMNS)
+
+
+def _row_by_row(processor, df):
+    return [r for r in (processor._process_row(row) for _, row in df.iterrows()) if r]
+
+
+class TestSyntheticWorkbook:
+    """Testes para o gerador de exports sintéticos dos benchmarks"""
+
+    def test_workbook_is_valid_and_reproducible(self):
+        """Todas as colunas obrigatórias, linhas sem matrícula ignoradas, mesma seed = mesmo conteúdo"""
+        from benchmarks.synthetic import excel_rows, workbook_bytes
+
+        rows = list(excel_rows(300, seed=7))
+        assert rows == list(excel_rows(300, seed=7))
+        bookings = ExcelProcessor().read_bookings(io.BytesIO(workbook_bytes(300, seed=7)))
+        assert len(bookings) == sum(1 for row in rows if row['licensePlate'])
+        assert any(row['checkoutDate'] and row['checkoutDate'].startswith('Timestamp(') for row in rows)
+        assert any(booking['checkout_timestamp'] is None for booking in bookings)
+
+
+class TestExcelVectorized:
+    """Transformação colunar vs _process_row"""
+
+    def test_transform_matches_process_row(self, mixed_excel_frame):
+        """Mesmo resultado que o caminho linha a linha, incluindo linhas sem matrícula"""
+        processor = ExcelProcessor()
+        expected = _row_by_row(processor, mixed_excel_frame)
+        records = processor.to_records(processor.transform_frame(mixed_excel_frame))
+
+        assert len(records) == 8
+        assert records == expected
+
+    def test_transform_matches_after_excel_roundtrip(self, mixed_excel_frame):
+        """Mesmo resultado com os dtypes produzidos por pd.read_excel"""
+        buffer = io.BytesIO()
+        mixed_excel_frame.to_excel(buffer, index=False)
+        buffer.seek(0)
+        df = pd.read_excel(buffer)
+
+        processor = ExcelProcessor()
+        assert processor.to_records(processor.transform_frame(df)) == _row_by_row(processor, df)
+
+    def test_iter_chunks_matches_memory_mode(self, mixed_excel_frame, tmp_path):
+        """Leitura em streaming por blocos produz os mesmos bookings"""
+        path = tmp_path / "export.xlsx"
+        mixed_excel_frame.to_excel(path, index=False)
+
+        processor = ExcelProcessor()
+        chunks = list(processor.iter_chunks(str(path), chunk_size=3))
+        expected = processor.to_records(processor.transform_frame(pd.read_excel(path)))
+
+        assert [len(chunk) for chunk in chunks] == [3, 3, 2]
+        streamed = [booking for chunk in chunks for booking in chunk]
+        assert [b["license_plate"] for b in streamed] == [b["license_plate"] for b in expected]
+        assert [b["checkout_timestamp"] for b in streamed] == [b["checkout_timestamp"] for b in expected]
+
+
+TRICKY_DATES = [
+    "22/06/2025, 21:56", "22/06/2025 21:56", "22-06-2025, 21:56", "22-06-2025 21:56",
+    "2025-06-22 21:56:00", "2025-06-22 21:56", "22/06/2025", "22-06-2025", "2025-06-22",
+    " 22/06/2025, 21:56 ", "22/06/2025,   21:56", "2/6/2025, 1:05", "31/02/2025, 10:00",
+    "22/06/2025, 24:00", "22/06/2025, 21:60", "2025-06-22 21:56:60", "22/13/2025", "22/ 6/2025",
+    "22/06/25", "garbage", "", "   ",
+]
+
+
+def _sequential_parse(date_str):
+    """Implementação original: tenta os formatos por ordem"""
+    if not date_str or date_str.strip() == '':
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+class TestFormattedDateParser:
+    """Inferência de formato + fast path vs parse sequencial"""
+
+    @pytest.mark.parametrize("primary_format", [None] + DATE_FORMATS)
+    def test_matches_sequential_strptime(self, primary_format):
+        """Mesmo resultado qualquer que seja o formato dominante"""
+        parser = FormattedDateParser(primary_format)
+        assert [parser.parse(value) for value in TRICKY_DATES] == [_sequential_parse(v) for v in TRICKY_DATES]
+
+    @pytest.mark.parametrize("dominant", ["22/06/2025, 21:56", "2025-06-22 21:56:00", "22-06-2025"])
+    def test_parse_series_matches_sequential(self, dominant):
+        """Largura fixa, fallback do formato e outliers dão o mesmo que strptime"""
+        values = pd.Series([dominant] * 20 + TRICKY_DATES)
+        parsed = FormattedDateParser().parse_series(values)
+        expected = [_sequential_parse(value) for value in values]
+        assert [None if pd.isna(value) else value.to_pydatetime() for value in parsed] == expected
+
+    def test_detect_and_parse_series(self):
+        """Formato inferido pela maioria; outliers e não-strings resolvidos à parte"""
+        values = pd.Series(["2025-06-22 21:56"] * 5 + ["22/06/2025", "lixo", None, 3.5])
+        parser = FormattedDateParser()
+        parsed = parser.parse_series(values)
+
+        assert parser.primary_format == "%Y-%m-%d %H:%M"
+        assert parsed.iloc[0] == pd.Timestamp("2025-06-22 21:56")
+        assert parsed.iloc[5] == pd.Timestamp("2025-06-22")
+        assert parsed.iloc[6:].isna().all()
+
+
+class TestCompareBatch:
+    """compare_batch vectorizado vs compare_dates linha a linha"""
+
+    def test_matches_compare_dates(self):
+        """Mesmos dias, needs_approval e cor, incluindo à volta da 01:00 do dia seguinte"""
+        rng = random.Random(7)
+        base = datetime(2025, 6, 22, 23, 30)
+        timestamps, formatted = [], []
+        for _ in range(500):
+            ts = base + timedelta(minutes=rng.randrange(-3000, 3000))
+            shift = timedelta(minutes=rng.choice([0, 59, 60, 61, 90, 24 * 60, 25 * 60, -25 * 60, rng.randrange(-5000, 5000)]))
+            timestamps.append(rng.choice([ts, ts, ts, None]))
+            formatted.append(rng.choice([
+                (ts + shift).strftime(rng.choice(DATE_FORMATS)),
+                (ts + shift).strftime('%d/%m/%Y, %H:%M'),
+                '', None, 'lixo'
+            ]))
+        timestamps[0] = datetime(2025, 6, 22, 23, 30, tzinfo=timezone.utc)
+        formatted[0] = '24/06/2025, 00:10'
+
+        comparator = DateComparator()
+        expected = [comparator.compare_dates(ts, fmt) for ts, fmt in zip(timestamps, formatted)]
+        result = comparator.compare_batch(timestamps, pd.Series(formatted, dtype=object))
+
+        assert list(zip(result.date_difference_days.tolist(), result.needs_approval.tolist())) == expected
+        assert result.color_class.tolist() == [comparator.get_color_class(d, n) for d, n in expected]
+        assert comparator.batch_stats(result) == comparator.get_batch_stats(
+            [{'date_difference_days': d, 'needs_approval': n} for d, n in expected]
+        )
+
+    def test_threshold_hour_changes_the_rule(self):
+        """checkOut às 01:30 do dia seguinte: precisa aprovação com limiar 01:00, não com 02:00"""
+        timestamps = [datetime(2025, 6, 22, 23, 30)] * 3
+        formatted = ['23/06/2025, 01:30', '21/06/2025, 23:00', '24/06/2025, 00:30']
+        for threshold_hour, expected in [(1, [True, True, True]), (2, [False, True, True])]:
+            comparator = DateComparator(threshold_hour=threshold_hour)
+            assert [comparator.compare_dates(ts, fmt)[1] for ts, fmt in zip(timestamps, formatted)] == expected
+            assert comparator.compare_batch(timestamps, formatted).needs_approval.tolist() == expected
+
+        comparator = DateComparator(threshold_hour=2)
+        assert comparator.get_color_class(*comparator.compare_dates(timestamps[0], formatted[0])) == 'warning'
+
+
+def _decimal_split(amount):
+    """calculate_split original: cada parte arredondada em separado"""
+    if amount <= 0:
+        return 0.0, 0.0
+    total = Decimal(str(amount))
+    partner = (total * Decimal('0.60')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    multipark = (total * Decimal('0.40')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return float(partner), float(multipark)
+
+
+class TestSplitCents:
+    """Divisão em cêntimos inteiros vs caminho Decimal"""
+
+    def test_matches_decimal_path(self):
+        """Valores em cêntimos (incl. .x5, negativos, zero, enormes): resultado idêntico"""
+        rng = random.Random(11)
+        amounts = [rng.randrange(-1000, 10_000_000) / 100 for _ in range(20000)]
+        amounts += [0.0, 0.01, 0.05, 0.15, 33.25, 1e9 + 0.05, 2e11 + 0.01]
+        partner, multipark = FinancialCalculator().calculate_splits(amounts)
+
+        assert list(zip(partner.tolist(), multipark.tolist())) == [_decimal_split(amount) for amount in amounts]
+
+    def test_parts_always_add_up(self):
+        """Sub-cêntimos: parceiro igual ao Decimal e partner + multipark == total arredondado"""
+        rng = random.Random(5)
+        amounts = [round(rng.uniform(0.001, 5000), rng.choice([3, 4, 6])) for _ in range(5000)] + [10.005, 0.0125]
+        split = FinancialCalculator().split_cents(amounts)
+
+        for amount, total, partner, multipark in zip(amounts, split.total, split.partner, split.multipark):
+            assert partner / 100 == _decimal_split(amount)[0]
+            assert total == int(Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+            assert partner + multipark == total
+
+    def test_report_single_pass(self):
+        """Totais e breakdowns iguais à acumulação booking a booking"""
+        rng = random.Random(2)
+        bookings = [
+            {'price_delivery': rng.randrange(0, 20000) / 100, 'park_brand': rng.choice(['airpark', 'skypark', None]),
+             'payment_method': rng.choice(['Multibanco', 'MB Way'])}
+            for _ in range(500)
+        ] + [{'price_delivery': 12.5}]
+        report = FinancialCalculator().generate_financial_report(bookings)
+
+        expected = {}
+        for booking in bookings:
+            brand = expected.setdefault(booking.get('park_brand', 'unknown'), [0.0, 0.0, 0.0, 0])
+            partner, multipark = _decimal_split(booking['price_delivery'])
+            for index, value in enumerate((booking['price_delivery'], partner, multipark, 1)):
+                brand[index] += value
+        assert list(report['by_brand']) == list(expected)
+        for brand, (total, partner, multipark, count) in expected.items():
+            row = report['by_brand'][brand]
+            assert (row['total_amount'], row['partner_60'], row['multipark_40'], row['count']) == (
+                round(total, 2), round(partner, 2), round(multipark, 2), count
+            )
+        assert report['summary']['count_bookings'] == 501
+        assert report['summary']['partner_60_percent'] == round(sum(r['partner_60'] for r in report['by_brand'].values()), 2)
+
+
+class TestFinancialReportBuilder:
+    """Relatório numa só passagem, a partir de um iterador"""
+
+    def test_streamed_report_matches_list(self):
+        """Gerador em blocos pequenos = lista inteira; cross-tab soma às marcas; top-N como sorted"""
+        rng = random.Random(9)
+        bookings = [
+            {'price_delivery': rng.randrange(0, 20000) / 100, 'park_brand': f"brand{rng.randrange(8)}",
+             'payment_method': rng.choice(['Multibanco', 'MB Way', 'Credit Card'])}
+            for _ in range(1000)
+        ]
+        calculator = FinancialCalculator()
+        report = calculator.generate_financial_report(bookings)
+        streamed = calculator.generate_financial_report((booking for booking in bookings), chunk_size=37)
+
+        for key in ('summary', 'by_brand', 'by_payment_method', 'by_brand_and_payment_method', 'top_brands'):
+            assert streamed[key] == report[key]
+        for brand, methods in streamed['by_brand_and_payment_method'].items():
+            assert sum(row['count'] for row in methods.values()) == streamed['by_brand'][brand]['count']
+        expected_top = sorted(report['by_brand'].items(), key=lambda item: item[1]['total_amount'], reverse=True)[:5]
+        assert list(streamed['top_brands']) == [brand for brand, _ in expected_top]
+
+
+class TestSplitRuleSet:
+    """Resolução de regras por marca e data"""
+
+    def test_resolution_order(self):
+        """Marca em vigor > regra geral > 60/40; no mesmo dia ganha a regra mais recente"""
+        rules = SplitRuleSet([
+            ("skypark", date(2025, 1, 1), 7000, 1),
+            ("skypark", date(2025, 6, 1), 6500, 2),
+            ("skypark", date(2025, 6, 1), 6600, 3),
+            (None, date(2025, 3, 1), 5000, 4),
+        ])
+        assert rules.partner_bps("skypark", date(2024, 12, 31)) == DEFAULT_PARTNER_BPS
+        assert rules.partner_bps("skypark", date(2025, 5, 31)) == 7000
+        assert rules.partner_bps("skypark", date(2025, 6, 1)) == 6600
+        assert rules.partner_bps("airpark", date(2025, 3, 1)) == 5000
+        assert rules.partner_bps(None, date(2025, 2, 28)) == DEFAULT_PARTNER_BPS
+
+    def test_vectorized_matches_scan(self):
+        """searchsorted por marca = procura linear pela regra mais recente"""
+        rng = random.Random(4)
+        brands = ["airpark", "redpark", "skypark", None]
+        rules = [
+            (rng.choice(brands), rng.choice([None, date(2025, 1, 1) + timedelta(days=rng.randrange(365))]),
+             rng.randrange(0, 10001), rule_id)
+            for rule_id in range(300)
+        ]
+        bookings_brands = [rng.choice(brands + ["novapark"]) for _ in range(2000)]
+        days = [date(2024, 12, 1) + timedelta(days=rng.randrange(430)) for _ in range(2000)]
+
+        def scan(brand, day):
+            for candidates in ([r for r in rules if brand is not None and r[0] == brand], [r for r in rules if r[0] is None]):
+                in_force = [r for r in candidates if r[1] is None or r[1] <= day]
+                if in_force:
+                    return max(in_force, key=lambda r: (r[1] or date.min, r[3]))[2]
+            return DEFAULT_PARTNER_BPS
+
+        resolved = SplitRuleSet(rules).resolve(bookings_brands, days)
+        assert resolved.tolist() == [scan(brand, day) for brand, day in zip(bookings_brands, days)]
+        partner = FinancialCalculator().split_cents([100.05] * 2000, resolved).partner
+        assert partner.tolist() == [
+            int((Decimal('100.05') * bps / 10000).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+            for bps in resolved.tolist()
+        ]
+
+
+class TestMemoryCacheBackend:
+    """Testes para a cache de respostas em memória"""
+
+    def test_lru_eviction_and_ttl(self, monkeypatch):
+        """Sai a entrada usada há mais tempo; entradas expiradas não são servidas"""
+        clock = [100.0]
+        monkeypatch.setattr(cache_service.time, "monotonic", lambda: clock[0])
+        backend = cache_service.MemoryCacheBackend(max_entries=2)
+        responses = {key: cache_service.CachedResponse(200, {}, key.encode()) for key in "abc"}
+
+        backend.set("a", responses["a"], ttl=10)
+        backend.set("b", responses["b"], ttl=10)
+        assert backend.get("a") is responses["a"]
+        backend.set("c", responses["c"], ttl=10)
+        assert backend.get("b") is None
+        assert len(backend) == 2
+
+        clock[0] += 10
+        assert backend.get("a") is None
+        assert responses["a"].etag != responses["c"].etag
+
+
+class TestMetricsRegistry:
+    """Testes para o registo de métricas em formato Prometheus"""
+
+    def test_histogram_buckets_and_text_format(self):
+        """Buckets cumulativos, _sum/_count e labels escapados"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Duração", ["stage"], buckets=(0.1, 1.0))
+        counter = registry.counter("test_rows_total", "Linhas", ["stage"])
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, 'a"b')
+        counter.inc(3, "read")
+        registry.gauge_collector("test_pool", "Pool", ["engine"], lambda: {("sync",): 2})
+
+        lines = registry.render().splitlines()
+        assert '# TYPE test_seconds histogram' in lines
+        assert 'test_seconds_bucket{stage="a\\"b",le="0.1"} 1' in lines
+        assert 'test_seconds_bucket{stage="a\\"b",le="1.0"} 2' in lines
+        assert 'test_seconds_bucket{stage="a\\"b",le="+Inf"} 3' in lines
+        assert 'test_seconds_count{stage="a\\"b"} 3' in lines
+        assert 'test_rows_total{stage="read"} 3' in lines
+        assert 'test_pool{engine="sync"} 2' in lines
+
+        registry.enabled = False
+        histogram.observe(1.0, "x")
+        with registry.timer(histogram, "y"):
+            pass
+        assert histogram.count("x") == histogram.count("y") == 0
+
+
+class TestStructuredLogging:
+    """Testes para o logging estruturado com limite de taxa"""
+
+    def test_rate_limit_counts_suppressed(self, monkeypatch):
+        """Depois de `burst` registos do mesmo template os seguintes são suprimidos e contados"""
+        clock = [0.0]
+        monkeypatch.setattr("app.services.log_service.time.monotonic", lambda: clock[0])
+        limiter = RateLimitFilter(burst=2, window=60)
+        records = [logging.makeLogRecord({"name": "app.x", "msg": "Erro: %s", "args": (i,)}) for i in range(5)]
+        assert [limiter.filter(record) for record in records] == [True, True, False, False, False]
+
+        clock[0] = 61
+        record = logging.makeLogRecord({"name": "app.x", "msg": "Erro: %s", "args": (9,), "rows": 10})
+        assert limiter.filter(record)
+        assert record.suppressed == 3
+
+        line = StructuredFormatter().format(record)
+        assert line.endswith("app.x: Erro: 9 rows=10 suppressed=3")
+        assert json.loads(StructuredFormatter(json_output=True).format(record))["suppressed"] == 3
@@ -19,10 +19,21 @@ document.head.appendChild(script);
 // Global State
 let appState = {
     bookings: [],
+    bookingFilters: {},
+    bookingsCursor: null,  // { created_at, id } do último booking carregado
     dashboardStats: null,
     isLoading: false
 };
 
+const BOOKINGS_PAGE_SIZE = 100;
+
+// Só as colunas usadas na tabela (+ created_at/id para a paginação)
+const BOOKING_TABLE_FIELDS = [
+    'id', 'created_at', 'license_plate', 'name', 'lastname',
+    'checkout_timestamp', 'checkout_formatted', 'date_difference_days',
+    'needs_approval', 'price_delivery', 'park_brand', 'status_approved'
+].join(',');
+
 // Initialize App
 document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
@@ -346,32 +357,70 @@ function updateRecentActivities(stats) {
 }
 
 // Bookings Management with Supabase
-async function loadBookings(filters = {}) {
+// Filtros aplicados na query e paginação keyset em (created_at, id)
+async function loadBookings(filters = appState.bookingFilters, append = false) {
     if (!window.supabase) return;
     
     try {
         let query = window.supabase
             .from('bookings')
             .select(`
-                *,
+                ${BOOKING_TABLE_FIELDS},
                 financial_splits (
                     partner_amount_60,
                     multipark_amount_40,
                     total_amount
                 )
             `)
-            .order('created_at', { ascending: false });
+            .order('created_at', { ascending: false })
+            .order('id', { ascending: false })
+            .limit(BOOKINGS_PAGE_SIZE);
         
+        if (filters.park_brand) {
+            query = query.eq('park_brand', filters.park_brand);
+        }
+        if (filters.payment_method) {
+            query = query.eq('payment_method', filters.payment_method);
+        }
         if (filters.needs_approval !== undefined) {
             query = query.eq('needs_approval', filters.needs_approval);
         }
+        if (filters.status_approved !== undefined) {
+            query = query.eq('status_approved', filters.status_approved);
+        }
+        if (filters.date_from) {
+            query = query.gte('checkout_timestamp', filters.date_from);
+        }
+        if (filters.date_to) {
+            query = query.lt('checkout_timestamp', filters.date_to);
+        }
+        if (filters.min_amount !== undefined) {
+            query = query.gte('price_delivery', filters.min_amount);
+        }
+        if (filters.max_amount !== undefined) {
+            query = query.lte('price_delivery', filters.max_amount);
+        }
+        
+        const cursor = append ? appState.bookingsCursor : null;
+        if (cursor) {
+            query = query.or(
+                `created_at.lt."${cursor.created_at}",` +
+                `and(created_at.eq."${cursor.created_at}",id.lt.${cursor.id})`
+            );
+        }
         
         const { data: bookings, error } = await query;
         if (error) throw error;
         
-        appState.bookings = bookings;
-        updateBookingsTable(bookings);
-        updateBrandFilter(bookings);
+        const last = bookings[bookings.length - 1];
+        appState.bookingFilters = filters;
+        appState.bookingsCursor = bookings.length === BOOKINGS_PAGE_SIZE ?
+            { created_at: last.created_at, id: last.id } : null;
+        appState.bookings = append ? appState.bookings.concat(bookings) : bookings;
+        
+        updateBookingsTable(appState.bookings);
+        updateBrandFilter(appState.bookings);
+        updateLoadMoreButton();
         
     } catch (error) {
         console.error('Erro carregar bookings:', error);
@@ -379,6 +428,19 @@ async function loadBookings(filters = {}) {
     }
 }
 
+function loadMoreBookings() {
+    if (appState.bookingsCursor) {
+        loadBookings(appState.bookingFilters, true);
+    }
+}
+
+function updateLoadMoreButton() {
+    const button = document.getElementById('load-more-btn');
+    if (button) {
+        button.style.display = appState.bookingsCursor ? '' : 'none';
+    }
+}
+
 function updateBookingsTable(bookings) {
     const tbody = document.querySelector('#bookings-table tbody');
     if (!tbody) return;
@@ -520,10 +582,14 @@ function updateBrandFilter(bookings) {
     const brandFilter = document.getElementById('brand-filter');
     if (!brandFilter) return;
     
-    const brands = [...new Set(bookings.map(b => b.park_brand).filter(Boolean))];
+    // Mantém a marca seleccionada mesmo que a página actual só tenha essa
+    const selected = brandFilter.value;
+    const known = [...brandFilter.options].map(option => option.value).filter(Boolean);
+    const brands = [...new Set([...known, ...bookings.map(b => b.park_brand).filter(Boolean)])];
     
     brandFilter.innerHTML = '<option value="">Todas as marcas</option>' +
         brands.map(brand => `<option value="${brand}">${brand}</option>`).join('');
+    brandFilter.value = selected;
 }
 
 function filterBookings() {
@@ -533,19 +599,19 @@ function filterBookings() {
     const brandValue = brandFilter?.value || '';
     const approvalValue = approvalFilter?.value || '';
     
-    let filteredBookings = [...appState.bookings];
+    const filters = {};
     
     if (brandValue) {
-        filteredBookings = filteredBookings.filter(b => b.park_brand === brandValue);
+        filters.park_brand = brandValue;
     }
     
     if (approvalValue === 'pending') {
-        filteredBookings = filteredBookings.filter(b => !b.status_approved);
+        filters.status_approved = false;
     } else if (approvalValue === 'approved') {
-        filteredBookings = filteredBookings.filter(b => b.status_approved);
+        filters.status_approved = true;
     }
     
-    updateBookingsTable(filteredBookings);
+    loadBookings(filters);
 }
 
 // Financial Sections (placeholders)
@@ -0,0 +1,51 @@
+-- MultiPark Dashboard - Re-upload idempotente
+-- Chave natural única nos bookings + registo de ficheiros já ingeridos
+
+-- Chave natural: 'pi:<paymentIntentId>' ou 'lp:<matrícula>|<checkout>'
+ALTER TABLE bookings ADD COLUMN natural_key VARCHAR(200);
+
+-- Backfill: só a primeira ocorrência de cada chave fica com a chave
+-- (duplicados já existentes continuam na tabela, sem chave)
+WITH keyed AS (
+    SELECT
+        id,
+        CASE
+            WHEN NULLIF(LOWER(TRIM(payment_intent_id)), '') NOT IN ('nan', 'none', 'nat')
+                THEN 'pi:' || TRIM(payment_intent_id)
+            WHEN checkout_timestamp IS NOT NULL AND NULLIF(TRIM(license_plate), '') IS NOT NULL
+                THEN 'lp:' || TRIM(license_plate) || '|' ||
+                     TO_CHAR(checkout_timestamp AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+        END AS natural_key
+    FROM bookings
+),
+ranked AS (
+    SELECT id, natural_key,
+           ROW_NUMBER() OVER (PARTITION BY natural_key ORDER BY id) AS rn
+    FROM keyed
+    WHERE natural_key IS NOT NULL
+)
+UPDATE bookings b
+SET natural_key = ranked.natural_key
+FROM ranked
+WHERE b.id = ranked.id AND ranked.rn = 1;
+
+CREATE UNIQUE INDEX ix_bookings_natural_key ON bookings(natural_key);
+
+-- Ficheiros Excel já ingeridos (SHA-256 do conteúdo)
+CREATE TABLE excel_uploads (
+    id SERIAL PRIMARY KEY,
+    content_hash VARCHAR(64) NOT NULL,
+    filename VARCHAR(255),
+    bookings_count INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX ix_excel_uploads_content_hash ON excel_uploads(content_hash);
+
+ALTER TABLE excel_uploads ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all operations for authenticated users" ON excel_uploads
+    FOR ALL USING (auth.role() = 'authenticated');
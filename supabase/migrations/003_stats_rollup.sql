@@ -0,0 +1,57 @@
+-- MultiPark Dashboard - Rollup das estatísticas
+-- Contagens e somas por dia (UTC) x park_brand x payment_method, mantidas
+-- incrementalmente pela API (ingestão e aprovações)
+
+CREATE TABLE stats_rollup (
+    id SERIAL PRIMARY KEY,
+    group_key VARCHAR(255) NOT NULL,
+    day DATE,
+    park_brand VARCHAR(50) NOT NULL DEFAULT '',
+    payment_method VARCHAR(50) NOT NULL DEFAULT '',
+    booking_count BIGINT NOT NULL DEFAULT 0,
+    pending_count BIGINT NOT NULL DEFAULT 0,
+    total_cents BIGINT NOT NULL DEFAULT 0,
+    partner_cents BIGINT NOT NULL DEFAULT 0,
+    multipark_cents BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE UNIQUE INDEX ix_stats_rollup_group_key ON stats_rollup(group_key);
+CREATE INDEX ix_stats_rollup_day ON stats_rollup(day);
+
+-- Backfill (equivalente a python -m app.services.rollup_service rebuild)
+WITH split_totals AS (
+    SELECT booking_id,
+           SUM(total_amount) AS total_amount,
+           SUM(partner_amount_60) AS partner_amount_60,
+           SUM(multipark_amount_40) AS multipark_amount_40
+    FROM financial_splits
+    GROUP BY booking_id
+),
+grouped AS (
+    SELECT
+        DATE(b.checkout_timestamp AT TIME ZONE 'UTC') AS day,
+        COALESCE(b.park_brand, '') AS park_brand,
+        COALESCE(b.payment_method, '') AS payment_method,
+        COUNT(*) AS booking_count,
+        COUNT(*) FILTER (WHERE b.needs_approval AND NOT b.status_approved) AS pending_count,
+        COALESCE(SUM(ROUND(st.total_amount * 100)), 0) AS total_cents,
+        COALESCE(SUM(ROUND(st.partner_amount_60 * 100)), 0) AS partner_cents,
+        COALESCE(SUM(ROUND(st.multipark_amount_40 * 100)), 0) AS multipark_cents
+    FROM bookings b
+    LEFT JOIN split_totals st ON st.booking_id = b.id
+    GROUP BY 1, 2, 3
+)
+INSERT INTO stats_rollup (
+    group_key, day, park_brand, payment_method,
+    booking_count, pending_count, total_cents, partner_cents, multipark_cents
+)
+SELECT
+    COALESCE(TO_CHAR(day, 'YYYY-MM-DD'), '') || '|' || park_brand || '|' || payment_method,
+    day, park_brand, payment_method,
+    booking_count, pending_count, total_cents, partner_cents, multipark_cents
+FROM grouped;
+
+ALTER TABLE stats_rollup ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all operations for authenticated users" ON stats_rollup
+    FOR ALL USING (auth.role() = 'authenticated');
@@ -0,0 +1,18 @@
+-- MultiPark Dashboard - Índices para os relatórios financeiros
+-- Filtro por intervalo de checkout (+ marca/método) com index-only scan
+
+CREATE INDEX IF NOT EXISTS ix_bookings_checkout_brand_method
+    ON bookings (checkout_timestamp, park_brand, payment_method)
+    INCLUDE (price_delivery, needs_approval, status_approved);
+
+-- Join com os splits sem ir ao heap
+CREATE INDEX IF NOT EXISTS ix_financial_splits_booking_amounts
+    ON financial_splits (booking_id)
+    INCLUDE (total_amount, partner_amount_60, multipark_amount_40);
+
+-- Rollup filtrado por marca/método dentro de um intervalo de dias
+CREATE INDEX IF NOT EXISTS ix_stats_rollup_brand_method_day
+    ON stats_rollup (park_brand, payment_method, day);
+
+ANALYZE bookings;
+ANALYZE financial_splits;
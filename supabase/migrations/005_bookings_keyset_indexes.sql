@@ -0,0 +1,17 @@
+-- MultiPark Dashboard - Listagem de bookings com paginação keyset
+-- ORDER BY created_at DESC, id DESC com filtros de igualdade à frente
+
+CREATE INDEX IF NOT EXISTS ix_bookings_created_id
+    ON bookings (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS ix_bookings_brand_created_id
+    ON bookings (park_brand, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS ix_bookings_method_created_id
+    ON bookings (payment_method, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS ix_bookings_approval_created_id
+    ON bookings (needs_approval, status_approved, created_at DESC, id DESC);
+
+-- Substituído por ix_bookings_created_id
+DROP INDEX IF EXISTS idx_bookings_created_at;
@@ -0,0 +1,10 @@
+-- MultiPark Dashboard - Aprovação em lote
+-- Quem aprovou e notas da aprovação (ApprovalRequest.approved_by / notes)
+
+ALTER TABLE bookings ADD COLUMN approved_by VARCHAR(100);
+ALTER TABLE bookings ADD COLUMN approval_notes TEXT;
+
+-- Aprovação por filtro: só linhas ainda pendentes
+CREATE INDEX IF NOT EXISTS ix_bookings_pending
+    ON bookings (checkout_timestamp)
+    WHERE needs_approval AND NOT status_approved;
@@ -0,0 +1,24 @@
+-- MultiPark Dashboard - Reclassificação de bookings
+-- Checkpoints por fatia de ids de cada execução de
+-- python -m app.services.reclassify_service (ou POST /api/reclassify-jobs)
+
+CREATE TABLE reclassification_checkpoints (
+    id SERIAL PRIMARY KEY,
+    run_key VARCHAR(32) NOT NULL,
+    threshold_hour INTEGER NOT NULL,
+    start_id INTEGER NOT NULL,
+    end_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    rows_scanned BIGINT NOT NULL DEFAULT 0,
+    rows_changed BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX ix_reclassification_checkpoints_run_key ON reclassification_checkpoints(run_key);
+
+-- Blocos por id só sobre os bookings por aprovar
+CREATE INDEX IF NOT EXISTS ix_bookings_unapproved_id
+    ON bookings (id)
+    WHERE NOT status_approved;
@@ -0,0 +1,57 @@
+-- MultiPark Dashboard - Regras de divisão por marca e data
+-- Parte do parceiro em pontos base (6000 = 60%). Para um booking vale a
+-- regra da sua marca com o effective_from mais recente até ao dia (UTC) do
+-- checkout; senão a regra geral (park_brand NULL); senão 60/40.
+-- Mesma resolução que app/services/split_rules.py (SplitRuleSet).
+
+CREATE TABLE split_rules (
+    id SERIAL PRIMARY KEY,
+    park_brand VARCHAR(50),
+    partner_bps INTEGER NOT NULL CHECK (partner_bps BETWEEN 0 AND 10000),
+    effective_from DATE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX ix_split_rules_brand_effective ON split_rules(park_brand, effective_from);
+
+-- Regra aplicada a cada divisão (as existentes são todas 60/40)
+ALTER TABLE financial_splits ADD COLUMN partner_bps INTEGER;
+UPDATE financial_splits SET partner_bps = 6000;
+
+CREATE OR REPLACE FUNCTION split_partner_bps(brand VARCHAR, checkout TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER AS $$
+    SELECT COALESCE((
+        SELECT partner_bps
+        FROM split_rules
+        WHERE (park_brand = brand OR park_brand IS NULL)
+          AND (effective_from IS NULL
+               OR effective_from <= COALESCE((checkout AT TIME ZONE 'UTC')::date, (NOW() AT TIME ZONE 'UTC')::date))
+        ORDER BY park_brand IS NULL, effective_from DESC NULLS LAST, id DESC
+        LIMIT 1
+    ), 6000);
+$$ LANGUAGE sql STABLE;
+
+-- Trigger com a regra em vigor; multipark = total - parceiro (soma sempre igual ao total)
+CREATE OR REPLACE FUNCTION create_financial_split()
+RETURNS TRIGGER AS $$
+DECLARE
+    bps INTEGER := split_partner_bps(NEW.park_brand, NEW.checkout_timestamp);
+    total NUMERIC := ROUND(NEW.price_delivery, 2);
+    partner NUMERIC := CASE WHEN NEW.price_delivery > 0 THEN ROUND(NEW.price_delivery * bps / 10000.0, 2) ELSE 0 END;
+BEGIN
+    INSERT INTO financial_splits (
+        booking_id,
+        partner_amount_60,
+        multipark_amount_40,
+        total_amount,
+        partner_bps
+    ) VALUES (
+        NEW.id,
+        partner,
+        CASE WHEN NEW.price_delivery > 0 THEN total - partner ELSE 0 END,
+        NEW.price_delivery,
+        bps
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
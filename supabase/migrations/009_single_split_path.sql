@@ -0,0 +1,10 @@
+-- MultiPark Dashboard - Um único split por booking
+-- Com o trigger create_financial_split activo e o BulkIngestor a inserir
+-- splits cada booking ficava com dois. Antes de aplicar esta migração:
+--     python -m app.services.split_service repair
+-- e escolher o caminho de escrita com SPLIT_WRITE_MODE (auto/trigger/app).
+-- Para a aplicação escrever os splits (SPLIT_WRITE_MODE=app):
+--     ALTER TABLE bookings DISABLE TRIGGER create_financial_split_trigger;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_financial_splits_booking_id
+    ON financial_splits (booking_id);